@@ -0,0 +1,52 @@
+import hmac
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from app.core.config import get_config
+from app.core.profiler import PROFILE_SUFFIX, list_profiles
+
+# Get the singleton config instance
+config = get_config()
+
+if not config.ADMIN_API_TOKEN:
+    raise ValueError("ADMIN_API_TOKEN must be set when ADMIN_API_ENABLED is true")
+
+_bearer = HTTPBearer(auto_error=False)
+
+def require_admin_token(credentials: HTTPAuthorizationCredentials = Depends(_bearer)):
+    """Rejects requests that don't carry the configured admin bearer token."""
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(), config.ADMIN_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="ERROR 401: Missing or invalid admin token.",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+@router.get("/profiles")
+def list_request_profiles():
+    """
+    Lists profiles captured for requests slower than the configured threshold, newest first.
+
+    **Response:**
+    - `200 OK`: A list of profiles with their name, size, time, method, route, project ID and request duration.
+    - `401 Unauthorized`: If the admin bearer token is missing or wrong.
+    """
+    return {"profiles": list_profiles(config.PROFILER_OUTPUT_DIR)}
+
+@router.get("/profiles/{profile_name}")
+def get_request_profile(profile_name: str):
+    """
+    Downloads a captured profile in folded-stack format, ready for flamegraph.pl or speedscope.
+
+    **Parameters:**
+    - `profile_name`: The name of the profile as returned by the list endpoint.
+
+    **Responses:**
+    - `200 OK`: The profile file.
+    - `401 Unauthorized`: If the admin bearer token is missing or wrong.
+    - `404 Not Found`: If no profile with that name exists.
+    """
+    profile_path = os.path.join(config.PROFILER_OUTPUT_DIR, profile_name)
+    if os.path.basename(profile_name) != profile_name or not profile_name.endswith(PROFILE_SUFFIX) or not os.path.isfile(profile_path):
+        raise HTTPException(status_code=404, detail=f"ERROR 404: Profile {profile_name} not found.")
+    return FileResponse(profile_path, media_type="text/plain", filename=profile_name)
@@ -1,17 +1,154 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from app.models.aws_base_models import AwsSandboxCreate, AwsSandboxExtend
+from app.core.config import get_config
+from app.core.bulkhead import bulkhead_route_class, bulkhead_timeout
+from app.services.aws_account_pool import AccountPoolConflictError, AccountPoolExhaustedError, get_aws_account_pool
+from app.services.quota_reservations import QuotaExceededError
 
-router = APIRouter()
+# Get the singleton config instance
+config = get_config()
+
+router = APIRouter(route_class=bulkhead_route_class("aws"))
 
 @router.post("/create")
-def create_aws_sandbox():
+@bulkhead_timeout(config.AWS_CREATE_TIMEOUT_SECONDS)
+def create_aws_sandbox(user_data: AwsSandboxCreate):
     """
-    Creates a sandbox environment in AWS.
+    Assigns a sandbox account in AWS.
+
+    Accounts come from a pool of pre-created accounts in the AWS Organization, so a
+    sandbox is ready in seconds instead of the minutes it takes to create an account.
+    The account is moved to the sandbox OU and the users are granted access to it.
+
+    **Request Body:**
+    - `user_email`: The email address of the user initiating the request (e.g., `user@example.com`).
+    - `requested_duration_hours`: The number of hours for which the sandbox account is requested.
+    - `request_description`: A brief description of the request, such as the purpose of the sandbox (e.g., `"POC On XYZ"`).
+    - `additional_users`: A list of additional users who need access to the sandbox account. Default is an empty list.
+
+    **Responses:**
+    - `200 OK`: If a sandbox account was assigned.
+    - `400 Bad Request`: If the request contains invalid data or the user has no sandbox quota left.
+    - `409 Conflict`: If the account pool kept changing under concurrent requests.
+    - `500 Internal Server Error`: If there is an issue with AWS while assigning the account, or
+      IAM Identity Center did not grant access in time; the account is then released.
+    - `503 Service Unavailable`: If no cleaned account is available; retry after the `Retry-After` header.
     """
-    return {"message": "AWS sandbox provisioner is work in progress."}
+    user_email = user_data.user_email
+    all_users = [user_email] + user_data.additional_users
+
+    # Lazy import logger to avoid startup overhead
+    from app.utils.logger import logger
+
+    logger.info(f"Assigning AWS sandbox account to {all_users}...")
+    try:
+        account = get_aws_account_pool().acquire(
+            user_email, user_data.additional_users, int(user_data.requested_duration_hours), user_data.request_description
+        )
+    except QuotaExceededError:
+        logger.error(f"User {user_email} has reached maximum number of allowed active sandbox accounts {config.MAX_ALLOWED_PROJECTS_PER_USER}.")
+        raise HTTPException(status_code=400, detail=f"ERROR 400: User {user_email} has reached maximum number of allowed active sandbox accounts ({config.MAX_ALLOWED_PROJECTS_PER_USER}).")
+    except AccountPoolExhaustedError as e:
+        logger.error("No AWS sandbox account available in the pool.")
+        raise HTTPException(
+            status_code=503,
+            detail=f"ERROR 503: No AWS sandbox account available. Please retry in {e.retry_after_seconds} seconds.",
+            headers={"Retry-After": str(e.retry_after_seconds)}
+        )
+    except AccountPoolConflictError as e:
+        logger.error(f"Could not assign an AWS account to {user_email}: {e}")
+        raise HTTPException(status_code=409, detail="ERROR 409: Too many concurrent AWS sandbox requests. Please retry.")
+    logger.info(f"Successfuly assigned AWS account {account['account_id']} to {all_users}.")
+
+    return {
+        "detail": "Sandbox account assigned succesfully",
+        "user_email": user_email,
+        "additional_users": user_data.additional_users,
+        "account_id": account["account_id"],
+        "request_description": user_data.request_description,
+        "created_at": account["assigned_at"].strftime("%Y-%d-%m %H:%M:%S UTC"),
+        "expires_at": account["expires_at"].strftime("%Y-%d-%m %H:%M:%S UTC")
+    }
 
-@router.delete("/delete")
-def delete_aws_sandbox():
+@router.delete("/delete/{account_id}")
+def delete_aws_sandbox(account_id: str):
     """
-    Deletes a sandbox environment in AWS.
+    Releases the sandbox account of a user.
+
+    The users lose access at once; the account is then cleaned of its resources in the
+    background and returned to the pool.
+
+    **Parameters:**
+    - `account_id`: The ID of the sandbox account to release.
+
+    **Responses:**
+    - `200 OK`: If the account was released and queued for cleanup.
+    - `404 Not Found`: If the account is not assigned to anyone.
+    - `409 Conflict`: If the account pool kept changing under concurrent requests.
+    """
+
+    # Lazy import logger to avoid startup overhead
+    from app.utils.logger import logger
+
+    logger.info(f"Releasing AWS account {account_id}...")
+    try:
+        get_aws_account_pool().release(account_id)
+    except KeyError:
+        logger.error(f"AWS account {account_id} is not assigned.")
+        raise HTTPException(status_code=404, detail=f"ERROR 404: AWS account {account_id} is not assigned.")
+    except AccountPoolConflictError as e:
+        logger.error(f"Could not release AWS account {account_id}: {e}")
+        raise HTTPException(status_code=409, detail="ERROR 409: Too many concurrent AWS sandbox requests. Please retry.")
+    logger.info(f"Successfully released AWS account {account_id}.")
+
+    return {
+        "detail": "Sandbox account released succesfully, cleanup in progress",
+        "account_id": account_id
+    }
+
+@router.post("/extend")
+def extend_aws_sandbox(user_data: AwsSandboxExtend):
+    """
+    Extends the assignment of a sandbox account.
+
+    **Request Body:**
+    - `account_id`: The ID of the sandbox account to extend.
+    - `extend_by_hours`: The number of hours by which to extend the sandbox account's expiry time.
+
+    **Response:**
+    - `200 OK`: The account ID and the new expiry time.
+    - `404 Not Found`: If the account is not assigned to anyone.
+    - `409 Conflict`: If the account pool kept changing under concurrent requests.
+    """
+    account_id = user_data.account_id
+    extend_by_hours = user_data.extend_by_hours
+
+    # Lazy import logger to avoid startup overhead
+    from app.utils.logger import logger
+
+    logger.info(f"Extending expiry of AWS account {account_id} by {extend_by_hours} hours...")
+    try:
+        new_expiry = get_aws_account_pool().extend(account_id, extend_by_hours)
+    except KeyError:
+        logger.error(f"AWS account {account_id} is not assigned.")
+        raise HTTPException(status_code=404, detail=f"ERROR 404: AWS account {account_id} is not assigned.")
+    except AccountPoolConflictError as e:
+        logger.error(f"Could not extend AWS account {account_id}: {e}")
+        raise HTTPException(status_code=409, detail="ERROR 409: Too many concurrent AWS sandbox requests. Please retry.")
+    logger.info(f"Successfully extended expiry of AWS account {account_id}.")
+
+    return {
+        "detail": "Sandbox account extended succesfully",
+        "account_id": account_id,
+        "expires_at": new_expiry.strftime("%Y-%d-%m %H:%M:%S UTC")
+    }
+
+@router.get("/pool")
+def get_aws_account_pool_status():
+    """
+    Returns the number of pooled AWS accounts in each state and the pool sizing.
+
+    **Response:**
+    - `200 OK`: Account counts by state (creating, available, assigned, cleaning, failed).
     """
-    return {"message":"AWS sandbox provisioner is work in progress."}
+    return get_aws_account_pool().status()
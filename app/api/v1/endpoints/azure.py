@@ -1,6 +1,7 @@
 from fastapi import APIRouter
+from app.core.bulkhead import bulkhead_route_class
 
-router = APIRouter()
+router = APIRouter(route_class=bulkhead_route_class("azure"))
 
 @router.post("/create")
 def create_azure_sandbox():
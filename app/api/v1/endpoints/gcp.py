@@ -1,21 +1,29 @@
 from fastapi import APIRouter, HTTPException
-from app.models.gcp_base_models import SandboxCreate, SandboxExtend
+from fastapi.responses import StreamingResponse
+from app.models.gcp_base_models import SandboxCreate, SandboxExtend, SandboxBatchExtend, SandboxUsersUpdate
 from app.core.config import get_config
+from app.core.bulkhead import bulkhead_route_class, bulkhead_timeout
+from app.core.circuit_breaker import ensure_available
+from app.core.profiler import tag_current_profile
 from app.services.gcp_sandbox import GCPSandboxService
+from app.services.expiry_scheduler import extend_scheduled, get_expiry_scheduler
+from app.services.iam_coalescer import LastMemberError, get_iam_policy_coalescer
+from app.services.lifecycle_journal import get_lifecycle_journal, record_lifecycle_event
+from app.services.quota_reservations import QuotaConflictError, QuotaExceededError, get_quota_reservations
+from app.services.sandbox_feed import get_sandbox_feed
+from app.services.usage_rollups import get_usage_rollups
 from app.utils.utils import generate_sandbox_id
 from datetime import timedelta, datetime, UTC
+from typing import Literal, Optional
+import json
 
 # Get the singleton config instance
 config = get_config()
 
-# Lazy import for Google protobuf to improve startup performance
-def get_timestamp():
-    from google.protobuf.timestamp_pb2 import Timestamp
-    return Timestamp
-
-router = APIRouter()
+router = APIRouter(route_class=bulkhead_route_class("gcp"))
 
 @router.post("/create")
+@bulkhead_timeout(config.GCP_CREATE_TIMEOUT_SECONDS)
 def create_gcp_sandbox(user_data: SandboxCreate):
     """
     Create a new sandbox environment for a given project.
@@ -34,8 +42,10 @@ def create_gcp_sandbox(user_data: SandboxCreate):
 
     **Responses:**
     - `200 Created`: If the sandbox environment was successfully created.
-    - `400 Bad Request`: If the request contains invalid data or required fields are missing.
+    - `400 Bad Request`: If the request contains invalid data, required fields are missing or the user has no sandbox quota left.
+    - `409 Conflict`: If too many concurrent requests of the same user kept reserving quota at once.
     - `500 Internal Server Error`: If there is an issue with the cloud provider during the sandbox creation process.
+    - `503 Service Unavailable`: If a Google Cloud API needed for the sandbox is currently failing.
     """
     user_email = user_data.user_email
     team_name = user_data.team_name
@@ -45,39 +55,67 @@ def create_gcp_sandbox(user_data: SandboxCreate):
     all_users = [user_email] + user_data.additional_users
     user_email_prefix = user_email.split("@")[0].replace(".", "-")
 
-    # Check active sandboxes
-    active_projects_count = GCPSandboxService.get_total_active_projects(user_email_prefix, list(config.AUTHORIZED_TEAM_FOLDERS.values()))
-    if active_projects_count >= config.MAX_ALLOWED_PROJECTS_PER_USER:
-        logger.error(f"User {user_email} has reached maximum number of allowed active sandbox projects {config.MAX_ALLOWED_PROJECTS_PER_USER}.")
-        raise HTTPException(status_code=400, detail=f"ERROR 400: User {user_email} has reached maximum number of allowed active sandbox projects ({config.MAX_ALLOWED_PROJECTS_PER_USER}).")
+    # Lazy import logger to avoid startup overhead
+    from app.utils.logger import logger
 
     request_time = datetime.now(UTC)
-
-    delta = timedelta(hours=requested_duration_hours)
-    Timestamp = get_timestamp()
-    expiry_timestamp = Timestamp()
-    expiry_timestamp.FromDatetime(request_time + delta)
+    expires_at = request_time + timedelta(hours=requested_duration_hours)
 
     project_id = generate_sandbox_id(user_email, request_time)
+    tag_current_profile(project_id=project_id)
 
-    # Lazy import logger to avoid startup overhead
-    from app.utils.logger import logger
-    
-    logger.info(f"Handling sandbox project creation event for {user_email}...")
-    create_project_response = GCPSandboxService.create_sandbox_project(project_id, folder_id)
-    logger.info(f"Successfuly created project {project_id}.")
+    # Fail fast rather than leave a half-built project behind when a needed API is down
+    quota_reservations = get_quota_reservations()
+    ensure_available("resource_manager", "billing", *get_expiry_scheduler().required_apis, *quota_reservations.store.required_apis)
 
-    logger.info(f"Creating deletion task for Project {project_id} on Google Cloud Tasks queue...")
-    create_deletion_task_response = GCPSandboxService.create_deletion_task(project_id, project_id, expiry_timestamp)
-    logger.info(f"Successfully created deletion task for Project {project_id} on Google Cloud Tasks queue.")
+    # Reserve a slot against the user's quota, so concurrent requests on any instance cannot both pass
+    active_project_ids = GCPSandboxService.list_active_projects(user_email_prefix, list(config.AUTHORIZED_TEAM_FOLDERS.values()))
+    try:
+        reservation = quota_reservations.reserve(user_email_prefix, project_id, config.MAX_ALLOWED_PROJECTS_PER_USER, active_project_ids)
+    except QuotaExceededError:
+        logger.error(f"User {user_email} has reached maximum number of allowed active sandbox projects {config.MAX_ALLOWED_PROJECTS_PER_USER}.")
+        raise HTTPException(status_code=400, detail=f"ERROR 400: User {user_email} has reached maximum number of allowed active sandbox projects ({config.MAX_ALLOWED_PROJECTS_PER_USER}).")
+    except QuotaConflictError as e:
+        logger.error(f"Could not reserve sandbox quota for {user_email}: {e}")
+        raise HTTPException(status_code=409, detail=f"ERROR 409: Too many concurrent sandbox requests for user {user_email}. Please retry.")
 
-    logger.info(f"Linking project {project_id} to billing account...")
-    updated_project_billing_response = GCPSandboxService.update_project_billing_info(project_id)
-    logger.info(f"Successfuly linked project {project_id} to billing account.")
+    try:
+        logger.info(f"Handling sandbox project creation event for {user_email}...")
+        create_project_response = GCPSandboxService.create_sandbox_project(project_id, folder_id)
+        logger.info(f"Successfuly created project {project_id}.")
+
+        logger.info(f"Scheduling deletion of Project {project_id}...")
+        scheduled_expiry = get_expiry_scheduler().schedule(project_id, expires_at)
+        logger.info(f"Successfully scheduled deletion of Project {project_id}.")
+
+        logger.info(f"Linking project {project_id} to billing account...")
+        updated_project_billing_response = GCPSandboxService.update_project_billing_info(project_id)
+        logger.info(f"Successfuly linked project {project_id} to billing account.")
+
+        logger.info(f"Assigning IAM role for {all_users} to project {project_id}...")
+        iam_role_assignment_response = GCPSandboxService.set_sandbox_users_iam_role(all_users,project_id)
+        logger.info(f"Successfuly asigned owner role to {all_users} for project {project_id}.")
+    except Exception as e:
+        try:
+            quota_reservations.release(reservation)
+        except Exception as release_error:
+            # The reservation lease expires on its own
+            logger.error(f"Failed to release quota reservation for project {project_id}: {release_error}")
+        record_lifecycle_event("create_failed", project_id, team=team_name, user=user_email, error=str(e))
+        raise
 
-    logger.info(f"Assigning IAM role for {all_users} to project {project_id}...")
-    iam_role_assignment_response = GCPSandboxService.set_sandbox_users_iam_role(all_users,project_id)
-    logger.info(f"Successfuly asigned owner role to {all_users} for project {project_id}.")
+    try:
+        quota_reservations.commit(reservation)
+    except Exception as e:
+        # The project exists either way; the pending reservation keeps counting until its lease expires
+        logger.error(f"Failed to commit quota reservation for project {project_id}: {e}")
+
+    record_lifecycle_event(
+        "create", project_id, team=team_name, user=user_email,
+        additional_users=user_data.additional_users,
+        duration_hours=requested_duration_hours,
+        expires_at=scheduled_expiry.isoformat()
+    )
 
     return {
         "detail": "Sandbox project provisioned succesfully",
@@ -90,7 +128,7 @@ def create_gcp_sandbox(user_data: SandboxCreate):
         "billing_enabled": updated_project_billing_response.billing_enabled,
         "project_url": f"https://console.cloud.google.com/welcome?project={project_id}",
         "created_at": create_project_response.create_time.strftime("%Y-%d-%m %H:%M:%S UTC"),
-        "expires_at": create_deletion_task_response.schedule_time.strftime("%Y-%d-%m %H:%M:%S UTC")
+        "expires_at": scheduled_expiry.strftime("%Y-%d-%m %H:%M:%S UTC")
     }
 
 @router.delete("/delete/{project_id}")
@@ -114,11 +152,24 @@ def delete_gcp_sandbox(project_id: str):
     # Lazy import logger to avoid startup overhead
     from app.utils.logger import logger
     
-    logger.info(f"Unlinking project {project_id} from associated billing account...")
-    GCPSandboxService.unlink_project_billing_info(project_id)
-    logger.info(f"Handling sandbox project deletion event for {project_id}")
-    delete_sandbox_project_response = GCPSandboxService.delete_sandbox_project(project_id)
-    logger.info(f"Succssfully deleted Project {project_id}.")
+    try:
+        logger.info(f"Unlinking project {project_id} from associated billing account...")
+        GCPSandboxService.unlink_project_billing_info(project_id)
+        logger.info(f"Handling sandbox project deletion event for {project_id}")
+        delete_sandbox_project_response = GCPSandboxService.delete_sandbox_project(project_id)
+        get_expiry_scheduler().forget(project_id)
+        logger.info(f"Succssfully deleted Project {project_id}.")
+    except Exception as e:
+        record_lifecycle_event("delete_failed", project_id, error=str(e))
+        raise
+
+    try:
+        # Sandbox IDs start with the email prefix that quotas are counted on
+        get_quota_reservations().release_project(project_id.rsplit("-", 1)[0], project_id)
+    except Exception as e:
+        logger.error(f"Failed to release quota reservation for project {project_id}: {e}")
+
+    record_lifecycle_event("delete", project_id)
 
     return {
         "detail": "Sandbox project deleted succesfully",
@@ -142,40 +193,259 @@ def extend_gcp_sandbox(user_data: SandboxExtend):
     **Response:**
     - `200 OK`: A dictionary containing the project details, including the project ID and the new expiry time after extension.
     - `400 Bad Request`: If the request data is invalid or missing required fields.
+    - `404 Not Found`: If no scheduled expiry exists for the project.
     - `500 Internal Server Error`: If there is a server error while processing the extension.
     """
 
     project_id = user_data.project_id
+    tag_current_profile(project_id=project_id)
     extend_by_hours = user_data.extend_by_hours
-    cloud_tasks_queue_id = config.CLOUD_TASKS_DELETION_QUEUE_ID
-    try:
-        task_id = GCPSandboxService.list_cloud_tasks(project_id)
-    except:
-        task_id = f"{cloud_tasks_queue_id}/tasks/{project_id}"
 
     # Lazy import logger to avoid startup overhead
     from app.utils.logger import logger
-    
-    Timestamp = get_timestamp()
-    new_expiry_timestamp_proto = Timestamp()
-    current_expiry_timestamp = GCPSandboxService.get_cloud_task_expiry_time(task_id)
-    new_expiry_timestamp_proto.FromSeconds(current_expiry_timestamp + (3600 * extend_by_hours))
-
-    # Delete old task
-    logger.info("Deleting task")
-    GCPSandboxService.delete_cloud_task(task_id)
-    logger.info("Deleting task success")
-
-    # Create new task with updated expiry time
-    logger.info("Creating updated task with new expiry")
-    random_suffix = int(datetime.now(UTC).timestamp())
-    updated_task_name = f"{project_id}-extended-{random_suffix}"
-    create_deletion_task_response = GCPSandboxService.create_deletion_task(project_id, updated_task_name, new_expiry_timestamp_proto)
-    logger.info("Creating updated task with new expiry success")
-    logger.info(create_deletion_task_response)
+
+    logger.info(f"Extending expiry of Project {project_id} by {extend_by_hours} hours...")
+    try:
+        new_expiry = get_expiry_scheduler().extend(project_id, extend_by_hours)
+    except KeyError:
+        logger.error(f"No scheduled expiry found for Project {project_id}.")
+        record_lifecycle_event("extend_failed", project_id, error="No scheduled expiry found")
+        raise HTTPException(status_code=404, detail=f"ERROR 404: No scheduled expiry found for project {project_id}.")
+    except Exception as e:
+        record_lifecycle_event("extend_failed", project_id, error=str(e))
+        raise
+    logger.info(f"Successfully extended expiry of Project {project_id}.")
+
+    record_lifecycle_event("extend", project_id, extend_by_hours=extend_by_hours, expires_at=new_expiry.isoformat())
 
     return {
         "detail": f"Sandbox project expiry extended by {extend_by_hours} hours succesfully",
         "project_id": project_id,
-        "new_expiry": create_deletion_task_response.schedule_time.strftime("%Y-%d-%m %H:%M:%S UTC")
+        "new_expiry": new_expiry.strftime("%Y-%d-%m %H:%M:%S UTC")
     }
+
+
+@router.post("/extend/batch")
+def extend_gcp_sandboxes(user_data: SandboxBatchExtend):
+    """
+    Extends the duration of many active sandbox projects at once, e.g. a whole team or workshop cohort.
+
+    Sandboxes are selected by explicit project IDs and/or a selector. Every given criterion must
+    match. All pending deletions are resolved from a single read of the deletion queue and then
+    rescheduled concurrently.
+
+    **Request Body:**
+    - `project_ids`: The IDs of the projects to extend.
+    - `team_name`: Extend only the sandboxes of this team.
+    - `user_email`: Extend only the sandboxes requested by this user.
+    - `expiring_before`: Extend only the sandboxes scheduled for deletion before this time.
+    - `extend_by_hours`: The number of hours by which to extend each sandbox project’s expiry time.
+
+    **Response:**
+    - `200 OK`: A dictionary with one result per project: `extended` with its new expiry, `not_found` for a requested
+      project without a scheduled expiry, `skipped` for a requested project excluded by the other criteria, or
+      `failed` with the error.
+    - `400 Bad Request`: If neither project IDs nor a selector is given, or the request data is invalid.
+    - `503 Service Unavailable`: If a Google Cloud API needed for the extension is currently failing.
+    """
+    extend_by_hours = user_data.extend_by_hours
+    if not (user_data.project_ids or user_data.team_name or user_data.user_email or user_data.expiring_before):
+        raise HTTPException(status_code=400, detail="ERROR 400: At least one of project_ids, team_name, user_email or expiring_before must be provided.")
+
+    # Lazy import logger to avoid startup overhead
+    from app.utils.logger import logger
+
+    scheduler = get_expiry_scheduler()
+    ensure_available(*scheduler.required_apis)
+
+    # One read of the deletion queue for the whole batch
+    scheduled = scheduler.list_scheduled()
+    candidates = list(scheduled.values())
+    if user_data.project_ids:
+        requested_project_ids = set(user_data.project_ids)
+        candidates = [entry for entry in candidates if entry.project_id in requested_project_ids]
+    if user_data.user_email:
+        user_email_prefix = user_data.user_email.split("@")[0].replace(".", "-")
+        candidates = [entry for entry in candidates if entry.project_id.rsplit("-", 1)[0] == user_email_prefix]
+    if user_data.expiring_before:
+        expiring_before = user_data.expiring_before
+        if expiring_before.tzinfo is None:
+            expiring_before = expiring_before.replace(tzinfo=UTC)
+        candidates = [entry for entry in candidates if entry.expires_at < expiring_before]
+    if user_data.team_name:
+        team_project_ids = GCPSandboxService.list_folder_projects(config.AUTHORIZED_TEAM_FOLDERS[user_data.team_name])
+        candidates = [entry for entry in candidates if entry.project_id in team_project_ids]
+
+    logger.info(f"Extending expiry of {len(candidates)} sandbox projects by {extend_by_hours} hours...")
+    results = []
+    candidate_project_ids = {entry.project_id for entry in candidates}
+    for project_id, new_expiry, error in extend_scheduled(scheduler, candidates, extend_by_hours):
+        if error is None:
+            record_lifecycle_event("extend", project_id, extend_by_hours=extend_by_hours, expires_at=new_expiry.isoformat())
+            results.append({"project_id": project_id, "status": "extended", "new_expiry": new_expiry.strftime("%Y-%d-%m %H:%M:%S UTC")})
+        else:
+            record_lifecycle_event("extend_failed", project_id, error=str(error))
+            results.append({"project_id": project_id, "status": "failed", "error": str(error)})
+
+    for project_id in dict.fromkeys(user_data.project_ids):
+        if project_id not in scheduled:
+            record_lifecycle_event("extend_failed", project_id, error="No scheduled expiry found")
+            results.append({"project_id": project_id, "status": "not_found", "error": "No scheduled expiry found"})
+        elif project_id not in candidate_project_ids:
+            results.append({"project_id": project_id, "status": "skipped", "error": "Does not match the other selectors"})
+
+    extended_count = sum(1 for result in results if result["status"] == "extended")
+    logger.info(f"Extended expiry of {extended_count} of {len(results)} sandbox projects.")
+
+    return {
+        "detail": f"Extended {extended_count} of {len(results)} sandbox projects by {extend_by_hours} hours",
+        "extend_by_hours": extend_by_hours,
+        "results": results
+    }
+
+
+@router.post("/users")
+def update_gcp_sandbox_users(user_data: SandboxUsersUpdate):
+    """
+    Adds or removes owners of an existing sandbox project.
+
+    The project's IAM policy is updated with an etag-guarded read-modify-write, so other
+    bindings on the project are preserved. Concurrent updates to the same project are
+    combined into a single IAM policy write.
+
+    **Request Body:**
+    - `project_id`: The ID of the sandbox project whose users are to be updated.
+    - `add_users`: A list of users to be granted the owner role on the project.
+    - `remove_users`: A list of users whose owner role on the project is to be revoked.
+
+    **Response:**
+    - `200 OK`: A dictionary containing the project ID and its current owners.
+    - `400 Bad Request`: If the request data is invalid, no users are given or the project would be left without owners.
+    - `500 Internal Server Error`: If there is an issue with the cloud provider while updating the IAM policy.
+    """
+    project_id = user_data.project_id
+    tag_current_profile(project_id=project_id)
+    if not user_data.add_users and not user_data.remove_users:
+        raise HTTPException(status_code=400, detail="ERROR 400: At least one of add_users or remove_users must be provided.")
+
+    # Lazy import logger to avoid startup overhead
+    from app.utils.logger import logger
+
+    logger.info(f"Updating owners of project {project_id}: adding {user_data.add_users}, removing {user_data.remove_users}...")
+    try:
+        updated_policy = get_iam_policy_coalescer().update_members(
+            project_id,
+            "roles/owner",
+            add_members=[f"user:{user_email}" for user_email in user_data.add_users],
+            remove_members=[f"user:{user_email}" for user_email in user_data.remove_users]
+        )
+    except LastMemberError:
+        logger.error(f"Refusing to remove the last owners of project {project_id}.")
+        raise HTTPException(status_code=400, detail=f"ERROR 400: Project {project_id} must keep at least one owner.")
+    logger.info(f"Successfuly updated owners of project {project_id}.")
+
+    owners = [
+        member.removeprefix("user:")
+        for binding in updated_policy.bindings if binding.role == "roles/owner" and not binding.condition.expression
+        for member in binding.members
+    ]
+
+    return {
+        "detail": "Sandbox project users updated succesfully",
+        "project_id": project_id,
+        "added_users": user_data.add_users,
+        "removed_users": user_data.remove_users,
+        "owners": owners
+    }
+
+
+@router.get("/journal/export")
+def export_gcp_sandbox_journal(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                               team_name: Optional[str] = None, user_email: Optional[str] = None):
+    """
+    Streams sandbox lifecycle events recorded by this service as newline-delimited JSON.
+
+    **Query Parameters:**
+    - `since`: Only include events at or after this time (ISO 8601, UTC if no offset is given).
+    - `until`: Only include events before this time (ISO 8601, UTC if no offset is given).
+    - `team_name`: Only include events for sandboxes of this team.
+    - `user_email`: Only include events for sandboxes requested by this user.
+
+    **Response:**
+    - `200 OK`: One JSON object per line with the event type, project ID, team, user, timestamp and event details.
+    """
+    records = get_lifecycle_journal().read(since=since, until=until, team=team_name, user=user_email)
+    return StreamingResponse(
+        (json.dumps(record) + "\n" for record in records),
+        media_type="application/x-ndjson"
+    )
+
+
+@router.get("/feed")
+async def stream_gcp_sandbox_feed(team_name: Optional[str] = None, user_email: Optional[str] = None):
+    """
+    Streams the live sandboxes of a team or user as server-sent events, replacing polling.
+
+    The stream starts with a `snapshot` event listing the live sandboxes, followed by a
+    `create`, `extend`, `delete` or `expire` event whenever one of them changes in this
+    service. A client that falls too far behind receives a `resync` event and the stream
+    ends; reconnect to get a fresh snapshot. Comment lines are sent as keepalives.
+
+    **Query Parameters:**
+    - `team_name`: Only include sandboxes of this team.
+    - `user_email`: Only include sandboxes requested by this user.
+
+    **Response:**
+    - `200 OK`: A `text/event-stream` of JSON event payloads.
+    - `400 Bad Request`: If the team name is not an authorized team.
+    """
+    if team_name is not None and team_name not in config.AUTHORIZED_TEAM_FOLDERS:
+        raise HTTPException(status_code=400, detail=f"ERROR 400: Team name {team_name} is invalid. Required value must be one in {config.AUTHORIZED_TEAM_FOLDERS.keys()}")
+
+    return StreamingResponse(
+        get_sandbox_feed().subscribe(team=team_name, user=user_email),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/reports/usage")
+def get_gcp_sandbox_usage_report(team_name: Optional[str] = None, user_email: Optional[str] = None,
+                                 granularity: Literal["hour", "day", "total"] = "total", bucket: Optional[str] = None):
+    """
+    Reports sandbox usage per team and per user from incrementally maintained rollups.
+
+    **Query Parameters:**
+    - `team_name`: Report on this team only.
+    - `user_email`: Report on this user only.
+    - `granularity`: One of `hour`, `day` or `total`. Default is `total`.
+    - `bucket`: The hour (`YYYY-MM-DDTHH`) or day (`YYYY-MM-DD`) to report on. Defaults to the current one.
+
+    With no team or user, all authorized teams and the overall usage are reported.
+
+    Sandbox-hours include the time so far of sandboxes that are still running. The active
+    count is taken at the end of a past bucket, or now for the current one.
+
+    **Response:**
+    - `200 OK`: Active sandbox count, sandbox-hours, created, deleted, extensions and average lifetime.
+    - `400 Bad Request`: If the team name is not an authorized team or the bucket is malformed.
+    """
+    usage_rollups = get_usage_rollups()
+    if team_name is not None and team_name not in config.AUTHORIZED_TEAM_FOLDERS:
+        raise HTTPException(status_code=400, detail=f"ERROR 400: Team name {team_name} is invalid. Required value must be one in {config.AUTHORIZED_TEAM_FOLDERS.keys()}")
+
+    report = {"granularity": granularity}
+    try:
+        if team_name is None and user_email is None:
+            report["overall"] = usage_rollups.get_usage("all", "", granularity, bucket)
+            team_names = config.AUTHORIZED_TEAM_FOLDERS.keys()
+        else:
+            team_names = [team_name] if team_name is not None else []
+
+        report["teams"] = {name: usage_rollups.get_usage("team", name, granularity, bucket) for name in team_names}
+        if user_email is not None:
+            report["users"] = {user_email: usage_rollups.get_usage("user", user_email, granularity, bucket)}
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"ERROR 400: Bucket {bucket} is not a valid {granularity} bucket.")
+    return report
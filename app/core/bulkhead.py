@@ -0,0 +1,236 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+
+from app.core.config import get_config
+from app.core.profiler import attach_current_thread
+
+# Get the singleton config instance
+config = get_config()
+
+
+class Bulkhead:
+    """
+    Isolates a provider's request handlers on their own bounded executor.
+
+    At most `max_concurrency` handlers run at once and at most `max_queue` more wait
+    for a worker; anything beyond that is rejected with a 503. A caller waiting longer
+    than `timeout_seconds` gets a 504, while the worker thread keeps its slot until the
+    underlying cloud call returns so the concurrency bound stays honest.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue, timeout_seconds):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"bulkhead-{name}")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self._completed_total = 0
+        self._rejected_total = 0
+        self._timed_out_total = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_concurrency + self.max_queue:
+                self._rejected_total += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"ERROR 503: {self.name} provider is saturated, please retry later."
+                )
+            self._pending += 1
+
+    def _started(self):
+        with self._lock:
+            self._active += 1
+
+    def _finished(self):
+        with self._lock:
+            self._active -= 1
+            self._pending -= 1
+            self._completed_total += 1
+
+    def _timed_out(self, timeout_seconds):
+        with self._lock:
+            self._timed_out_total += 1
+        raise HTTPException(
+            status_code=504,
+            detail=f"ERROR 504: {self.name} provider did not respond within {timeout_seconds} seconds."
+        )
+
+    async def run(self, func, *args, timeout_seconds=None, **kwargs):
+        """
+        Runs a blocking function on this bulkhead's executor.
+
+        Args:
+            func (callable): The blocking function to run.
+            *args: Positional arguments for `func`.
+            timeout_seconds (float): Overrides the bulkhead's timeout for this call.
+            **kwargs: Keyword arguments for `func`.
+
+        Returns:
+            The return value of `func`.
+        """
+        self._admit()
+        context = contextvars.copy_context()
+
+        def profiled_call():
+            with attach_current_thread():
+                return func(*args, **kwargs)
+
+        def call():
+            self._started()
+            try:
+                return context.run(profiled_call)
+            finally:
+                self._finished()
+
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        timeout_seconds = timeout_seconds or self.timeout_seconds
+        try:
+            # Shield so a timeout abandons the wait without dropping the executor future
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            self._timed_out(timeout_seconds)
+
+    async def run_async(self, func, *args, timeout_seconds=None, **kwargs):
+        """
+        Runs a coroutine function under this bulkhead's concurrency limit.
+
+        Args:
+            func (callable): The coroutine function to run.
+            *args: Positional arguments for `func`.
+            timeout_seconds (float): Overrides the bulkhead's timeout for this call.
+            **kwargs: Keyword arguments for `func`.
+
+        Returns:
+            The return value of `func`.
+        """
+        self._admit()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def call():
+            async with self._semaphore:
+                self._started()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    with self._lock:
+                        self._active -= 1
+                        self._completed_total += 1
+
+        timeout_seconds = timeout_seconds or self.timeout_seconds
+        try:
+            return await asyncio.wait_for(call(), timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            self._timed_out(timeout_seconds)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def metrics(self) -> dict:
+        """Returns a snapshot of the bulkhead's saturation counters."""
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "timeout_seconds": self.timeout_seconds,
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "saturation": round(self._pending / (self.max_concurrency + self.max_queue), 3),
+                "completed_total": self._completed_total,
+                "rejected_total": self._rejected_total,
+                "timed_out_total": self._timed_out_total
+            }
+
+
+_bulkheads: Dict[str, Bulkhead] = {}
+_bulkheads_lock = threading.Lock()
+
+def get_bulkhead(provider: str) -> Bulkhead:
+    """
+    Get the singleton bulkhead for a provider, sized from `{PROVIDER}_BULKHEAD_*` config.
+
+    Args:
+        provider (str): The provider name, e.g. "gcp", "aws" or "azure".
+    """
+    with _bulkheads_lock:
+        if provider not in _bulkheads:
+            prefix = provider.upper()
+            _bulkheads[provider] = Bulkhead(
+                provider,
+                max_concurrency=getattr(config, f"{prefix}_BULKHEAD_MAX_CONCURRENCY"),
+                max_queue=getattr(config, f"{prefix}_BULKHEAD_MAX_QUEUE"),
+                timeout_seconds=getattr(config, f"{prefix}_BULKHEAD_TIMEOUT_SECONDS")
+            )
+        return _bulkheads[provider]
+
+
+def get_bulkhead_metrics() -> dict:
+    """Returns saturation metrics for every bulkhead created so far."""
+    with _bulkheads_lock:
+        bulkheads = dict(_bulkheads)
+    return {name: bulkhead.metrics() for name, bulkhead in bulkheads.items()}
+
+
+def bulkhead_timeout(seconds):
+    """
+    Decorator that gives one endpoint its own bulkhead timeout, e.g. for slow creates.
+
+    Place it below the router decorator:
+
+        @router.post("/create")
+        @bulkhead_timeout(config.GCP_CREATE_TIMEOUT_SECONDS)
+        def create_gcp_sandbox(...): ...
+
+    Args:
+        seconds (float): How long a caller waits for the endpoint before getting a 504.
+    """
+    def decorator(endpoint):
+        endpoint.bulkhead_timeout_seconds = seconds
+        return endpoint
+    return decorator
+
+
+def bulkhead_route_class(provider: str) -> type[APIRoute]:
+    """
+    Builds an APIRoute class that runs every endpoint of a router inside the provider's bulkhead.
+
+    Usage: `router = APIRouter(route_class=bulkhead_route_class("gcp"))`
+
+    Args:
+        provider (str): The provider name, e.g. "gcp", "aws" or "azure".
+    """
+
+    class BulkheadRoute(APIRoute):
+        def __init__(self, path, endpoint, **kwargs):
+            bulkhead = get_bulkhead(provider)
+            timeout_seconds = getattr(endpoint, "bulkhead_timeout_seconds", None)
+            if inspect.iscoroutinefunction(endpoint):
+                @functools.wraps(endpoint)
+                async def wrapped_endpoint(*args, **kwargs):
+                    return await bulkhead.run_async(endpoint, *args, timeout_seconds=timeout_seconds, **kwargs)
+            else:
+                @functools.wraps(endpoint)
+                async def wrapped_endpoint(*args, **kwargs):
+                    return await bulkhead.run(endpoint, *args, timeout_seconds=timeout_seconds, **kwargs)
+            super().__init__(path, wrapped_endpoint, **kwargs)
+
+    return BulkheadRoute
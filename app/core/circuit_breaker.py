@@ -0,0 +1,214 @@
+import functools
+import threading
+import time
+from typing import Dict
+
+from app.core.config import get_config
+from app.core.traffic_capture import record_gcp_call
+
+# Get the singleton config instance
+config = get_config()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an API whose circuit breaker is open."""
+
+    def __init__(self, names, retry_after_seconds):
+        self.names = list(names)
+        self.retry_after_seconds = retry_after_seconds
+        super().__init__(f"{', '.join(self.names)} API unavailable, retry in {retry_after_seconds} seconds")
+
+
+def is_breaker_failure(error):
+    """
+    Decides whether an exception means the API itself is degraded.
+
+    Server errors, throttling, timeouts and transport failures count against the breaker;
+    client errors such as NotFound or PermissionDenied are the caller's fault and do not.
+    """
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return True
+    if isinstance(error, (exceptions.ServerError, exceptions.TooManyRequests)):
+        return True
+    return not isinstance(error, exceptions.GoogleAPICallError)
+
+
+class CircuitBreaker:
+    """
+    Fails fast on calls to an API after repeated failures, then probes it to recover.
+
+    After `failure_threshold` consecutive failures the breaker opens and rejects calls
+    for `recovery_seconds`. It then goes half-open and lets up to `half_open_max_calls`
+    calls through as probes: a successful probe closes the breaker, a failed one opens
+    it again for another `recovery_seconds`.
+    """
+
+    def __init__(self, name, failure_threshold, recovery_seconds, half_open_max_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected_total = 0
+        self._failures_total = 0
+        self._opened_total = 0
+
+    def _refresh_state(self, now):
+        # Caller must hold self._lock
+        if self._state == OPEN and now - self._opened_at >= self.recovery_seconds:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+
+    def retry_after_seconds(self):
+        with self._lock:
+            if self._state != OPEN:
+                return 0
+            return max(0, int(self.recovery_seconds - (time.monotonic() - self._opened_at)) + 1)
+
+    def is_available(self):
+        """Returns False while the breaker is open and not yet due for a probe."""
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return self._state != OPEN
+
+    def before_call(self):
+        """
+        Admits a call through the breaker.
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or half-open with all probe slots taken.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refresh_state(now)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return
+            self._rejected_total += 1
+            retry_after = max(1, int(self.recovery_seconds - (now - self._opened_at)) + 1) if self._state == OPEN else 1
+        raise CircuitOpenError([self.name], retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self._failures_total += 1
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self._opened_total += 1
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls `func` through the breaker, recording the outcome.
+
+        Raises:
+            CircuitOpenError: If the breaker does not admit the call.
+        """
+        self.before_call()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if is_breaker_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        finally:
+            record_gcp_call(self.name, (time.perf_counter() - start) * 1000)
+        self.record_success()
+        return result
+
+    def metrics(self) -> dict:
+        """Returns a snapshot of the breaker's state and counters."""
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failures_total": self._failures_total,
+                "rejected_total": self._rejected_total,
+                "opened_total": self._opened_total
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    Get the singleton circuit breaker for an API, e.g. "resource_manager" or "billing".
+
+    Args:
+        name (str): The API name.
+    """
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                recovery_seconds=config.CIRCUIT_BREAKER_RECOVERY_SECONDS,
+                half_open_max_calls=config.CIRCUIT_BREAKER_HALF_OPEN_MAX_CALLS
+            )
+        return _breakers[name]
+
+
+def get_circuit_breaker_metrics() -> dict:
+    """Returns state and counters of every circuit breaker created so far."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.metrics() for name, breaker in breakers.items()}
+
+
+def ensure_available(*names):
+    """
+    Fails fast if any of the named APIs has an open circuit breaker.
+
+    Used before multi-step operations so that no work is started that a broken API
+    would leave half done.
+
+    Raises:
+        CircuitOpenError: Listing every unavailable API.
+    """
+    breakers = [get_circuit_breaker(name) for name in names]
+    unavailable = [breaker for breaker in breakers if not breaker.is_available()]
+    if unavailable:
+        raise CircuitOpenError(
+            [breaker.name for breaker in unavailable],
+            max(breaker.retry_after_seconds() for breaker in unavailable)
+        )
+
+
+def guarded_by(name):
+    """
+    Decorator that routes every call of a function through the named API's circuit breaker.
+
+    Args:
+        name (str): The API name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return get_circuit_breaker(name).call(func, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -16,7 +16,114 @@ class Config(BaseSettings):
     ENABLE_GCP_PROVISIONER: bool
     ENABLE_AWS_PROVISIONER: bool
     ENABLE_AZURE_PROVISIONER: bool
-    
+
+    # Expiry scheduler backend: "cloud_tasks" (one Cloud Task per sandbox) or
+    # "local" (in-process scheduler persisted to a SQLite database).
+    # "local" is only safe with a single instance and LOCAL_SCHEDULER_DB_PATH on a
+    # persistent volume. On Cloud Run the container filesystem is ephemeral and
+    # instances scale out, so pending deletions would be lost or run twice.
+    EXPIRY_SCHEDULER_BACKEND: str = "cloud_tasks"
+    LOCAL_SCHEDULER_DB_PATH: str = "sandbox_expiry.db"
+    # Projects coming due shortly after the first one wait for it and are deleted in the
+    # same batch, so deletions run up to this many seconds late, never early
+    LOCAL_SCHEDULER_BATCH_WINDOW_SECONDS: int = 5
+    LOCAL_SCHEDULER_RETRY_DELAY_SECONDS: int = 300
+    # Failed deletions are retried this many times in total, then left for an operator
+    LOCAL_SCHEDULER_MAX_ATTEMPTS: int = 5
+    LOCAL_SCHEDULER_MAX_PARALLEL_DELETIONS: int = 8
+    # Parallel reschedules per batch extend request
+    BATCH_EXTEND_MAX_PARALLEL: int = 8
+
+    # Per-provider bulkheads: concurrent handlers, extra waiting requests and
+    # how long a caller waits before getting a 504. Endpoints that are slow by
+    # design override the timeout, e.g. GCP_CREATE_TIMEOUT_SECONDS.
+    GCP_BULKHEAD_MAX_CONCURRENCY: int = 16
+    GCP_BULKHEAD_MAX_QUEUE: int = 32
+    GCP_BULKHEAD_TIMEOUT_SECONDS: float = 30
+    GCP_CREATE_TIMEOUT_SECONDS: float = 120
+    AWS_BULKHEAD_MAX_CONCURRENCY: int = 8
+    AWS_BULKHEAD_MAX_QUEUE: int = 16
+    AWS_BULKHEAD_TIMEOUT_SECONDS: float = 30
+    AWS_CREATE_TIMEOUT_SECONDS: float = 300
+    AZURE_BULKHEAD_MAX_CONCURRENCY: int = 8
+    AZURE_BULKHEAD_MAX_QUEUE: int = 16
+    AZURE_BULKHEAD_TIMEOUT_SECONDS: float = 30
+
+    # Sandbox membership changes that arrive while an IAM write to the same project is
+    # in flight share the next write; stale-etag writes are retried this many times
+    IAM_UPDATE_MAX_ATTEMPTS: int = 5
+
+    # Append-only sandbox lifecycle journal
+    JOURNAL_DIR: str = "journal"
+    JOURNAL_SEGMENT_MAX_BYTES: int = 16 * 1024 * 1024
+
+    # Incrementally maintained per-team and per-user usage rollups
+    USAGE_ROLLUPS_DB_PATH: str = "usage_rollups.db"
+
+    # Opt-in sampling profiler that keeps profiles of requests slower than the threshold
+    PROFILER_ENABLED: bool = False
+    PROFILER_THRESHOLD_MS: int = 5000
+    PROFILER_SAMPLE_INTERVAL_MS: float = 5
+    PROFILER_OUTPUT_DIR: str = "profiles"
+    PROFILER_MAX_DIR_BYTES: int = 50 * 1024 * 1024
+
+    # Administration endpoints such as profile downloads, off by default. Requests must
+    # send "Authorization: Bearer <ADMIN_API_TOKEN>"; the token is required when enabled.
+    ADMIN_API_ENABLED: bool = False
+    ADMIN_API_TOKEN: str = ""
+
+    # Circuit breakers around the Google Cloud APIs used by the GCP provisioner
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_BREAKER_RECOVERY_SECONDS: float = 30
+    CIRCUIT_BREAKER_HALF_OPEN_MAX_CALLS: int = 1
+
+    # Store for per-user sandbox quota reservations: "local" (SQLite file, only correct when
+    # every instance runs on one host; refused on Cloud Run) or "gcs" (Cloud Storage bucket
+    # shared by all instances, QUOTA_STORE_BUCKET required)
+    QUOTA_STORE_BACKEND: str = "local"
+    QUOTA_STORE_DB_PATH: str = "quota_reservations.db"
+    QUOTA_STORE_BUCKET: str = ""
+    QUOTA_RESERVATION_LEASE_SECONDS: float = 300
+
+    # Live sandbox feed: unsent events per subscriber before it must resync, and keepalive interval
+    FEED_MAX_BUFFERED_EVENTS: int = 256
+    FEED_KEEPALIVE_SECONDS: float = 15
+
+    # AWS sandbox accounts: a pool of pre-created Organizations accounts that are cleaned,
+    # parked in AWS_PARKING_OU_ID and reassigned instead of being created and closed each time.
+    # Both OUs and the email template (with an {index} placeholder) are required to use the pool.
+    AWS_REGION: str = "us-east-1"
+    AWS_SANDBOX_OU_ID: str = ""
+    AWS_PARKING_OU_ID: str = ""
+    AWS_ACCOUNT_EMAIL_TEMPLATE: str = ""
+    AWS_ACCOUNT_ACCESS_ROLE_NAME: str = "OrganizationAccountAccessRole"
+    # Store the pool is kept in: "local" (SQLite file, a single instance only; refused on
+    # Cloud Run) or "gcs" (Cloud Storage bucket shared by all instances, AWS_ACCOUNT_POOL_BUCKET
+    # required). Creations and cleanups of a stopped instance are taken over once their
+    # lease expires.
+    AWS_ACCOUNT_POOL_BACKEND: str = "local"
+    AWS_ACCOUNT_POOL_DB_PATH: str = "aws_account_pool.db"
+    AWS_ACCOUNT_POOL_BUCKET: str = ""
+    AWS_ACCOUNT_POOL_LEASE_SECONDS: float = 600
+    AWS_ACCOUNT_POOL_MIN_AVAILABLE: int = 0
+    AWS_ACCOUNT_POOL_MAX_SIZE: int = 50
+    AWS_POOL_MAINTENANCE_INTERVAL_SECONDS: float = 60
+    AWS_CLEANUP_MAX_PARALLEL: int = 8
+    AWS_CLEANUP_REGIONS: str = "us-east-1"
+    # IAM Identity Center permission set granted to sandbox users; access grants are skipped if unset
+    AWS_SSO_INSTANCE_ARN: str = ""
+    AWS_SSO_PERMISSION_SET_ARN: str = ""
+    AWS_IDENTITY_STORE_ID: str = ""
+    # Kept below AWS_CREATE_TIMEOUT_SECONDS, so a slow grant fails and frees the account
+    # instead of the caller getting a 504 for an account that ends up assigned
+    AWS_ACCESS_GRANT_TIMEOUT_SECONDS: float = 180
+
+    # Opt-in capture of the API request mix for traffic_replay.py
+    TRAFFIC_CAPTURE_ENABLED: bool = False
+    TRAFFIC_CAPTURE_PATH: str = "traffic_capture.ndjson"
+    # Key of the pseudonyms of emails and project IDs in the trace, required when enabled
+    TRAFFIC_CAPTURE_SECRET: str = ""
+
     _parsed_team_folders: Optional[dict] = None
     
     class Config:
@@ -0,0 +1,271 @@
+import contextvars
+import inspect
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from typing import Optional
+
+from app.core.config import get_config
+from app.utils.asgi import STREAMING_PATHS, route_template
+
+# Get the singleton config instance
+config = get_config()
+
+PROFILE_SUFFIX = ".folded"
+# Long-lived streams are excluded too, they would always count as slow
+_EXCLUDED_PATHS = {"/health", "/health-no-log", "/ready", "/metrics"} | STREAMING_PATHS
+_COROUTINE_FLAGS = inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR
+
+_current_session: contextvars.ContextVar[Optional["ProfileSession"]] = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+
+class ProfileSession:
+    """Stack samples and tags collected for a single request."""
+
+    def __init__(self, loop_thread_id=None):
+        self.loop_thread_id = loop_thread_id
+        self.thread_ids = set()
+        self.samples = Counter()
+        self.tags = {}
+        if loop_thread_id is not None:
+            self.thread_ids.add(loop_thread_id)
+
+
+def _runs_coroutine(frame):
+    while frame is not None:
+        if frame.f_code.co_flags & _COROUTINE_FLAGS:
+            return True
+        frame = frame.f_back
+    return False
+
+
+class StackSampler:
+    """
+    Samples the stacks of threads serving profiled requests at a fixed interval.
+
+    A single daemon thread polls `sys._current_frames()` while at least one request is
+    being profiled and sleeps otherwise, so the cost is paid only by profiled requests.
+    Once `remove` returns the session's samples are no longer written to.
+    """
+
+    def __init__(self, interval_seconds):
+        self.interval_seconds = interval_seconds
+        self._condition = threading.Condition()
+        self._sessions = set()
+        # Sessions of the sampling pass in progress
+        self._sampling = frozenset()
+        self._thread = None
+        self._labels = {}
+
+    def add(self, session):
+        with self._condition:
+            self._sessions.add(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def remove(self, session):
+        with self._condition:
+            self._sessions.discard(session)
+            # Let a pass that still writes to the session finish, passes take microseconds
+            while session in self._sampling:
+                self._condition.wait()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = "/".join(code.co_filename.replace("\\", "/").split("/")[-2:])
+            label = f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _fold(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ";".join(reversed(labels))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._sessions:
+                    self._condition.wait()
+                sessions = self._sampling = frozenset(self._sessions)
+            frames = sys._current_frames()
+            try:
+                self._sample(sessions, frames)
+            finally:
+                del frames
+                with self._condition:
+                    self._sampling = frozenset()
+                    self._condition.notify_all()
+            time.sleep(self.interval_seconds)
+
+    def _sample(self, sessions, frames):
+        for session in sessions:
+            for thread_id in list(session.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                # Without a coroutine on its stack the event loop is waiting for I/O
+                if thread_id == session.loop_thread_id and not _runs_coroutine(frame):
+                    continue
+                session.samples[self._fold(frame)] += 1
+
+
+@contextmanager
+def attach_current_thread():
+    """
+    Includes the current thread in the samples of the request being profiled, if any.
+
+    Worker pools that run request handlers off the event loop wrap the call in this so
+    the handler's own stack ends up in the profile.
+    """
+    session = _current_session.get()
+    if session is None:
+        yield
+        return
+    thread_id = threading.get_ident()
+    session.thread_ids.add(thread_id)
+    try:
+        yield
+    finally:
+        session.thread_ids.discard(thread_id)
+
+
+def tag_current_profile(**tags):
+    """
+    Attaches tags such as `project_id` to the profile of the current request, if any.
+
+    Args:
+        **tags: Tag names and values.
+    """
+    session = _current_session.get()
+    if session is not None:
+        session.tags.update(tags)
+
+
+def _slug(value):
+    return re.sub(r"[^A-Za-z0-9.-]+", "-", str(value)).strip("-") or "none"
+
+
+def list_profiles(output_dir):
+    """
+    Lists stored profiles, newest first.
+
+    Args:
+        output_dir (str): The profile retention directory.
+
+    Returns:
+        list: One dict per profile with its name, size and the tags encoded in its name.
+    """
+    if not os.path.isdir(output_dir):
+        return []
+    profiles = []
+    for name in os.listdir(output_dir):
+        if not name.endswith(PROFILE_SUFFIX):
+            continue
+        parts = name[:-len(PROFILE_SUFFIX)].split("__")
+        if len(parts) != 5:
+            continue
+        recorded_at, method, route, project_id, duration = parts
+        profiles.append({
+            "name": name,
+            "size_bytes": os.path.getsize(os.path.join(output_dir, name)),
+            "recorded_at": recorded_at,
+            "method": method,
+            "route": route,
+            "project_id": None if project_id == "none" else project_id,
+            "duration_ms": int(duration.removesuffix("ms"))
+        })
+    return sorted(profiles, key=lambda profile: profile["name"], reverse=True)
+
+
+def _enforce_retention(output_dir, max_bytes):
+    entries = []
+    for name in os.listdir(output_dir):
+        if name.endswith(PROFILE_SUFFIX):
+            path = os.path.join(output_dir, name)
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+class SlowRequestProfilerMiddleware:
+    """
+    ASGI middleware that samples every request and keeps the profile only when it is slow.
+
+    Profiles of requests slower than `threshold_ms` are written in folded-stack format,
+    which flamegraph.pl, speedscope and most flamegraph viewers read directly. The file
+    name carries the time, method, route, project ID and duration. The oldest profiles
+    are removed once the directory grows past `max_dir_bytes`.
+
+    Samples of the event loop thread are kept only while it runs a coroutine, so time
+    spent waiting for I/O is left out; they can still include work of other requests
+    served concurrently. Handler threads attached with `attach_current_thread` are exclusive.
+    """
+
+    def __init__(self, app, threshold_ms, sample_interval_ms, output_dir, max_dir_bytes):
+        self.app = app
+        self.threshold_ms = threshold_ms
+        self.output_dir = output_dir
+        self.max_dir_bytes = max_dir_bytes
+        self.sampler = StackSampler(sample_interval_ms / 1000)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in _EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(loop_thread_id=threading.get_ident())
+        token = _current_session.set(session)
+        self.sampler.add(session)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.sampler.remove(session)
+            _current_session.reset(token)
+            duration_ms = int((time.perf_counter() - start) * 1000)
+            if duration_ms >= self.threshold_ms and session.samples:
+                self._save(scope, session, duration_ms)
+
+    def _save(self, scope, session, duration_ms):
+        from app.utils.logger import logger
+
+        # The matched route's template, e.g. /api/v1/gcp/delete/{project_id}
+        path_params = scope.get("path_params", {})
+        route = route_template(scope)
+        project_id = session.tags.get("project_id") or path_params.get("project_id")
+        name = "__".join([
+            datetime.now(UTC).strftime("%Y%m%dT%H%M%S%f"),
+            scope["method"],
+            _slug(route),
+            _slug(project_id) if project_id else "none",
+            f"{duration_ms}ms"
+        ]) + PROFILE_SUFFIX
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, name), "w") as profile_file:
+                for stack, count in session.samples.items():
+                    profile_file.write(f"{stack} {count}\n")
+            _enforce_retention(self.output_dir, self.max_dir_bytes)
+            logger.info(f"Saved profile {name} for slow request {scope['method']} {scope['path']} ({duration_ms} ms).")
+        except OSError as e:
+            logger.error(f"Failed to save profile for slow request {scope['method']} {scope['path']}: {e}")
@@ -0,0 +1,228 @@
+import contextvars
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Optional
+
+from app.utils.asgi import STREAMING_PATHS, route_template
+
+TRACE_FORMAT_VERSION = 1
+_CAPTURED_PATH_PREFIX = "/api/"
+_MAX_CAPTURED_BODY_BYTES = 64 * 1024
+# Values under these keys carry no personal data and shape the request mix, so they are kept
+_SAFE_KEYS = {"team_name", "granularity", "bucket", "since", "until"}
+_EMAIL_PATTERN = re.compile(r"^([^@\s]+)@([^@\s]+)$")
+_SANDBOX_ID_PATTERN = re.compile(r"^(.+?)-(\d{9,})(.*)$")
+
+_current_record: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("traffic_capture_record", default=None)
+
+
+def _pseudonym(value, secret):
+    # Keyed so pseudonyms of known usernames can't be recomputed from a leaked trace
+    return "user-" + hmac.new(secret.encode(), value.encode(), hashlib.sha256).hexdigest()[:10]
+
+
+def anonymize_email(email, secret):
+    """
+    Replaces the local part of an email with a stable pseudonym, keeping the domain.
+
+    The pseudonym is derived from the local part as `generate_sandbox_id` would render it,
+    so an anonymized email and the anonymized IDs of its sandboxes still line up.
+
+    Args:
+        email (str): The email address.
+        secret (str): The key of the pseudonyms, TRAFFIC_CAPTURE_SECRET.
+    """
+    match = _EMAIL_PATTERN.match(email)
+    if match is None:
+        return email
+    local_part, domain = match.groups()
+    return f"{_pseudonym(local_part.replace('.', '-'), secret)}@{domain}"
+
+
+def anonymize_project_id(project_id, secret):
+    """Replaces the user-derived prefix of a sandbox project ID with the user's pseudonym."""
+    match = _SANDBOX_ID_PATTERN.match(project_id)
+    if match is None:
+        return project_id
+    prefix, epoch, suffix = match.groups()
+    return f"{_pseudonym(prefix, secret)}-{epoch}{suffix}"
+
+
+def anonymize(value, secret, key=None):
+    """
+    Anonymizes a decoded JSON payload while keeping its shape.
+
+    Emails and project IDs become stable pseudonyms keyed by `secret`, values under known
+    safe keys are kept, and any other string is replaced by a placeholder of the same length.
+    """
+    if isinstance(value, dict):
+        return {k: anonymize(v, secret, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [anonymize(item, secret, key) for item in value]
+    if isinstance(value, str):
+        if _EMAIL_PATTERN.match(value):
+            return anonymize_email(value, secret)
+        if key == "project_id":
+            return anonymize_project_id(value, secret)
+        if key in _SAFE_KEYS:
+            return value
+        return "x" * len(value)
+    return value
+
+
+def referenced_project_ids(record):
+    """
+    Returns the project IDs a captured request refers to in its path params, query or body.
+
+    Args:
+        record (dict): A trace record.
+    """
+    found = set()
+
+    def collect(value, key=None):
+        if isinstance(value, dict):
+            for k, v in value.items():
+                collect(v, k)
+        elif isinstance(value, list):
+            for item in value:
+                collect(item, key)
+        elif isinstance(value, str) and key in ("project_id", "project_ids"):
+            found.add(value)
+
+    for part in ("p", "q", "b"):
+        collect(record.get(part, {}))
+    return found
+
+
+def record_gcp_call(api, duration_ms):
+    """
+    Adds the latency of a Google Cloud API call to the request being captured, if any.
+
+    Args:
+        api (str): The API name, e.g. "billing".
+        duration_ms (float): How long the call took.
+    """
+    record = _current_record.get()
+    if record is not None:
+        record["g"].append([api, round(duration_ms, 1)])
+
+
+class TrafficCaptureMiddleware:
+    """
+    ASGI middleware that records the API request mix to a compact NDJSON trace file.
+
+    The first line is a header; each following line is one request with its arrival
+    offset ("t", ms since capture start), method ("m"), route template ("r"),
+    anonymized path params ("p"), query ("q") and JSON body ("b"), status ("s"),
+    duration ("d", ms), Google Cloud API latencies ("g", `[api, ms]` pairs), the
+    anonymized ID of a project created by the request ("pid") and "src" set to "cloud_tasks"
+    for Cloud Tasks callbacks. Endless streams such as the live feed are not recorded.
+    `traffic_replay.py` replays these files.
+
+    Pseudonyms are HMACs keyed by `secret`; keep it out of the trace and rotate it to
+    unlink new traces from old ones.
+    """
+
+    def __init__(self, app, trace_path, secret):
+        if not secret:
+            raise ValueError("TRAFFIC_CAPTURE_SECRET must be set when TRAFFIC_CAPTURE_ENABLED is true")
+        self.app = app
+        self.trace_path = trace_path
+        self.secret = secret
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._trace_file = open(trace_path, "a")
+        if self._trace_file.tell() == 0:
+            header = {"v": TRACE_FORMAT_VERSION, "started_at": datetime.now(UTC).isoformat()}
+            self._trace_file.write(json.dumps(header, separators=(",", ":")) + "\n")
+            self._trace_file.flush()
+        else:
+            # Appending to an existing trace: keep offsets increasing across restarts
+            self._started -= self._last_offset_seconds()
+
+    def _last_offset_seconds(self):
+        last_offset_ms = 0
+        with open(self.trace_path) as trace_file:
+            for line in trace_file:
+                last_offset_ms = json.loads(line).get("t", last_offset_ms)
+        return last_offset_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        # Streams are left out, a replayed one would never finish
+        if (scope["type"] != "http" or not scope["path"].startswith(_CAPTURED_PATH_PREFIX)
+                or scope["path"] in STREAMING_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        arrival = time.monotonic()
+        headers = dict(scope.get("headers") or [])
+        record = {
+            "t": int((arrival - self._started) * 1000),
+            "m": scope["method"],
+            "g": []
+        }
+        if b"x-cloudtasks-taskname" in headers:
+            record["src"] = "cloud_tasks"
+        request_body = bytearray()
+        response_body = bytearray()
+        response_status = {"code": 500, "json": False}
+
+        async def capturing_receive():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) < _MAX_CAPTURED_BODY_BYTES:
+                request_body.extend(message.get("body", b""))
+            return message
+
+        async def capturing_send(message):
+            if message["type"] == "http.response.start":
+                response_status["code"] = message["status"]
+                content_type = dict(message.get("headers") or []).get(b"content-type", b"")
+                response_status["json"] = content_type.startswith(b"application/json")
+            elif message["type"] == "http.response.body" and response_status["json"] and len(response_body) < _MAX_CAPTURED_BODY_BYTES:
+                response_body.extend(message.get("body", b""))
+            await send(message)
+
+        token = _current_record.set(record)
+        try:
+            await self.app(scope, capturing_receive, capturing_send)
+        finally:
+            _current_record.reset(token)
+            record["d"] = round((time.monotonic() - arrival) * 1000, 1)
+            record["s"] = response_status["code"]
+            self._finish(scope, record, bytes(request_body), bytes(response_body))
+
+    def _finish(self, scope, record, request_body, response_body):
+        from urllib.parse import parse_qsl
+
+        path_params = scope.get("path_params", {})
+        record["r"] = route_template(scope)
+        if path_params:
+            record["p"] = anonymize(dict(path_params), self.secret)
+        query = parse_qsl(scope.get("query_string", b"").decode())
+        if query:
+            record["q"] = anonymize(dict(query), self.secret)
+        if request_body:
+            try:
+                record["b"] = anonymize(json.loads(request_body), self.secret)
+            except ValueError:
+                record["b_len"] = len(request_body)
+        if response_body:
+            try:
+                project_id = json.loads(response_body).get("project_id")
+            except (ValueError, AttributeError):
+                project_id = None
+            # Only projects created by this request, so replay can map them to the replayed IDs
+            if project_id:
+                project_id = anonymize_project_id(project_id, self.secret)
+                if project_id not in referenced_project_ids(record):
+                    record["pid"] = project_id
+
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._trace_file.write(line)
+            self._trace_file.flush()
@@ -0,0 +1,52 @@
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import List
+from app.core.config import get_config
+
+# Get the singleton config instance
+config = get_config()
+
+
+class AwsSandboxCreate(BaseModel):
+    user_email: EmailStr = Field(
+        ...,
+        description=f"Email address of the user requesting the sandbox. User must belong to {config.AUTHORIZED_DOMAIN_NAMES}"
+    )
+    requested_duration_hours: int = Field(
+        2,
+        description="Requested duration of the sandbox in hours."
+    )
+    request_description: str = Field(
+        default="POC On ",
+        description="Description for sandbox requirement."
+    )
+    additional_users: List[EmailStr] = Field(
+        default=[],
+        description="Optional list of additional users to grant access to the sandbox account."
+    )
+
+    @field_validator('user_email')
+    @classmethod
+    def validate_user_email_domain(cls, validated_email: str) -> str:
+        user_email_domain = validated_email.split("@")[1]
+        if user_email_domain not in config.AUTHORIZED_DOMAIN_NAMES:
+            raise ValueError(f"User {validated_email} doesn't belong to authorized domains {config.AUTHORIZED_DOMAIN_NAMES}")
+        return validated_email
+
+    @field_validator('additional_users')
+    @classmethod
+    def validate_additional_users_domains(cls, validated_emails: List[str]) -> List[str]:
+        for email in validated_emails:
+            user_email_domain = email.split("@")[1]
+            if user_email_domain not in config.AUTHORIZED_DOMAIN_NAMES:
+                raise ValueError(f"User {email} doesn't belong to authorized domains {config.AUTHORIZED_DOMAIN_NAMES}")
+        return validated_emails
+
+class AwsSandboxExtend(BaseModel):
+    account_id: str = Field(
+        ...,
+        description="ID of the sandbox account to be extended."
+    )
+    extend_by_hours: int = Field(
+        4,
+        description="Number of hours by which to extend the sandbox."
+    )
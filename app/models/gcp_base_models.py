@@ -1,5 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field, field_validator
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 from app.core.config import get_config
 
 # Get the singleton config instance
@@ -61,3 +62,55 @@ class SandboxExtend(BaseModel):
         4,
         description="Number of hours by which to extend the sandbox."
     )
+
+class SandboxBatchExtend(BaseModel):
+    project_ids: List[str] = Field(
+        default=[],
+        description="IDs of the projects to be extended."
+    )
+    team_name: Optional[str] = Field(
+        None,
+        description="Extend only the sandboxes of this team."
+    )
+    user_email: Optional[EmailStr] = Field(
+        None,
+        description="Extend only the sandboxes requested by this user."
+    )
+    expiring_before: Optional[datetime] = Field(
+        None,
+        description="Extend only the sandboxes scheduled for deletion before this time (ISO 8601, UTC if no offset)."
+    )
+    extend_by_hours: int = Field(
+        4,
+        description="Number of hours by which to extend each sandbox."
+    )
+
+    @field_validator('team_name')
+    @classmethod
+    def validate_team_name(cls, validated_team_name: Optional[str]) -> Optional[str]:
+        if validated_team_name is not None and validated_team_name not in config.AUTHORIZED_TEAM_FOLDERS.keys():
+            raise ValueError(f"Team name {validated_team_name} is invalid. Required value must be one in {config.AUTHORIZED_TEAM_FOLDERS.keys()}")
+        return validated_team_name
+
+class SandboxUsersUpdate(BaseModel):
+    project_id: str = Field(
+        ...,
+        description="ID of the sandbox project whose users are to be updated."
+    )
+    add_users: List[EmailStr] = Field(
+        default=[],
+        description=f"Users to grant access to the sandbox environment. Users must belong to {config.AUTHORIZED_DOMAIN_NAMES}"
+    )
+    remove_users: List[EmailStr] = Field(
+        default=[],
+        description="Users whose access to the sandbox environment is to be revoked."
+    )
+
+    @field_validator('add_users')
+    @classmethod
+    def validate_add_users_domains(cls, validated_emails: List[str]) -> List[str]:
+        for email in validated_emails:
+            user_email_domain = email.split("@")[1]
+            if user_email_domain not in config.AUTHORIZED_DOMAIN_NAMES:
+                raise ValueError(f"User {email} doesn't belong to authorized domains {config.AUTHORIZED_DOMAIN_NAMES}")
+        return validated_emails
@@ -0,0 +1,468 @@
+import copy
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from typing import Optional
+
+from app.core.config import get_config
+from app.services.aws_sandbox import AwsSandboxService
+from app.services.quota_reservations import GCSQuotaStore, QuotaExceededError, QuotaStore, SQLiteQuotaStore
+
+config = get_config()
+
+# Lifecycle of a pooled account
+ACCOUNT_STATES = ("creating", "available", "assigned", "cleaning", "failed")
+
+# Key of the pool's record in its store
+_POOL_KEY = "accounts"
+
+
+class AccountPoolExhaustedError(Exception):
+    """Raised when no cleaned account is available to assign."""
+
+    def __init__(self, retry_after_seconds):
+        self.retry_after_seconds = retry_after_seconds
+        super().__init__(f"No AWS sandbox account available, retry in {retry_after_seconds} seconds")
+
+
+class AccountPoolConflictError(Exception):
+    """Raised when an update of the pool keeps losing the race with other instances."""
+
+
+class AwsAccountPool:
+    """
+    Pool of pre-created AWS accounts that are assigned to users, cleaned and reassigned.
+
+    Creating an Organizations account takes minutes and closing one is rate-limited, so
+    accounts are never closed. Released and expired accounts are cleaned of their
+    resources in parallel on a bounded executor, parked in the parking OU and become
+    available again. A maintenance thread completes pending account creations, releases
+    expired assignments, retries failed cleanups and tops the pool up to
+    `min_available` spare accounts, never exceeding `max_size` accounts in total.
+
+    The pool is one record in a versioned store, changed with conditional writes like the
+    quota reservations, so instances sharing the store share the pool. Work done outside
+    the store, starting a creation or cleaning an account, is leased to the instance doing
+    it; the instance renews its leases on each maintenance pass, and once the lease of a
+    stopped instance expires another instance takes the work over.
+    """
+
+    def __init__(self, store: QuotaStore, min_available=0, max_size=50, maintenance_interval_seconds=60,
+                 cleanup_max_parallel=8, cleanup_regions=("us-east-1",), lease_seconds=600, max_attempts=10):
+        self.store = store
+        self.min_available = min_available
+        self.max_size = max_size
+        self.maintenance_interval_seconds = maintenance_interval_seconds
+        self.cleanup_regions = list(cleanup_regions)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        # Owner of this instance's leases
+        self._instance_id = uuid.uuid4().hex
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._cleanup_executor = ThreadPoolExecutor(max_workers=cleanup_max_parallel, thread_name_prefix="aws-account-cleanup")
+        # Accounts with a cleanup queued or running in this process
+        self._cleaning = set()
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="aws-account-pool", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        thread.join()
+        self._thread = None
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _read(self):
+        record, version = self.store.read(_POOL_KEY)
+        return record or {"next_index": 1, "accounts": {}}
+
+    def _update(self, change):
+        # Optimistic read-modify-write of the whole pool; `change` edits it in place
+        for attempt in range(self.max_attempts):
+            record, version = self.store.read(_POOL_KEY)
+            record = record or {"next_index": 1, "accounts": {}}
+            pool = copy.deepcopy(record)
+            result = change(pool, time.time())
+            if pool == record:
+                return result
+            if self.store.write(_POOL_KEY, pool, version):
+                return result
+            # Lost the race: back off briefly with jitter so competing instances spread out
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+        raise AccountPoolConflictError("Too many concurrent updates of the AWS account pool, please retry")
+
+    def _lease(self, account, state, now):
+        account.update(state=state, lease_owner=self._instance_id, lease_expires_at=now + self.lease_seconds, updated_at=now)
+
+    def _holds_lease(self, account, state):
+        return account["state"] == state and account["lease_owner"] == self._instance_id
+
+    def acquire(self, user_email, additional_users, duration_hours, request_description=""):
+        """
+        Assigns a cleaned account to a user and grants them access to it.
+
+        Args:
+            user_email (str): The email address of the requesting user.
+            additional_users (list): Email addresses of other users to grant access to.
+            duration_hours (int): How long the account stays assigned.
+            request_description (str): What the sandbox is for.
+
+        Returns:
+            dict: The assigned account, with its ID and expiry.
+
+        Raises:
+            QuotaExceededError: If the user already holds the maximum number of accounts.
+            AccountPoolExhaustedError: If no account is available.
+            AccountPoolConflictError: If the pool kept changing under concurrent updates.
+        """
+        now = datetime.now(UTC)
+        expires_at = now + timedelta(hours=duration_hours)
+
+        def assign(pool, updated_at):
+            accounts = pool["accounts"].values()
+            assigned_count = sum(1 for account in accounts if account["state"] == "assigned" and account["user_email"] == user_email)
+            if assigned_count >= config.MAX_ALLOWED_PROJECTS_PER_USER:
+                raise QuotaExceededError(user_email, config.MAX_ALLOWED_PROJECTS_PER_USER)
+            available = [account for account in accounts if account["state"] == "available"]
+            if not available:
+                raise AccountPoolExhaustedError(max(1, int(self.maintenance_interval_seconds)))
+            account = min(available, key=lambda account: account["updated_at"])
+            account.update(
+                state="assigned", user_email=user_email, additional_users=list(additional_users),
+                request_description=request_description, assigned_at=now.timestamp(),
+                expires_at=expires_at.timestamp(), error=None, updated_at=updated_at
+            )
+            return account["account_id"]
+
+        try:
+            account_id = self._update(assign)
+        finally:
+            # Make sure a refill is under way, taking a spare account may call for one too
+            self._wake()
+
+        try:
+            AwsSandboxService.move_account(account_id, config.AWS_SANDBOX_OU_ID)
+            AwsSandboxService.grant_user_access(account_id, [user_email] + list(additional_users))
+        except Exception:
+            # Clean up whatever access was granted before handing the account out again
+            self.release(account_id)
+            raise
+        return {
+            "account_id": account_id,
+            "user_email": user_email,
+            "additional_users": list(additional_users),
+            "request_description": request_description,
+            "assigned_at": now,
+            "expires_at": expires_at
+        }
+
+    @staticmethod
+    def _assigned_account(pool, account_id):
+        for account in pool["accounts"].values():
+            if account["account_id"] == account_id and account["state"] == "assigned":
+                return account
+        raise KeyError(f"AWS account {account_id} is not assigned")
+
+    def extend(self, account_id, extend_by_hours):
+        """
+        Extends the assignment of an account.
+
+        Args:
+            account_id (str): The ID of the assigned account.
+            extend_by_hours (int): Number of hours to add to the current expiry.
+
+        Returns:
+            datetime: The new expiry.
+
+        Raises:
+            KeyError: If the account is not assigned.
+        """
+        def extend_assignment(pool, now):
+            account = self._assigned_account(pool, account_id)
+            new_expiry = datetime.fromtimestamp(account["expires_at"], UTC) + timedelta(hours=extend_by_hours)
+            account.update(expires_at=new_expiry.timestamp(), updated_at=now)
+            return new_expiry
+
+        return self._update(extend_assignment)
+
+    def release(self, account_id):
+        """
+        Takes an account back from its user and queues it for cleanup.
+
+        Args:
+            account_id (str): The ID of the assigned account.
+
+        Raises:
+            KeyError: If the account is not assigned.
+        """
+        self._update(lambda pool, now: self._lease(self._assigned_account(pool, account_id), "cleaning", now))
+        self._submit_cleanup(account_id)
+
+    def _submit_cleanup(self, account_id):
+        with self._condition:
+            if account_id not in self._cleaning:
+                self._cleaning.add(account_id)
+                self._cleanup_executor.submit(self._clean, account_id)
+
+    def _clean(self, account_id):
+        from app.utils.logger import logger
+
+        try:
+            logger.info(f"Cleaning AWS account {account_id}...")
+            AwsSandboxService.revoke_user_access(account_id)
+            AwsSandboxService.cleanup_account(account_id, self.cleanup_regions)
+            AwsSandboxService.move_account(account_id, config.AWS_PARKING_OU_ID)
+            logger.info(f"Successfully cleaned AWS account {account_id}, returning it to the pool.")
+            state, fields = "available", {}
+        except Exception as e:
+            logger.error(f"Failed to clean AWS account {account_id}: {e}")
+            state, fields = "failed", {"error": str(e)}
+
+        def finish(pool, now):
+            for account in pool["accounts"].values():
+                # Unless another instance took the cleanup over after our lease expired
+                if account["account_id"] == account_id and self._holds_lease(account, "cleaning"):
+                    account.update(
+                        state=state, user_email=None, additional_users=None, request_description=None,
+                        assigned_at=None, expires_at=None, lease_owner=None, lease_expires_at=None,
+                        updated_at=now, **fields
+                    )
+
+        try:
+            self._update(finish)
+        except Exception as e:
+            # The lease expires and the cleanup is retried
+            logger.error(f"Failed to record the cleanup of AWS account {account_id}: {e}")
+        finally:
+            with self._condition:
+                self._cleaning.discard(account_id)
+
+    def _complete_creations(self):
+        from app.utils.logger import logger
+
+        def drop_abandoned(pool, now):
+            # Slots whose creation was never started because their instance stopped
+            abandoned = [
+                key for key, account in pool["accounts"].items()
+                if account["state"] == "creating" and not account["create_request_id"] and account["lease_expires_at"] <= now
+            ]
+            return [pool["accounts"].pop(key)["email"] for key in abandoned]
+
+        for email in self._update(drop_abandoned):
+            logger.warning(f"Dropped abandoned creation of AWS account {email}.")
+        pending = [
+            (key, account["create_request_id"]) for key, account in self._read()["accounts"].items()
+            if account["state"] == "creating" and account["create_request_id"]
+        ]
+        for key, create_request_id in pending:
+            state, account_id, reason = AwsSandboxService.get_account_creation_status(create_request_id)
+            if state == "SUCCEEDED":
+                AwsSandboxService.move_account(account_id, config.AWS_PARKING_OU_ID)
+                if self._update(lambda pool, now, key=key, account_id=account_id: self._add_created(pool, now, key, account_id)):
+                    logger.info(f"AWS account {account_id} created and added to the pool.")
+            elif state == "FAILED":
+                logger.error(f"AWS account creation {create_request_id} failed: {reason}")
+                self._update(lambda pool, now, key=key: pool["accounts"].pop(key, None))
+
+    @staticmethod
+    def _add_created(pool, now, key, account_id):
+        account = pool["accounts"].get(key)
+        if account is None or account["state"] != "creating":
+            # Completed by another instance
+            return False
+        account.update(account_id=account_id, state="available", updated_at=now)
+        return True
+
+    def _release_expired(self):
+        from app.utils.logger import logger
+
+        now = time.time()
+        expired = [
+            account["account_id"] for account in self._read()["accounts"].values()
+            if account["state"] == "assigned" and account["expires_at"] <= now
+        ]
+        for account_id in expired:
+            logger.info(f"Assignment of AWS account {account_id} expired, releasing it.")
+            try:
+                self.release(account_id)
+            except KeyError:
+                # Released or extended meanwhile
+                pass
+
+    def _renew_leases(self):
+        with self._condition:
+            cleaning = set(self._cleaning)
+        if not cleaning:
+            return
+
+        def renew(pool, now):
+            for account in pool["accounts"].values():
+                if account["account_id"] in cleaning and self._holds_lease(account, "cleaning"):
+                    account["lease_expires_at"] = now + self.lease_seconds
+
+        self._update(renew)
+
+    def _retry_cleanups(self):
+        with self._condition:
+            cleaning = set(self._cleaning)
+
+        def claim(pool, now):
+            # Failed cleanups, and cleanups of instances that stopped or restarted
+            claimed = []
+            for account in pool["accounts"].values():
+                if account["account_id"] in cleaning:
+                    continue
+                if account["state"] == "failed" or (account["state"] == "cleaning" and account["lease_expires_at"] <= now):
+                    self._lease(account, "cleaning", now)
+                    claimed.append(account["account_id"])
+            return claimed
+
+        for account_id in self._update(claim):
+            self._submit_cleanup(account_id)
+
+    def _refill(self):
+        from app.utils.logger import logger
+
+        def claim_slots(pool, now):
+            counts = self._state_counts(pool)
+            spare = counts["available"] + counts["creating"]
+            missing = min(self.min_available - spare, self.max_size - sum(counts.values()))
+            slots = []
+            for _ in range(max(0, missing)):
+                index = pool["next_index"]
+                pool["next_index"] += 1
+                account = {
+                    "index": index, "account_id": None, "email": config.AWS_ACCOUNT_EMAIL_TEMPLATE.format(index=index),
+                    "create_request_id": None, "user_email": None, "additional_users": None,
+                    "request_description": None, "assigned_at": None, "expires_at": None, "error": None
+                }
+                self._lease(account, "creating", now)
+                pool["accounts"][str(index)] = account
+                slots.append(account)
+            return slots
+
+        slots = self._update(claim_slots)
+        for position, slot in enumerate(slots):
+            key = str(slot["index"])
+            try:
+                create_request_id = AwsSandboxService.start_account_creation(slot["email"], f"sandbox-{slot['index']:03d}")
+            except Exception as e:
+                logger.error(f"Failed to start creation of AWS account {slot['email']}: {e}")
+                unstarted = {str(slot["index"]) for slot in slots[position:]}
+
+                def give_back(pool, now):
+                    # The next pass tries again
+                    for key in unstarted:
+                        pool["accounts"].pop(key, None)
+
+                self._update(give_back)
+                return
+
+            def started(pool, now, key=key, create_request_id=create_request_id):
+                account = pool["accounts"].get(key)
+                if account is not None:
+                    account.update(create_request_id=create_request_id, lease_owner=None, lease_expires_at=None, updated_at=now)
+
+            self._update(started)
+            logger.info(f"Started creation of AWS account {slot['email']} for the pool.")
+
+    def maintain(self):
+        """Runs one maintenance pass: the work done periodically by the maintenance thread."""
+        from app.utils.logger import logger
+
+        for step in (self._complete_creations, self._release_expired, self._renew_leases, self._retry_cleanups, self._refill):
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"AWS account pool maintenance step {step.__name__} failed: {e}")
+
+    def _run(self):
+        while True:
+            self.maintain()
+            with self._condition:
+                if not self._stopping:
+                    self._condition.wait(timeout=self.maintenance_interval_seconds)
+                if self._stopping:
+                    return
+
+    @staticmethod
+    def _state_counts(pool):
+        counts = dict.fromkeys(ACCOUNT_STATES, 0)
+        for account in pool["accounts"].values():
+            counts[account["state"]] += 1
+        return counts
+
+    def status(self) -> dict:
+        """Returns the number of accounts in each state and the pool sizing."""
+        counts = self._state_counts(self._read())
+        with self._condition:
+            cleanups_in_progress = len(self._cleaning)
+        return {
+            "accounts": counts,
+            "cleanups_in_progress": cleanups_in_progress,
+            "min_available": self.min_available,
+            "max_size": self.max_size
+        }
+
+
+_pool_instance: Optional[AwsAccountPool] = None
+_pool_lock = threading.Lock()
+
+def get_aws_account_pool() -> AwsAccountPool:
+    """
+    Get the singleton AWS account pool.
+
+    Raises:
+        ValueError: If the sandbox or parking OU or the account email template is not configured,
+            or the pool store is not usable where the service runs.
+    """
+    global _pool_instance
+    with _pool_lock:
+        if _pool_instance is None:
+            if not config.AWS_SANDBOX_OU_ID or not config.AWS_PARKING_OU_ID:
+                raise ValueError("AWS_SANDBOX_OU_ID and AWS_PARKING_OU_ID must be set to use the AWS account pool")
+            if "{index}" not in config.AWS_ACCOUNT_EMAIL_TEMPLATE:
+                raise ValueError("AWS_ACCOUNT_EMAIL_TEMPLATE must be set and contain an {index} placeholder")
+            backend = config.AWS_ACCOUNT_POOL_BACKEND
+            if backend == "local":
+                # Cloud Run sets K_SERVICE; its instances don't share a filesystem, so each would
+                # create its own spare accounts and lose track of assigned ones when recycled
+                if os.environ.get("K_SERVICE"):
+                    raise ValueError("AWS_ACCOUNT_POOL_BACKEND 'local' cannot be used on Cloud Run, use 'gcs'")
+                store = SQLiteQuotaStore(config.AWS_ACCOUNT_POOL_DB_PATH)
+            elif backend == "gcs":
+                if not config.AWS_ACCOUNT_POOL_BUCKET:
+                    raise ValueError("AWS_ACCOUNT_POOL_BUCKET must be set when AWS_ACCOUNT_POOL_BACKEND is 'gcs'")
+                store = GCSQuotaStore(config.AWS_ACCOUNT_POOL_BUCKET, prefix="aws-account-pool/")
+            else:
+                raise ValueError(f"Unknown AWS_ACCOUNT_POOL_BACKEND {backend}. Must be one of 'local', 'gcs'")
+            _pool_instance = AwsAccountPool(
+                store,
+                min_available=config.AWS_ACCOUNT_POOL_MIN_AVAILABLE,
+                max_size=config.AWS_ACCOUNT_POOL_MAX_SIZE,
+                maintenance_interval_seconds=config.AWS_POOL_MAINTENANCE_INTERVAL_SECONDS,
+                cleanup_max_parallel=config.AWS_CLEANUP_MAX_PARALLEL,
+                cleanup_regions=[region.strip() for region in config.AWS_CLEANUP_REGIONS.split(",") if region.strip()],
+                lease_seconds=config.AWS_ACCOUNT_POOL_LEASE_SECONDS
+            )
+    return _pool_instance
@@ -0,0 +1,648 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.config import get_config
+config = get_config()
+
+# How long to wait for deletions, Identity Center assignments and the like to finish
+WAIT_DELAY_SECONDS = 15
+WAIT_MAX_ATTEMPTS = 120
+ASSIGNMENT_POLL_SECONDS = 2
+
+# Inline policy of the role Organizations creates in member accounts
+_ACCESS_ROLE_POLICY_NAME = "AdministratorAccess"
+
+
+class AwsSandboxService:
+    @staticmethod
+    def start_account_creation(email, account_name):
+        """
+        Starts creating a new member account in the AWS Organization.
+
+        Account creation takes minutes, poll `get_account_creation_status` for the result.
+
+        Args:
+            email (str): The unique root email address of the new account.
+            account_name (str): The display name of the new account.
+
+        Returns:
+            str: The ID of the account creation request.
+        """
+        # Lazy import to avoid startup overhead
+        import boto3
+
+        client = boto3.client("organizations", region_name=config.AWS_REGION)
+
+        # Make the request
+        response = client.create_account(Email=email, AccountName=account_name)
+
+        # Handle the response
+        return response["CreateAccountStatus"]["Id"]
+
+    @staticmethod
+    def get_account_creation_status(create_request_id):
+        """
+        Retrieves the state of an account creation request.
+
+        Args:
+            create_request_id (str): The ID returned by `start_account_creation`.
+
+        Returns:
+            tuple: The state ("IN_PROGRESS", "SUCCEEDED" or "FAILED"), the account ID once
+            created and the failure reason if any.
+        """
+        # Lazy import to avoid startup overhead
+        import boto3
+
+        client = boto3.client("organizations", region_name=config.AWS_REGION)
+
+        # Make the request
+        response = client.describe_create_account_status(CreateAccountRequestId=create_request_id)
+
+        # Handle the response
+        status = response["CreateAccountStatus"]
+        return status["State"], status.get("AccountId"), status.get("FailureReason")
+
+    @staticmethod
+    def move_account(account_id, destination_ou_id):
+        """
+        Moves an account to an organizational unit, e.g. between the sandbox and parking OUs.
+
+        Args:
+            account_id (str): The ID of the account to move.
+            destination_ou_id (str): The ID of the organizational unit to move it to.
+        """
+        # Lazy import to avoid startup overhead
+        import boto3
+
+        client = boto3.client("organizations", region_name=config.AWS_REGION)
+
+        source_parent_id = client.list_parents(ChildId=account_id)["Parents"][0]["Id"]
+        if source_parent_id == destination_ou_id:
+            return
+        client.move_account(AccountId=account_id, SourceParentId=source_parent_id, DestinationParentId=destination_ou_id)
+
+    @staticmethod
+    def get_account_session(account_id):
+        """
+        Assumes the organization access role in a member account.
+
+        Args:
+            account_id (str): The ID of the member account.
+
+        Returns:
+            boto3.Session: A session with the role's temporary credentials.
+        """
+        # Lazy import to avoid startup overhead
+        import boto3
+
+        client = boto3.client("sts", region_name=config.AWS_REGION)
+
+        # Make the request
+        response = client.assume_role(
+            RoleArn=f"arn:aws:iam::{account_id}:role/{config.AWS_ACCOUNT_ACCESS_ROLE_NAME}",
+            RoleSessionName="sandbox-provisioner"
+        )
+
+        # Handle the response
+        credentials = response["Credentials"]
+        return boto3.Session(
+            aws_access_key_id=credentials["AccessKeyId"],
+            aws_secret_access_key=credentials["SecretAccessKey"],
+            aws_session_token=credentials["SessionToken"]
+        )
+
+    @staticmethod
+    def grant_user_access(account_id, user_emails):
+        """
+        Grants users the sandbox permission set on an account through IAM Identity Center.
+
+        Waits until Identity Center has applied the assignments, at most
+        AWS_ACCESS_GRANT_TIMEOUT_SECONDS. Does nothing unless AWS_SSO_INSTANCE_ARN is configured.
+
+        Args:
+            account_id (str): The ID of the sandbox account.
+            user_emails (list): The email addresses of the Identity Center users.
+
+        Raises:
+            TimeoutError: If the assignments were not applied in time.
+        """
+        if not config.AWS_SSO_INSTANCE_ARN:
+            return
+        # Lazy import to avoid startup overhead
+        import boto3
+
+        identity_store = boto3.client("identitystore", region_name=config.AWS_REGION)
+        sso_admin = boto3.client("sso-admin", region_name=config.AWS_REGION)
+
+        deadline = time.monotonic() + config.AWS_ACCESS_GRANT_TIMEOUT_SECONDS
+        request_ids = []
+        for user_email in user_emails:
+            user_id = identity_store.get_user_id(
+                IdentityStoreId=config.AWS_IDENTITY_STORE_ID,
+                AlternateIdentifier={"UniqueAttribute": {"AttributePath": "emails.value", "AttributeValue": user_email}}
+            )["UserId"]
+            response = sso_admin.create_account_assignment(
+                InstanceArn=config.AWS_SSO_INSTANCE_ARN,
+                TargetId=account_id,
+                TargetType="AWS_ACCOUNT",
+                PermissionSetArn=config.AWS_SSO_PERMISSION_SET_ARN,
+                PrincipalType="USER",
+                PrincipalId=user_id
+            )
+            request_ids.append(response["AccountAssignmentCreationStatus"]["RequestId"])
+        for request_id in request_ids:
+            _wait_for_assignment(
+                lambda: sso_admin.describe_account_assignment_creation_status(
+                    InstanceArn=config.AWS_SSO_INSTANCE_ARN, AccountAssignmentCreationRequestId=request_id
+                )["AccountAssignmentCreationStatus"],
+                deadline=deadline
+            )
+
+    @staticmethod
+    def revoke_user_access(account_id):
+        """
+        Removes every user assignment of the sandbox permission set from an account.
+
+        Waits until Identity Center has finished removing them. Does nothing unless
+        AWS_SSO_INSTANCE_ARN is configured.
+
+        Args:
+            account_id (str): The ID of the sandbox account.
+        """
+        if not config.AWS_SSO_INSTANCE_ARN:
+            return
+        # Lazy import to avoid startup overhead
+        import boto3
+
+        sso_admin = boto3.client("sso-admin", region_name=config.AWS_REGION)
+
+        paginator = sso_admin.get_paginator("list_account_assignments")
+        assignments = [
+            assignment
+            for page in paginator.paginate(InstanceArn=config.AWS_SSO_INSTANCE_ARN, AccountId=account_id,
+                                           PermissionSetArn=config.AWS_SSO_PERMISSION_SET_ARN)
+            for assignment in page["AccountAssignments"]
+        ]
+        request_ids = []
+        for assignment in assignments:
+            response = sso_admin.delete_account_assignment(
+                InstanceArn=config.AWS_SSO_INSTANCE_ARN,
+                TargetId=account_id,
+                TargetType="AWS_ACCOUNT",
+                PermissionSetArn=config.AWS_SSO_PERMISSION_SET_ARN,
+                PrincipalType=assignment["PrincipalType"],
+                PrincipalId=assignment["PrincipalId"]
+            )
+            request_ids.append(response["AccountAssignmentDeletionStatus"]["RequestId"])
+        for request_id in request_ids:
+            _wait_for_assignment(
+                lambda: sso_admin.describe_account_assignment_deletion_status(
+                    InstanceArn=config.AWS_SSO_INSTANCE_ARN, AccountAssignmentDeletionRequestId=request_id
+                )["AccountAssignmentDeletionStatus"]
+            )
+
+    @staticmethod
+    def cleanup_account(account_id, regions):
+        """
+        Deletes the resources left in a sandbox account so it can be reassigned.
+
+        Each region is cleaned in dependency order, and every deletion that AWS completes
+        asynchronously is awaited: CloudFormation stacks, Auto Scaling groups, EC2 instances,
+        RDS instances and clusters, load balancers and NAT gateways first, then Lambda
+        functions, DynamoDB tables, ECR repositories, CloudWatch log groups, alarms and
+        dashboards and KMS keys, then AMIs, EBS snapshots and volumes and Elastic IPs, and
+        finally security groups and non-default VPCs. KMS keys can't be deleted at once,
+        they are disabled and scheduled for deletion after the minimum 7 days.
+
+        S3 buckets and IAM users, roles, groups, policies, instance profiles and OIDC and
+        SAML providers are deleted once for the account. IAM Identity Center roles and SAML
+        provider and service-linked roles are kept. The role used to manage the account
+        (AWS_ACCOUNT_ACCESS_ROLE_NAME) is kept but reset to the trust and administrator
+        policy Organizations creates it with. The regions and the global services are
+        cleaned in parallel.
+
+        Args:
+            account_id (str): The ID of the sandbox account.
+            regions (list): The regions to clean.
+
+        Raises:
+            RuntimeError: Listing every cleanup step that failed.
+        """
+        session = AwsSandboxService.get_account_session(account_id)
+        plans = [(None, [("s3", _delete_s3_buckets)]), (None, [("iam", _delete_iam_resources)])]
+        plans += [(region, _REGIONAL_CLEANUP_STEPS) for region in regions]
+
+        def run_plan(plan):
+            region, steps = plan
+            errors = []
+            # Later steps depend on earlier ones, but one failure shouldn't stop the rest
+            for service, delete in steps:
+                try:
+                    delete(session, region or config.AWS_REGION)
+                except Exception as e:
+                    errors.append(f"{service} in {region or 'all regions'}: {e}")
+            return errors
+
+        with ThreadPoolExecutor(max_workers=min(len(plans), 16)) as executor:
+            errors = [error for plan_errors in executor.map(run_plan, plans) for error in plan_errors]
+        if errors:
+            raise RuntimeError(f"Cleanup of AWS account {account_id} failed: {'; '.join(errors)}")
+
+
+def _wait_until(done, description, delay_seconds=None, deadline=None):
+    delay_seconds = WAIT_DELAY_SECONDS if delay_seconds is None else delay_seconds
+    if deadline is None:
+        deadline = time.monotonic() + WAIT_DELAY_SECONDS * WAIT_MAX_ATTEMPTS
+    while not done():
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Timed out waiting for {description}")
+        time.sleep(delay_seconds)
+
+
+def _waiter_config():
+    return {"Delay": WAIT_DELAY_SECONDS, "MaxAttempts": WAIT_MAX_ATTEMPTS}
+
+
+def _wait_for_assignment(describe_status, deadline=None):
+    status = {}
+
+    def finished():
+        status.update(describe_status())
+        return status["Status"] != "IN_PROGRESS"
+
+    # Assignments usually take seconds, poll them more often than deletions
+    _wait_until(finished, "an IAM Identity Center account assignment",
+                delay_seconds=min(WAIT_DELAY_SECONDS, ASSIGNMENT_POLL_SECONDS), deadline=deadline)
+    if status["Status"] == "FAILED":
+        raise RuntimeError(f"IAM Identity Center account assignment failed: {status.get('FailureReason')}")
+
+
+def _paginate(client, operation, key, **kwargs):
+    return [item for page in client.get_paginator(operation).paginate(**kwargs) for item in page[key]]
+
+
+def _ignore_missing(call, **kwargs):
+    from botocore.exceptions import ClientError
+
+    try:
+        return call(**kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchEntity", "NotFound", "ResourceNotFoundException"):
+            raise
+
+
+def _delete_s3_buckets(session, region):
+    s3 = session.resource("s3", region_name=region)
+    for bucket in s3.buckets.all():
+        bucket.object_versions.delete()
+        bucket.objects.delete()
+        bucket.delete()
+
+
+def _is_kept_role(role):
+    # Only AWS can create roles under these paths, a tenant's look-alike names are deleted
+    return (role["RoleName"] == config.AWS_ACCOUNT_ACCESS_ROLE_NAME
+            or (role["RoleName"].startswith("AWSReservedSSO_") and role["Path"] == "/aws-reserved/sso.amazonaws.com/")
+            or role["Path"].startswith("/aws-service-role/"))
+
+
+def _reset_access_role(iam):
+    # Lazy import to avoid startup overhead
+    import boto3
+
+    # The baseline Organizations creates: trusted by the management account, with administrator access
+    management_account_id = boto3.client("sts", region_name=config.AWS_REGION).get_caller_identity()["Account"]
+    name = config.AWS_ACCOUNT_ACCESS_ROLE_NAME
+    _ignore_missing(iam.delete_role_permissions_boundary, RoleName=name)
+    iam.put_role_policy(RoleName=name, PolicyName=_ACCESS_ROLE_POLICY_NAME, PolicyDocument=json.dumps({
+        "Version": "2012-10-17", "Statement": [{"Effect": "Allow", "Action": "*", "Resource": "*"}]
+    }))
+    iam.update_assume_role_policy(RoleName=name, PolicyDocument=json.dumps({
+        "Version": "2012-10-17",
+        "Statement": [{"Effect": "Allow", "Principal": {"AWS": f"arn:aws:iam::{management_account_id}:root"},
+                       "Action": "sts:AssumeRole"}]
+    }))
+    for policy_name in _paginate(iam, "list_role_policies", "PolicyNames", RoleName=name):
+        if policy_name != _ACCESS_ROLE_POLICY_NAME:
+            iam.delete_role_policy(RoleName=name, PolicyName=policy_name)
+    for policy in _paginate(iam, "list_attached_role_policies", "AttachedPolicies", RoleName=name):
+        iam.detach_role_policy(RoleName=name, PolicyArn=policy["PolicyArn"])
+    for profile in _paginate(iam, "list_instance_profiles_for_role", "InstanceProfiles", RoleName=name):
+        iam.remove_role_from_instance_profile(InstanceProfileName=profile["InstanceProfileName"], RoleName=name)
+
+
+def _delete_iam_resources(session, region):
+    iam = session.client("iam", region_name=region)
+    # First, this session runs as the access role and needs its permissions for the rest
+    _reset_access_role(iam)
+
+    for user in _paginate(iam, "list_users", "Users"):
+        name = user["UserName"]
+        for key in _paginate(iam, "list_access_keys", "AccessKeyMetadata", UserName=name):
+            iam.delete_access_key(UserName=name, AccessKeyId=key["AccessKeyId"])
+        _ignore_missing(iam.delete_login_profile, UserName=name)
+        for device in _paginate(iam, "list_mfa_devices", "MFADevices", UserName=name):
+            iam.deactivate_mfa_device(UserName=name, SerialNumber=device["SerialNumber"])
+            if ":mfa/" in device["SerialNumber"]:
+                iam.delete_virtual_mfa_device(SerialNumber=device["SerialNumber"])
+        for certificate in _paginate(iam, "list_signing_certificates", "Certificates", UserName=name):
+            iam.delete_signing_certificate(UserName=name, CertificateId=certificate["CertificateId"])
+        for ssh_key in iam.list_ssh_public_keys(UserName=name)["SSHPublicKeys"]:
+            iam.delete_ssh_public_key(UserName=name, SSHPublicKeyId=ssh_key["SSHPublicKeyId"])
+        for policy in _paginate(iam, "list_attached_user_policies", "AttachedPolicies", UserName=name):
+            iam.detach_user_policy(UserName=name, PolicyArn=policy["PolicyArn"])
+        for policy_name in _paginate(iam, "list_user_policies", "PolicyNames", UserName=name):
+            iam.delete_user_policy(UserName=name, PolicyName=policy_name)
+        for group in _paginate(iam, "list_groups_for_user", "Groups", UserName=name):
+            iam.remove_user_from_group(UserName=name, GroupName=group["GroupName"])
+        iam.delete_user(UserName=name)
+
+    for group in _paginate(iam, "list_groups", "Groups"):
+        name = group["GroupName"]
+        for policy in _paginate(iam, "list_attached_group_policies", "AttachedPolicies", GroupName=name):
+            iam.detach_group_policy(GroupName=name, PolicyArn=policy["PolicyArn"])
+        for policy_name in _paginate(iam, "list_group_policies", "PolicyNames", GroupName=name):
+            iam.delete_group_policy(GroupName=name, PolicyName=policy_name)
+        iam.delete_group(GroupName=name)
+
+    for role in _paginate(iam, "list_roles", "Roles"):
+        if _is_kept_role(role):
+            continue
+        name = role["RoleName"]
+        for profile in _paginate(iam, "list_instance_profiles_for_role", "InstanceProfiles", RoleName=name):
+            iam.remove_role_from_instance_profile(InstanceProfileName=profile["InstanceProfileName"], RoleName=name)
+        for policy in _paginate(iam, "list_attached_role_policies", "AttachedPolicies", RoleName=name):
+            iam.detach_role_policy(RoleName=name, PolicyArn=policy["PolicyArn"])
+        for policy_name in _paginate(iam, "list_role_policies", "PolicyNames", RoleName=name):
+            iam.delete_role_policy(RoleName=name, PolicyName=policy_name)
+        iam.delete_role(RoleName=name)
+
+    for profile in _paginate(iam, "list_instance_profiles", "InstanceProfiles"):
+        if not profile["Roles"]:
+            iam.delete_instance_profile(InstanceProfileName=profile["InstanceProfileName"])
+
+    for policy in _paginate(iam, "list_policies", "Policies", Scope="Local"):
+        if policy["AttachmentCount"]:
+            # Only still attached to an IAM Identity Center or service-linked role
+            continue
+        for version in _paginate(iam, "list_policy_versions", "Versions", PolicyArn=policy["Arn"]):
+            if not version["IsDefaultVersion"]:
+                iam.delete_policy_version(PolicyArn=policy["Arn"], VersionId=version["VersionId"])
+        iam.delete_policy(PolicyArn=policy["Arn"])
+
+    for provider in iam.list_open_id_connect_providers()["OpenIDConnectProviderList"]:
+        iam.delete_open_id_connect_provider(OpenIDConnectProviderArn=provider["Arn"])
+    for provider in iam.list_saml_providers()["SAMLProviderList"]:
+        # IAM Identity Center signs users in through its own provider
+        if "/AWSSSO_" not in provider["Arn"]:
+            iam.delete_saml_provider(SAMLProviderArn=provider["Arn"])
+
+
+def _delete_cloudformation_stacks(session, region):
+    client = session.client("cloudformation", region_name=region)
+    stacks = [
+        stack for stack in _paginate(client, "list_stacks", "StackSummaries")
+        # Nested stacks go with their parent
+        if stack["StackStatus"] != "DELETE_COMPLETE" and not stack.get("ParentId")
+    ]
+    for stack in stacks:
+        client.update_termination_protection(EnableTerminationProtection=False, StackName=stack["StackId"])
+        client.delete_stack(StackName=stack["StackId"])
+    waiter = client.get_waiter("stack_delete_complete")
+    for stack in stacks:
+        waiter.wait(StackName=stack["StackId"], WaiterConfig=_waiter_config())
+
+
+def _delete_autoscaling_groups(session, region):
+    client = session.client("autoscaling", region_name=region)
+    # Groups would replace the instances terminated next
+    for group in _paginate(client, "describe_auto_scaling_groups", "AutoScalingGroups"):
+        client.delete_auto_scaling_group(AutoScalingGroupName=group["AutoScalingGroupName"], ForceDelete=True)
+    _wait_until(lambda: not _paginate(client, "describe_auto_scaling_groups", "AutoScalingGroups"),
+                f"Auto Scaling groups in {region} to be deleted")
+
+
+def _terminate_ec2_instances(session, region):
+    client = session.client("ec2", region_name=region)
+    instance_ids = [
+        instance["InstanceId"]
+        for reservation in _paginate(client, "describe_instances", "Reservations")
+        for instance in reservation["Instances"]
+        if instance["State"]["Name"] != "terminated"
+    ]
+    if not instance_ids:
+        return
+    for instance_id in instance_ids:
+        client.modify_instance_attribute(InstanceId=instance_id, DisableApiTermination={"Value": False})
+    client.terminate_instances(InstanceIds=instance_ids)
+    client.get_waiter("instance_terminated").wait(InstanceIds=instance_ids, WaiterConfig=_waiter_config())
+
+
+def _delete_rds_databases(session, region):
+    client = session.client("rds", region_name=region)
+    instances = _paginate(client, "describe_db_instances", "DBInstances")
+    for instance in instances:
+        if instance.get("DeletionProtection"):
+            client.modify_db_instance(
+                DBInstanceIdentifier=instance["DBInstanceIdentifier"], DeletionProtection=False, ApplyImmediately=True
+            )
+        if instance["DBInstanceStatus"] != "deleting":
+            client.delete_db_instance(
+                DBInstanceIdentifier=instance["DBInstanceIdentifier"], SkipFinalSnapshot=True, DeleteAutomatedBackups=True
+            )
+    waiter = client.get_waiter("db_instance_deleted")
+    for instance in instances:
+        waiter.wait(DBInstanceIdentifier=instance["DBInstanceIdentifier"], WaiterConfig=_waiter_config())
+
+    clusters = _paginate(client, "describe_db_clusters", "DBClusters")
+    for cluster in clusters:
+        if cluster.get("DeletionProtection"):
+            client.modify_db_cluster(
+                DBClusterIdentifier=cluster["DBClusterIdentifier"], DeletionProtection=False, ApplyImmediately=True
+            )
+        if cluster["Status"] != "deleting":
+            client.delete_db_cluster(DBClusterIdentifier=cluster["DBClusterIdentifier"], SkipFinalSnapshot=True)
+    waiter = client.get_waiter("db_cluster_deleted")
+    for cluster in clusters:
+        waiter.wait(DBClusterIdentifier=cluster["DBClusterIdentifier"], WaiterConfig=_waiter_config())
+
+    for snapshot in _paginate(client, "describe_db_snapshots", "DBSnapshots", SnapshotType="manual"):
+        client.delete_db_snapshot(DBSnapshotIdentifier=snapshot["DBSnapshotIdentifier"])
+    for snapshot in _paginate(client, "describe_db_cluster_snapshots", "DBClusterSnapshots", SnapshotType="manual"):
+        client.delete_db_cluster_snapshot(DBClusterSnapshotIdentifier=snapshot["DBClusterSnapshotIdentifier"])
+    for subnet_group in _paginate(client, "describe_db_subnet_groups", "DBSubnetGroups"):
+        if subnet_group["DBSubnetGroupName"] != "default":
+            client.delete_db_subnet_group(DBSubnetGroupName=subnet_group["DBSubnetGroupName"])
+
+
+def _delete_load_balancers(session, region):
+    client = session.client("elbv2", region_name=region)
+    load_balancer_arns = [
+        load_balancer["LoadBalancerArn"] for load_balancer in _paginate(client, "describe_load_balancers", "LoadBalancers")
+    ]
+    for arn in load_balancer_arns:
+        client.modify_load_balancer_attributes(
+            LoadBalancerArn=arn, Attributes=[{"Key": "deletion_protection.enabled", "Value": "false"}]
+        )
+        client.delete_load_balancer(LoadBalancerArn=arn)
+    if load_balancer_arns:
+        client.get_waiter("load_balancers_deleted").wait(LoadBalancerArns=load_balancer_arns, WaiterConfig=_waiter_config())
+    for target_group in _paginate(client, "describe_target_groups", "TargetGroups"):
+        client.delete_target_group(TargetGroupArn=target_group["TargetGroupArn"])
+
+
+def _delete_nat_gateways(session, region):
+    client = session.client("ec2", region_name=region)
+    nat_gateway_ids = [
+        nat_gateway["NatGatewayId"] for nat_gateway in _paginate(client, "describe_nat_gateways", "NatGateways")
+        if nat_gateway["State"] not in ("deleting", "deleted")
+    ]
+    for nat_gateway_id in nat_gateway_ids:
+        client.delete_nat_gateway(NatGatewayId=nat_gateway_id)
+    if nat_gateway_ids:
+        client.get_waiter("nat_gateway_deleted").wait(NatGatewayIds=nat_gateway_ids, WaiterConfig=_waiter_config())
+
+
+def _delete_lambda_functions(session, region):
+    client = session.client("lambda", region_name=region)
+    for function in _paginate(client, "list_functions", "Functions"):
+        client.delete_function(FunctionName=function["FunctionName"])
+
+
+def _delete_dynamodb_tables(session, region):
+    client = session.client("dynamodb", region_name=region)
+    table_names = _paginate(client, "list_tables", "TableNames")
+    for table_name in table_names:
+        client.update_table(TableName=table_name, DeletionProtectionEnabled=False)
+        client.delete_table(TableName=table_name)
+    waiter = client.get_waiter("table_not_exists")
+    for table_name in table_names:
+        waiter.wait(TableName=table_name, WaiterConfig=_waiter_config())
+
+
+def _delete_ecr_repositories(session, region):
+    client = session.client("ecr", region_name=region)
+    for repository in _paginate(client, "describe_repositories", "repositories"):
+        client.delete_repository(repositoryName=repository["repositoryName"], force=True)
+
+
+def _delete_cloudwatch_resources(session, region):
+    logs = session.client("logs", region_name=region)
+    for log_group in _paginate(logs, "describe_log_groups", "logGroups"):
+        logs.delete_log_group(logGroupName=log_group["logGroupName"])
+    cloudwatch = session.client("cloudwatch", region_name=region)
+    alarm_names = [
+        alarm["AlarmName"]
+        for page in cloudwatch.get_paginator("describe_alarms").paginate(AlarmTypes=["CompositeAlarm", "MetricAlarm"])
+        for alarm in page["MetricAlarms"] + page["CompositeAlarms"]
+    ]
+    for start in range(0, len(alarm_names), 100):
+        cloudwatch.delete_alarms(AlarmNames=alarm_names[start:start + 100])
+    dashboard_names = [dashboard["DashboardName"] for dashboard in _paginate(cloudwatch, "list_dashboards", "DashboardEntries")]
+    if dashboard_names:
+        cloudwatch.delete_dashboards(DashboardNames=dashboard_names)
+
+
+def _delete_kms_keys(session, region):
+    client = session.client("kms", region_name=region)
+    for alias in _paginate(client, "list_aliases", "Aliases"):
+        if not alias["AliasName"].startswith("alias/aws/"):
+            client.delete_alias(AliasName=alias["AliasName"])
+    for key in _paginate(client, "list_keys", "Keys"):
+        metadata = client.describe_key(KeyId=key["KeyId"])["KeyMetadata"]
+        if metadata["KeyManager"] != "CUSTOMER" or metadata["KeyState"] in ("PendingDeletion", "PendingReplicaDeletion"):
+            continue
+        # Keys can't be deleted at once; disabled, they can't be used meanwhile
+        if metadata["KeyState"] == "Enabled":
+            client.disable_key(KeyId=key["KeyId"])
+        client.schedule_key_deletion(KeyId=key["KeyId"], PendingWindowInDays=7)
+
+
+def _delete_ebs_resources(session, region):
+    client = session.client("ec2", region_name=region)
+    # AMIs first, their snapshots can't be deleted while registered
+    for image in client.describe_images(Owners=["self"])["Images"]:
+        client.deregister_image(ImageId=image["ImageId"])
+    for snapshot in _paginate(client, "describe_snapshots", "Snapshots", OwnerIds=["self"]):
+        client.delete_snapshot(SnapshotId=snapshot["SnapshotId"])
+    volume_ids = [volume["VolumeId"] for volume in _paginate(client, "describe_volumes", "Volumes")]
+    for volume_id in volume_ids:
+        client.delete_volume(VolumeId=volume_id)
+    if volume_ids:
+        client.get_waiter("volume_deleted").wait(VolumeIds=volume_ids, WaiterConfig=_waiter_config())
+
+
+def _release_elastic_ips(session, region):
+    client = session.client("ec2", region_name=region)
+    for address in client.describe_addresses()["Addresses"]:
+        if "AssociationId" in address:
+            client.disassociate_address(AssociationId=address["AssociationId"])
+        client.release_address(AllocationId=address["AllocationId"])
+
+
+def _delete_vpcs(session, region):
+    client = session.client("ec2", region_name=region)
+    vpcs = _paginate(client, "describe_vpcs", "Vpcs")
+    vpc_ids = [vpc["VpcId"] for vpc in vpcs if not vpc["IsDefault"]]
+
+    # Security groups of every VPC, the default VPC included; rules first since groups can refer to each other
+    security_groups = [group for group in _paginate(client, "describe_security_groups", "SecurityGroups")
+                       if group["GroupName"] != "default"]
+    for group in security_groups:
+        if group["IpPermissions"]:
+            client.revoke_security_group_ingress(GroupId=group["GroupId"], IpPermissions=group["IpPermissions"])
+        if group["IpPermissionsEgress"]:
+            client.revoke_security_group_egress(GroupId=group["GroupId"], IpPermissions=group["IpPermissionsEgress"])
+    for group in security_groups:
+        client.delete_security_group(GroupId=group["GroupId"])
+    if not vpc_ids:
+        return
+
+    vpc_filter = [{"Name": "vpc-id", "Values": vpc_ids}]
+    endpoint_ids = [endpoint["VpcEndpointId"] for endpoint in _paginate(client, "describe_vpc_endpoints", "VpcEndpoints", Filters=vpc_filter)]
+    if endpoint_ids:
+        client.delete_vpc_endpoints(VpcEndpointIds=endpoint_ids)
+    for connection in _paginate(client, "describe_vpc_peering_connections", "VpcPeeringConnections"):
+        if connection["Status"]["Code"] not in ("deleted", "deleting", "rejected", "failed", "expired"):
+            client.delete_vpc_peering_connection(VpcPeeringConnectionId=connection["VpcPeeringConnectionId"])
+    for interface in _paginate(client, "describe_network_interfaces", "NetworkInterfaces", Filters=vpc_filter):
+        if interface["Status"] == "available":
+            client.delete_network_interface(NetworkInterfaceId=interface["NetworkInterfaceId"])
+    for gateway in _paginate(client, "describe_internet_gateways", "InternetGateways", Filters=[{"Name": "attachment.vpc-id", "Values": vpc_ids}]):
+        for attachment in gateway["Attachments"]:
+            client.detach_internet_gateway(InternetGatewayId=gateway["InternetGatewayId"], VpcId=attachment["VpcId"])
+        client.delete_internet_gateway(InternetGatewayId=gateway["InternetGatewayId"])
+    for gateway in _paginate(client, "describe_egress_only_internet_gateways", "EgressOnlyInternetGateways"):
+        if any(attachment["VpcId"] in vpc_ids for attachment in gateway.get("Attachments", [])):
+            client.delete_egress_only_internet_gateway(EgressOnlyInternetGatewayId=gateway["EgressOnlyInternetGatewayId"])
+    for subnet in _paginate(client, "describe_subnets", "Subnets", Filters=vpc_filter):
+        client.delete_subnet(SubnetId=subnet["SubnetId"])
+    for route_table in _paginate(client, "describe_route_tables", "RouteTables", Filters=vpc_filter):
+        if not any(association.get("Main") for association in route_table["Associations"]):
+            client.delete_route_table(RouteTableId=route_table["RouteTableId"])
+    for network_acl in _paginate(client, "describe_network_acls", "NetworkAcls", Filters=vpc_filter):
+        if not network_acl["IsDefault"]:
+            client.delete_network_acl(NetworkAclId=network_acl["NetworkAclId"])
+    for vpc_id in vpc_ids:
+        client.delete_vpc(VpcId=vpc_id)
+
+
+# Cleanup of one region, in dependency order
+_REGIONAL_CLEANUP_STEPS = [
+    ("cloudformation", _delete_cloudformation_stacks),
+    ("autoscaling", _delete_autoscaling_groups),
+    ("ec2", _terminate_ec2_instances),
+    ("rds", _delete_rds_databases),
+    ("elbv2", _delete_load_balancers),
+    ("nat gateways", _delete_nat_gateways),
+    ("lambda", _delete_lambda_functions),
+    ("dynamodb", _delete_dynamodb_tables),
+    ("ecr", _delete_ecr_repositories),
+    ("cloudwatch", _delete_cloudwatch_resources),
+    ("kms", _delete_kms_keys),
+    ("ebs", _delete_ebs_resources),
+    ("elastic ips", _release_elastic_ips),
+    ("vpc", _delete_vpcs),
+]
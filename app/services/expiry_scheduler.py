@@ -0,0 +1,444 @@
+import heapq
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, UTC
+from typing import Callable, Dict, NamedTuple, Optional
+
+from app.core.config import get_config
+from app.services.gcp_sandbox import GCPSandboxService
+from app.services.lifecycle_journal import record_lifecycle_event
+
+config = get_config()
+
+_EXTENDED_TASK_SUFFIX = re.compile(r"-extended-\d+$")
+
+
+class ScheduledExpiry(NamedTuple):
+    """A pending sandbox deletion as listed by an expiry scheduler."""
+    project_id: str
+    expires_at: datetime
+    # Backend handle of the deletion, e.g. the Cloud Task ID
+    task_id: Optional[str] = None
+
+
+class ExpiryScheduler(ABC):
+    """
+    Schedules the automatic deletion of sandbox projects once they expire.
+    """
+
+    # Names of the circuit-broken APIs that `schedule` depends on
+    required_apis = ()
+
+    def start(self):
+        """Starts any background work needed by the backend."""
+
+    def stop(self):
+        """Stops any background work started by `start`."""
+
+    @abstractmethod
+    def schedule(self, project_id, expires_at):
+        """
+        Schedules the deletion of a sandbox project.
+
+        Args:
+            project_id (str): The ID of the project to be deleted.
+            expires_at (datetime): The UTC time at which the project should be deleted.
+
+        Returns:
+            datetime: The scheduled deletion time.
+        """
+
+    @abstractmethod
+    def extend(self, project_id, extend_by_hours):
+        """
+        Pushes the scheduled deletion of a sandbox project further into the future.
+
+        Args:
+            project_id (str): The ID of the project to be extended.
+            extend_by_hours (int): Number of hours to add to the current expiry.
+
+        Returns:
+            datetime: The new scheduled deletion time.
+        """
+
+    @abstractmethod
+    def list_scheduled(self) -> Dict[str, ScheduledExpiry]:
+        """
+        Lists every pending sandbox deletion in a single read of the backend.
+
+        Returns:
+            dict: The scheduled expiries keyed by project ID.
+        """
+
+    @abstractmethod
+    def reschedule(self, scheduled, expires_at):
+        """
+        Moves a pending deletion returned by `list_scheduled` to a new time.
+
+        Args:
+            scheduled (ScheduledExpiry): The pending deletion.
+            expires_at (datetime): The new UTC deletion time.
+
+        Returns:
+            datetime: The new scheduled deletion time.
+        """
+
+    @abstractmethod
+    def forget(self, project_id):
+        """
+        Drops any bookkeeping for a project that has been deleted.
+
+        Args:
+            project_id (str): The ID of the deleted project.
+        """
+
+
+class CloudTasksExpiryScheduler(ExpiryScheduler):
+    """
+    Expiry scheduler backed by one Cloud Task per sandbox project on the deletion queue.
+    """
+
+    required_apis = ("tasks", "run")
+
+    def schedule(self, project_id, expires_at):
+        from google.protobuf.timestamp_pb2 import Timestamp
+
+        expiry_timestamp = Timestamp()
+        expiry_timestamp.FromDatetime(expires_at)
+        response = GCPSandboxService.create_deletion_task(project_id, project_id, expiry_timestamp)
+        return response.schedule_time
+
+    def extend(self, project_id, extend_by_hours):
+        try:
+            task_id = GCPSandboxService.list_cloud_tasks(project_id)
+        except Exception:
+            task_id = None
+        if task_id is None:
+            task_id = f"{config.CLOUD_TASKS_DELETION_QUEUE_ID}/tasks/{project_id}"
+
+        current_expiry = datetime.fromtimestamp(GCPSandboxService.get_cloud_task_expiry_time(task_id), UTC)
+        scheduled = ScheduledExpiry(project_id, current_expiry, task_id)
+        return self.reschedule(scheduled, current_expiry + timedelta(hours=extend_by_hours))
+
+    def list_scheduled(self):
+        scheduled = {}
+        for task_id, expiry_seconds in GCPSandboxService.list_deletion_tasks().items():
+            # Task names are the project ID, with a suffix once extended
+            project_id = _EXTENDED_TASK_SUFFIX.sub("", task_id.rsplit("/", 1)[-1])
+            if project_id not in scheduled:
+                scheduled[project_id] = ScheduledExpiry(project_id, datetime.fromtimestamp(expiry_seconds, UTC), task_id)
+        return scheduled
+
+    def reschedule(self, scheduled, expires_at):
+        from google.protobuf.timestamp_pb2 import Timestamp
+        from app.utils.logger import logger
+
+        new_expiry_timestamp_proto = Timestamp()
+        new_expiry_timestamp_proto.FromDatetime(expires_at)
+
+        # Delete old task
+        logger.info("Deleting task")
+        GCPSandboxService.delete_cloud_task(scheduled.task_id)
+        logger.info("Deleting task success")
+
+        # Create new task with updated expiry time. Cloud Tasks does not allow
+        # reusing the name of a recently deleted task, hence the suffix.
+        logger.info("Creating updated task with new expiry")
+        random_suffix = int(datetime.now(UTC).timestamp())
+        updated_task_name = f"{scheduled.project_id}-extended-{random_suffix}"
+        response = GCPSandboxService.create_deletion_task(scheduled.project_id, updated_task_name, new_expiry_timestamp_proto)
+        logger.info("Creating updated task with new expiry success")
+        return response.schedule_time
+
+    def forget(self, project_id):
+        # The queued task is what calls the delete endpoint, so there is nothing to clean up.
+        pass
+
+
+def delete_expired_projects(project_ids):
+    """
+    Unlinks billing from and deletes a batch of expired sandbox projects in parallel.
+
+    A project that no longer exists counts as deleted.
+
+    Args:
+        project_ids (list): The IDs of the expired projects.
+
+    Returns:
+        list: The IDs of the projects that could not be deleted.
+    """
+    from google.api_core.exceptions import NotFound
+    from app.utils.logger import logger
+
+    def delete_one(project_id):
+        try:
+            logger.info(f"Unlinking expired project {project_id} from associated billing account...")
+            GCPSandboxService.unlink_project_billing_info(project_id)
+            logger.info(f"Deleting expired project {project_id}...")
+            GCPSandboxService.delete_sandbox_project(project_id)
+            logger.info(f"Succssfully deleted expired Project {project_id}.")
+            record_lifecycle_event("expire", project_id)
+            return None
+        except NotFound:
+            # Deleted by an earlier attempt or outside the service; retrying would never succeed
+            logger.info(f"Expired project {project_id} no longer exists.")
+            record_lifecycle_event("expire", project_id)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to delete expired project {project_id}: {e}")
+            record_lifecycle_event("expire_failed", project_id, error=str(e))
+            return project_id
+
+    max_workers = max(1, min(len(project_ids), config.LOCAL_SCHEDULER_MAX_PARALLEL_DELETIONS))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(delete_one, project_ids))
+    return [project_id for project_id in results if project_id is not None]
+
+
+def extend_scheduled(scheduler, scheduled_expiries, extend_by_hours):
+    """
+    Extends a batch of pending sandbox deletions in parallel.
+
+    Args:
+        scheduler (ExpiryScheduler): The scheduler the expiries were listed from.
+        scheduled_expiries (list): The `ScheduledExpiry` entries to extend.
+        extend_by_hours (int): Number of hours to add to each current expiry.
+
+    Returns:
+        list: One `(project_id, new_expiry, error)` tuple per entry, in order, with either
+        the new scheduled deletion time or the exception that prevented the extension.
+    """
+    from app.utils.logger import logger
+
+    def extend_one(scheduled):
+        try:
+            new_expiry = scheduler.reschedule(scheduled, scheduled.expires_at + timedelta(hours=extend_by_hours))
+            return scheduled.project_id, new_expiry, None
+        except Exception as e:
+            logger.error(f"Failed to extend expiry of project {scheduled.project_id}: {e}")
+            return scheduled.project_id, None, e
+
+    if not scheduled_expiries:
+        return []
+    max_workers = max(1, min(len(scheduled_expiries), config.BATCH_EXTEND_MAX_PARALLEL))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(extend_one, scheduled_expiries))
+
+
+class LocalExpiryScheduler(ExpiryScheduler):
+    """
+    In-process expiry scheduler persisted to a SQLite database.
+
+    Pending expiries are kept in a min-heap keyed on expiry time, with the database
+    as the source of truth across restarts. Rescheduling pushes a new heap entry and
+    lazily discards the stale one, so extend is O(log n). Projects are never deleted
+    before their expiry: the scheduler wakes up `batch_window_seconds` after the first
+    project comes due and deletes everything due by then as one batch, so deletions
+    run at most that late. A failed deletion is retried after `retry_delay_seconds`,
+    `max_attempts` times in total (counted since the process started); after that the
+    project is unscheduled and has to be deleted by hand.
+
+    Only one instance of the service should run this backend against a given database,
+    and the database must live on persistent storage (see LOCAL_SCHEDULER_DB_PATH).
+    """
+
+    def __init__(self, db_path, batch_window_seconds=5, retry_delay_seconds=300, max_attempts=5,
+                 on_expire: Optional[Callable[[list], list]] = None):
+        self.db_path = db_path
+        self.batch_window = timedelta(seconds=batch_window_seconds)
+        self.retry_delay = timedelta(seconds=retry_delay_seconds)
+        self.max_attempts = max_attempts
+        self.on_expire = on_expire or delete_expired_projects
+
+        self._condition = threading.Condition()
+        self._heap = []
+        self._expiries = {}
+        # Failed deletion attempts per project since its expiry was last set by a caller
+        self._attempts = {}
+        self._thread = None
+        self._stopping = False
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sandbox_expiries ("
+            "project_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        for project_id, expires_at in self._db.execute("SELECT project_id, expires_at FROM sandbox_expiries"):
+            self._expiries[project_id] = expires_at
+            self._heap.append((expires_at, project_id))
+        heapq.heapify(self._heap)
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="local-expiry-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        thread.join()
+        self._thread = None
+
+    def _set_expiry(self, project_id, expires_at):
+        # Caller must hold self._condition
+        seconds = expires_at.timestamp()
+        self._db.execute(
+            "INSERT INTO sandbox_expiries (project_id, expires_at) VALUES (?, ?) "
+            "ON CONFLICT(project_id) DO UPDATE SET expires_at = excluded.expires_at",
+            (project_id, seconds)
+        )
+        self._db.commit()
+        self._expiries[project_id] = seconds
+        heapq.heappush(self._heap, (seconds, project_id))
+        self._condition.notify_all()
+
+    def schedule(self, project_id, expires_at):
+        with self._condition:
+            self._attempts.pop(project_id, None)
+            self._set_expiry(project_id, expires_at)
+        return expires_at
+
+    def get_expiry(self, project_id):
+        """
+        Returns the scheduled deletion time of a project.
+
+        Args:
+            project_id (str): The ID of the project.
+
+        Returns:
+            datetime: The scheduled deletion time, or None if the project is not scheduled.
+        """
+        with self._condition:
+            seconds = self._expiries.get(project_id)
+        return datetime.fromtimestamp(seconds, UTC) if seconds is not None else None
+
+    def extend(self, project_id, extend_by_hours):
+        with self._condition:
+            seconds = self._expiries.get(project_id)
+            if seconds is None:
+                raise KeyError(f"No scheduled expiry found for project {project_id}")
+            new_expiry = datetime.fromtimestamp(seconds, UTC) + timedelta(hours=extend_by_hours)
+            self._attempts.pop(project_id, None)
+            self._set_expiry(project_id, new_expiry)
+        return new_expiry
+
+    def list_scheduled(self):
+        with self._condition:
+            return {
+                project_id: ScheduledExpiry(project_id, datetime.fromtimestamp(seconds, UTC))
+                for project_id, seconds in self._expiries.items()
+            }
+
+    def reschedule(self, scheduled, expires_at):
+        with self._condition:
+            if scheduled.project_id not in self._expiries:
+                raise KeyError(f"No scheduled expiry found for project {scheduled.project_id}")
+            self._attempts.pop(scheduled.project_id, None)
+            self._set_expiry(scheduled.project_id, expires_at)
+        return expires_at
+
+    def forget(self, project_id):
+        with self._condition:
+            self._unschedule(project_id)
+            self._db.commit()
+
+    def _unschedule(self, project_id):
+        # Caller must hold self._condition and commit
+        self._attempts.pop(project_id, None)
+        if self._expiries.pop(project_id, None) is not None:
+            self._db.execute("DELETE FROM sandbox_expiries WHERE project_id = ?", (project_id,))
+
+    def _pop_due_batch(self, now):
+        # Caller must hold self._condition
+        batch = []
+        while self._heap and self._heap[0][0] <= now.timestamp():
+            seconds, project_id = heapq.heappop(self._heap)
+            # Skip entries superseded by a later reschedule or removed by forget
+            if self._expiries.get(project_id) == seconds:
+                batch.append(project_id)
+        return batch
+
+    def _next_wait_seconds(self, now):
+        # Caller must hold self._condition
+        while self._heap and self._expiries.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        # Wait out the batch window so projects due right after the first join its batch
+        return max(0.0, self._heap[0][0] + self.batch_window.total_seconds() - now.timestamp())
+
+    def _run(self):
+        from app.utils.logger import logger
+
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    now = datetime.now(UTC)
+                    wait_seconds = self._next_wait_seconds(now)
+                    if wait_seconds == 0.0:
+                        break
+                    self._condition.wait(timeout=wait_seconds)
+                if self._stopping:
+                    return
+                batch = self._pop_due_batch(datetime.now(UTC))
+            if not batch:
+                continue
+
+            logger.info(f"Deleting {len(batch)} expired sandbox projects: {batch}")
+            try:
+                failed = set(self.on_expire(batch))
+            except Exception as e:
+                logger.error(f"Expired sandbox deletion batch failed: {e}")
+                failed = set(batch)
+
+            now = datetime.now(UTC)
+            with self._condition:
+                for project_id in batch:
+                    if project_id not in failed:
+                        # The project is gone, even if it was extended while being deleted
+                        self._unschedule(project_id)
+                        continue
+                    # Leave alone projects that were extended or forgotten meanwhile
+                    seconds = self._expiries.get(project_id)
+                    if seconds is None or seconds > now.timestamp():
+                        continue
+                    attempts = self._attempts.get(project_id, 0) + 1
+                    if attempts >= self.max_attempts:
+                        logger.error(f"Giving up on deleting expired project {project_id} after {attempts} attempts, delete it manually.")
+                        self._unschedule(project_id)
+                    else:
+                        self._attempts[project_id] = attempts
+                        self._set_expiry(project_id, now + self.retry_delay)
+                self._db.commit()
+
+
+_scheduler_instance: Optional[ExpiryScheduler] = None
+
+def get_expiry_scheduler() -> ExpiryScheduler:
+    """Get the singleton expiry scheduler for the configured backend."""
+    global _scheduler_instance
+    if _scheduler_instance is None:
+        backend = config.EXPIRY_SCHEDULER_BACKEND
+        if backend == "cloud_tasks":
+            _scheduler_instance = CloudTasksExpiryScheduler()
+        elif backend == "local":
+            _scheduler_instance = LocalExpiryScheduler(
+                config.LOCAL_SCHEDULER_DB_PATH,
+                batch_window_seconds=config.LOCAL_SCHEDULER_BATCH_WINDOW_SECONDS,
+                retry_delay_seconds=config.LOCAL_SCHEDULER_RETRY_DELAY_SECONDS,
+                max_attempts=config.LOCAL_SCHEDULER_MAX_ATTEMPTS
+            )
+        else:
+            raise ValueError(f"Unknown EXPIRY_SCHEDULER_BACKEND {backend}. Must be one of 'cloud_tasks', 'local'")
+    return _scheduler_instance
@@ -0,0 +1,211 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, UTC
+from types import SimpleNamespace
+
+from app.core.circuit_breaker import guarded_by
+from app.core.config import get_config
+from app.services.gcp_sandbox import GCPSandboxService
+
+config = get_config()
+
+# The circuit-broken API each GCPSandboxService method talks to
+SERVICE_METHOD_APIS = {
+    "create_sandbox_project": "resource_manager",
+    "set_sandbox_users_iam_role": "resource_manager",
+    "get_sandbox_iam_policy": "resource_manager",
+    "set_sandbox_iam_policy": "resource_manager",
+    "update_project_billing_info": "billing",
+    "unlink_project_billing_info": "billing",
+    "delete_sandbox_project": "resource_manager",
+    "create_deletion_task": "tasks",
+    "list_active_projects": "resource_manager",
+    "get_cloud_task_expiry_time": "tasks",
+    "delete_cloud_task": "tasks",
+    "list_cloud_tasks": "tasks",
+    "list_deletion_tasks": "tasks",
+    "list_folder_projects": "resource_manager",
+}
+
+
+class FakeGCPSandboxService:
+    """
+    In-memory stand-in for `GCPSandboxService` used for replay and benchmarks.
+
+    Keeps projects, IAM policies and deletion tasks in dictionaries and returns objects
+    with the attributes the endpoints read. Every call first sleeps for the latency
+    returned by `latency_for(api)`, in milliseconds, so recorded Google Cloud latencies
+    can be reproduced. Errors mirror the google.api_core exceptions the real clients raise.
+    """
+
+    def __init__(self, latency_for=None):
+        self.latency_for = latency_for or (lambda api: 0)
+        self._lock = threading.Lock()
+        self.projects = {}
+        self.policies = {}
+        self.tasks = {}
+        self._service_url_resolved = False
+
+    def _wait(self, api):
+        latency_ms = self.latency_for(api)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+    def seed_project(self, project_id, folder_id, display_name=None):
+        """Registers a project that existed before the stand-in was started."""
+        with self._lock:
+            self.projects[project_id] = SimpleNamespace(
+                project_id=project_id,
+                name=f"projects/{project_id}",
+                parent=folder_id,
+                display_name=display_name or project_id,
+                create_time=datetime.now(UTC)
+            )
+
+    def create_sandbox_project(self, project_id, folder_id):
+        from google.api_core.exceptions import AlreadyExists
+
+        self._wait("resource_manager")
+        with self._lock:
+            if project_id in self.projects:
+                raise AlreadyExists(f"Project {project_id} already exists")
+        self.seed_project(project_id, folder_id)
+        return self.projects[project_id]
+
+    def set_sandbox_users_iam_role(self, user_emails, sandbox_project_id):
+        from google.iam.v1 import policy_pb2
+
+        self._wait("resource_manager")
+        policy_object = policy_pb2.Policy(
+            bindings=[policy_pb2.Binding(role="roles/owner", members=[f"user:{user_email}" for user_email in user_emails])],
+            version=3,
+            etag=b"1"
+        )
+        with self._lock:
+            self.policies[sandbox_project_id] = policy_object
+        return policy_object
+
+    def get_sandbox_iam_policy(self, sandbox_project_id):
+        from google.iam.v1 import policy_pb2
+
+        self._wait("resource_manager")
+        policy_object = policy_pb2.Policy()
+        with self._lock:
+            policy_object.CopyFrom(self.policies.get(sandbox_project_id, policy_pb2.Policy(version=3, etag=b"0")))
+        return policy_object
+
+    def set_sandbox_iam_policy(self, sandbox_project_id, policy_object):
+        from google.api_core.exceptions import Aborted
+        from google.iam.v1 import policy_pb2
+
+        self._wait("resource_manager")
+        with self._lock:
+            current = self.policies.get(sandbox_project_id, policy_pb2.Policy(version=3, etag=b"0"))
+            if policy_object.etag and policy_object.etag != current.etag:
+                raise Aborted(f"Concurrent policy changes on {sandbox_project_id}")
+            stored = policy_pb2.Policy()
+            stored.CopyFrom(policy_object)
+            stored.etag = str(int(current.etag or b"0") + 1).encode()
+            self.policies[sandbox_project_id] = stored
+        return stored
+
+    def update_project_billing_info(self, project_id):
+        self._wait("billing")
+        return SimpleNamespace(name=f"projects/{project_id}/billingInfo", billing_enabled=True)
+
+    def unlink_project_billing_info(self, project_id):
+        self._wait("billing")
+        return SimpleNamespace(name=f"projects/{project_id}/billingInfo", billing_enabled=False)
+
+    def delete_sandbox_project(self, project_id):
+        from google.api_core.exceptions import NotFound
+
+        self._wait("resource_manager")
+        with self._lock:
+            project = self.projects.pop(project_id, None)
+            self.policies.pop(project_id, None)
+        if project is None:
+            raise NotFound(f"Project {project_id} not found")
+        project.delete_time = datetime.now(UTC)
+        return project
+
+    def create_deletion_task(self, project_id, task_name, expiry_timestamp):
+        from google.api_core.exceptions import AlreadyExists
+
+        # The real call looks up the Cloud Run service URL before its first task
+        if not self._service_url_resolved:
+            self._wait("run")
+            self._service_url_resolved = True
+        self._wait("tasks")
+        name = f"{config.CLOUD_TASKS_DELETION_QUEUE_ID}/tasks/{task_name}"
+        task = SimpleNamespace(name=name, schedule_time=expiry_timestamp.ToDatetime(tzinfo=UTC))
+        with self._lock:
+            if name in self.tasks:
+                raise AlreadyExists(f"Task {name} already exists")
+            self.tasks[name] = task
+        return task
+
+    def list_active_projects(self, user_email_prefix, folder_ids):
+        self._wait("resource_manager")
+        with self._lock:
+            return {
+                project_id for project_id, project in self.projects.items()
+                if project.parent in folder_ids and user_email_prefix in project.display_name
+            }
+
+    def get_cloud_task_expiry_time(self, task_id):
+        from google.api_core.exceptions import NotFound
+
+        self._wait("tasks")
+        with self._lock:
+            task = self.tasks.get(task_id)
+        if task is None:
+            raise NotFound(f"Task {task_id} not found")
+        return int(task.schedule_time.timestamp())
+
+    def delete_cloud_task(self, task_id):
+        from google.api_core.exceptions import NotFound
+
+        self._wait("tasks")
+        with self._lock:
+            task = self.tasks.pop(task_id, None)
+        if task is None:
+            raise NotFound(f"Task {task_id} not found")
+        return task
+
+    def list_cloud_tasks(self, project_id):
+        self._wait("tasks")
+        with self._lock:
+            for name in self.tasks:
+                if project_id in name:
+                    return name
+        return None
+
+    def list_deletion_tasks(self):
+        self._wait("tasks")
+        with self._lock:
+            return {name: int(task.schedule_time.timestamp()) for name, task in self.tasks.items()}
+
+    def list_folder_projects(self, folder_id):
+        self._wait("resource_manager")
+        with self._lock:
+            return {project_id for project_id, project in self.projects.items() if project.parent == folder_id}
+
+    @contextmanager
+    def installed(self):
+        """
+        Temporarily routes every `GCPSandboxService` call to this stand-in.
+
+        Each stand-in method is wrapped in the circuit breaker of its API, like the real
+        methods, so breaker state, metrics and captured API latencies behave the same.
+        """
+        originals = {name: GCPSandboxService.__dict__[name] for name in SERVICE_METHOD_APIS}
+        for name, api in SERVICE_METHOD_APIS.items():
+            setattr(GCPSandboxService, name, staticmethod(guarded_by(api)(getattr(self, name))))
+        try:
+            yield self
+        finally:
+            for name, original in originals.items():
+                setattr(GCPSandboxService, name, original)
+
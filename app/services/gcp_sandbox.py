@@ -1,10 +1,18 @@
 # Lazy imports for Google Cloud SDK to improve startup performance
+import threading
+
 from app.core.config import get_config
+from app.core.circuit_breaker import get_circuit_breaker, guarded_by
 config = get_config()
 
+# URL of this service on Cloud Run, looked up on first use
+_cloud_run_service_url = None
+_cloud_run_service_url_lock = threading.Lock()
+
 
 class GCPSandboxService:
     @staticmethod
+    @guarded_by("resource_manager")
     def create_sandbox_project(project_id, folder_id):
         """
         Creates a new Google Cloud Sandbox project with the given project_id and folder_id.
@@ -36,6 +44,7 @@ class GCPSandboxService:
         return response
 
     @staticmethod
+    @guarded_by("resource_manager")
     def set_sandbox_users_iam_role(user_emails, sandbox_project_id):
         """
         Set the IAM policy for a sandbox project to have the specified users as owners.
@@ -83,6 +92,64 @@ class GCPSandboxService:
         return response
 
     @staticmethod
+    @guarded_by("resource_manager")
+    def get_sandbox_iam_policy(sandbox_project_id):
+        """
+        Retrieves the current IAM policy of a sandbox project, including its etag.
+
+        Args:
+            sandbox_project_id (str): The ID of the sandbox project.
+
+        Returns:
+            policy_pb2.Policy: The current IAM policy for the project.
+        """
+        # Lazy imports to avoid startup overhead
+        from google.cloud import resourcemanager_v3
+        from google.iam.v1 import options_pb2
+
+        client = resourcemanager_v3.ProjectsClient()
+
+        response = client.get_iam_policy(
+            request={
+                "resource": f"projects/{sandbox_project_id}",
+                "options": options_pb2.GetPolicyOptions(requested_policy_version=3)
+            }
+        )
+
+        return response
+
+    @staticmethod
+    @guarded_by("resource_manager")
+    def set_sandbox_iam_policy(sandbox_project_id, policy_object):
+        """
+        Writes an IAM policy to a sandbox project.
+
+        The write is rejected with `google.api_core.exceptions.Aborted` if the policy's
+        etag no longer matches the project's current policy.
+
+        Args:
+            sandbox_project_id (str): The ID of the sandbox project.
+            policy_object (policy_pb2.Policy): The policy to write, as read by `get_sandbox_iam_policy`.
+
+        Returns:
+            policy_pb2.Policy: The new IAM policy for the project.
+        """
+        # Lazy import to avoid startup overhead
+        from google.cloud import resourcemanager_v3
+
+        client = resourcemanager_v3.ProjectsClient()
+
+        response = client.set_iam_policy(
+            request={
+                "resource": f"projects/{sandbox_project_id}",
+                "policy": policy_object
+            }
+        )
+
+        return response
+
+    @staticmethod
+    @guarded_by("billing")
     def update_project_billing_info(project_id):
         """
         Links a Google Cloud Project with the given project_id to a billing account.
@@ -112,6 +179,7 @@ class GCPSandboxService:
         return response
 
     @staticmethod
+    @guarded_by("billing")
     def unlink_project_billing_info(project_id):
         """
         Unlinks a Google Cloud Project with the given project_id from its associated billing account.
@@ -140,6 +208,7 @@ class GCPSandboxService:
         return response
 
     @staticmethod
+    @guarded_by("resource_manager")
     def delete_sandbox_project(project_id):
         """
         Deletes a Google Cloud Project with the given project_id.
@@ -167,6 +236,29 @@ class GCPSandboxService:
         # Handle the response
         return response
 
+    @staticmethod
+    def get_cloud_run_service_url():
+        """
+        Returns the URL of this service on Cloud Run, which the deletion tasks call back.
+
+        The URL is fixed for the lifetime of the service, so it is looked up once per process
+        rather than for every task created.
+
+        Returns:
+            str: The service URL.
+        """
+        global _cloud_run_service_url
+        with _cloud_run_service_url_lock:
+            if _cloud_run_service_url is None:
+                # Lazy import to avoid startup overhead
+                from google.cloud import run_v2
+
+                cloud_run_client = run_v2.ServicesClient()
+                _cloud_run_service_url = get_circuit_breaker("run").call(
+                    cloud_run_client.get_service,
+                    request=run_v2.GetServiceRequest(name=config.CLOUDRUN_SERVICE_ID)).uri
+            return _cloud_run_service_url
+
     @staticmethod
     def create_deletion_task(project_id, task_name, expiry_timestamp):
         """
@@ -181,12 +273,10 @@ class GCPSandboxService:
             tasks_v2.types.Task: The task object returned from the API.
         """
         # Lazy imports to avoid startup overhead
-        from google.cloud import tasks_v2, run_v2
+        from google.cloud import tasks_v2
         
         client = tasks_v2.CloudTasksClient()
-        cloud_run_client = run_v2.ServicesClient()
-        cloud_run_service_url = cloud_run_client.get_service(
-            request=run_v2.GetServiceRequest(name=config.CLOUDRUN_SERVICE_ID)).uri
+        cloud_run_service_url = GCPSandboxService.get_cloud_run_service_url()
 
         cloud_tasks_queue_id = config.CLOUD_TASKS_DELETION_QUEUE_ID
 
@@ -210,28 +300,55 @@ class GCPSandboxService:
         )
 
         # Make the request
-        response = client.create_task(request=request)
+        response = get_circuit_breaker("tasks").call(client.create_task, request=request)
 
         # Handle the response
         return response
 
     @staticmethod
-    def get_total_active_projects(user_email_prefix, folder_ids):
+    @guarded_by("resource_manager")
+    def list_folder_projects(folder_id):
         """
-        Counts the total number of active projects across multiple folders belonging to a specific user.
+        Lists the IDs of the active projects in a folder.
+
+        Args:
+            folder_id (str): The ID of the folder to list.
+
+        Returns:
+            set: The IDs of the projects in the folder.
+        """
+        # Lazy import to avoid startup overhead
+        from google.cloud import resourcemanager_v3
+
+        client = resourcemanager_v3.ProjectsClient()
+
+        # Initialize request argument(s)
+        request = resourcemanager_v3.ListProjectsRequest(parent=folder_id)
+
+        # Make the request
+        page_result = client.list_projects(request=request)
+
+        # Handle the response
+        return {project.project_id for project in page_result}
+
+    @staticmethod
+    @guarded_by("resource_manager")
+    def list_active_projects(user_email_prefix, folder_ids):
+        """
+        Lists the active projects across multiple folders belonging to a specific user.
 
         Args:
             user_email_prefix (str): The prefix of the user's email address.
             folder_ids (list): A list of folder IDs to search for projects.
 
         Returns:
-            int: The total count of active projects across all folders.
+            set: The IDs of the user's active projects across all folders.
         """
         # Lazy import to avoid startup overhead
         from google.cloud import resourcemanager_v3
-        
+
         client = resourcemanager_v3.ProjectsClient()
-        total_project_count = 0
+        project_ids = set()
 
         for folder_id in folder_ids:
             # Initialize request argument(s)
@@ -240,14 +357,15 @@ class GCPSandboxService:
             # Make the request
             page_result = client.list_projects(request=request)
 
-            # Count matching projects in the folder
+            # Collect matching projects in the folder
             for project in page_result:
                 if user_email_prefix in project.display_name:  # Adjust filtering logic as needed
-                    total_project_count += 1
+                    project_ids.add(project.project_id)
 
-        return total_project_count
+        return project_ids
 
     @staticmethod
+    @guarded_by("tasks")
     def get_cloud_task_expiry_time(task_id):
         """
         Retrieves the scheduled time of a Cloud Task.
@@ -275,6 +393,7 @@ class GCPSandboxService:
         return int(response.schedule_time.timestamp())
 
     @staticmethod
+    @guarded_by("tasks")
     def delete_cloud_task(task_id):
         """
         Deletes a Cloud Task with the given task_id.
@@ -301,6 +420,7 @@ class GCPSandboxService:
         return response
 
     @staticmethod
+    @guarded_by("tasks")
     def list_cloud_tasks(project_id):
         """
         Retrieves the Cloud Task ID of a task scheduled to delete a sandbox project
@@ -330,3 +450,30 @@ class GCPSandboxService:
         for response in page_result:
             if project_id in response.name:
                 return response.name
+
+    @staticmethod
+    @guarded_by("tasks")
+    def list_deletion_tasks():
+        """
+        Lists every task on the deletion queue in a single queue read.
+
+        Returns:
+            dict: The scheduled time of each task as a Unix timestamp, keyed by task ID.
+        """
+        # Lazy import to avoid startup overhead
+        from google.cloud import tasks_v2
+
+        client = tasks_v2.CloudTasksClient()
+        cloud_tasks_queue_id = config.CLOUD_TASKS_DELETION_QUEUE_ID
+
+        # Initialize request argument(s)
+        request = tasks_v2.ListTasksRequest(
+            parent=cloud_tasks_queue_id,
+            page_size=1000
+        )
+
+        # Make the request
+        page_result = client.list_tasks(request=request)
+
+        # Handle the response
+        return {task.name: int(task.schedule_time.timestamp()) for task in page_result}
@@ -0,0 +1,181 @@
+import threading
+import time
+from typing import Optional
+
+from app.core.config import get_config
+from app.services.gcp_sandbox import GCPSandboxService
+
+config = get_config()
+
+
+class LastMemberError(ValueError):
+    """Raised when a change would leave a protected role, e.g. the project owners, without members."""
+
+
+class _PendingPolicyUpdate:
+    def __init__(self):
+        self.changes = []
+        self.errors = []
+        # Set once the previous write to the project has finished and this batch may be written
+        self.turn = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _ProjectWrites:
+    def __init__(self):
+        self.writing = False
+        self.next_batch = None
+
+
+def apply_membership_changes(policy_object, changes, protected_roles=()):
+    """
+    Applies membership changes to an IAM policy in place.
+
+    Only unconditional bindings are touched. Changes are applied in order, so a later
+    removal wins over an earlier addition of the same member and vice versa. A change
+    that would leave a protected role without members is skipped.
+
+    Args:
+        policy_object (policy_pb2.Policy): The policy to modify.
+        changes (list): A list of `(role, add_members, remove_members)` tuples.
+        protected_roles (tuple): Roles that must keep at least one member.
+
+    Returns:
+        list: For each change, None if it was applied or the `LastMemberError` it was skipped with.
+    """
+    errors = []
+    for role, add_members, remove_members in changes:
+        binding = next(
+            (b for b in policy_object.bindings if b.role == role and not b.condition.expression),
+            None
+        )
+        members = list(binding.members) if binding is not None else []
+        for member in add_members:
+            if member not in members:
+                members.append(member)
+        members = [member for member in members if member not in remove_members]
+        if not members and role in protected_roles:
+            errors.append(LastMemberError(f"Cannot remove the last member of {role}"))
+            continue
+        errors.append(None)
+        if binding is None:
+            if not members:
+                continue
+            binding = policy_object.bindings.add(role=role)
+        del binding.members[:]
+        binding.members.extend(members)
+
+    # Drop bindings left without members, the API rejects them
+    for binding in list(policy_object.bindings):
+        if not binding.members:
+            policy_object.bindings.remove(binding)
+    return errors
+
+
+class IamPolicyCoalescer:
+    """
+    Coalesces concurrent IAM membership changes to the same project into one policy write.
+
+    A caller with no write in flight for its project writes at once. Changes arriving
+    while a write is in flight join the next batch, which the first of them writes as
+    soon as the previous write finishes, so batching costs no added latency. Each write
+    is an etag-guarded read-modify-write, retried when the etag is stale. Every caller in
+    a batch gets the resulting policy, or the same error; a change that would leave a
+    protected role without members fails on its own with `LastMemberError`.
+    """
+
+    def __init__(self, max_attempts=5, protected_roles=("roles/owner",)):
+        self.max_attempts = max_attempts
+        self.protected_roles = tuple(protected_roles)
+        self._lock = threading.Lock()
+        self._projects = {}
+
+    def update_members(self, sandbox_project_id, role, add_members=(), remove_members=()):
+        """
+        Adds and removes members of a role on a sandbox project.
+
+        Args:
+            sandbox_project_id (str): The ID of the sandbox project.
+            role (str): The role to modify, e.g. "roles/owner".
+            add_members (list): Members to add, e.g. "user:jane@example.com".
+            remove_members (list): Members to remove.
+
+        Returns:
+            policy_pb2.Policy: The IAM policy written to the project.
+
+        Raises:
+            LastMemberError: If the change would leave a protected role without members.
+        """
+        with self._lock:
+            project = self._projects.setdefault(sandbox_project_id, _ProjectWrites())
+            if project.next_batch is None:
+                project.next_batch = _PendingPolicyUpdate()
+            update = project.next_batch
+            index = len(update.changes)
+            update.changes.append((role, list(add_members), list(remove_members)))
+            is_leader = index == 0
+            if is_leader and not project.writing:
+                project.writing = True
+                project.next_batch = None
+                update.turn.set()
+
+        if is_leader:
+            update.turn.wait()
+            try:
+                update.result, update.errors = self._read_modify_write(sandbox_project_id, update.changes)
+            except Exception as e:
+                update.error = e
+            finally:
+                update.done.set()
+                self._hand_over(sandbox_project_id, project)
+        else:
+            update.done.wait()
+
+        if update.error is not None:
+            raise update.error
+        if update.errors[index] is not None:
+            raise update.errors[index]
+        return update.result
+
+    def _hand_over(self, sandbox_project_id, project):
+        with self._lock:
+            next_batch = project.next_batch
+            if next_batch is None:
+                project.writing = False
+                del self._projects[sandbox_project_id]
+            else:
+                project.next_batch = None
+                next_batch.turn.set()
+
+    def _read_modify_write(self, sandbox_project_id, changes):
+        # Lazy import to avoid startup overhead
+        from google.api_core.exceptions import Aborted
+        from app.utils.logger import logger
+
+        for attempt in range(1, self.max_attempts + 1):
+            policy_object = GCPSandboxService.get_sandbox_iam_policy(sandbox_project_id)
+            errors = apply_membership_changes(policy_object, changes, self.protected_roles)
+            if all(error is not None for error in errors):
+                return policy_object, errors
+            policy_object.version = 3
+            try:
+                return GCPSandboxService.set_sandbox_iam_policy(sandbox_project_id, policy_object), errors
+            except Aborted:
+                if attempt == self.max_attempts:
+                    raise
+                logger.info(f"IAM policy of project {sandbox_project_id} changed concurrently, retrying ({attempt}/{self.max_attempts})...")
+                time.sleep(0.1 * (2 ** attempt))
+
+
+_coalescer_instance: Optional[IamPolicyCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+def get_iam_policy_coalescer() -> IamPolicyCoalescer:
+    """Get the singleton IAM policy coalescer."""
+    global _coalescer_instance
+    with _coalescer_lock:
+        if _coalescer_instance is None:
+            _coalescer_instance = IamPolicyCoalescer(max_attempts=config.IAM_UPDATE_MAX_ATTEMPTS)
+    return _coalescer_instance
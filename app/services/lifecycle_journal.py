@@ -0,0 +1,232 @@
+import json
+import mmap
+import os
+import sqlite3
+import threading
+from datetime import datetime, UTC
+from typing import Optional
+
+from app.core.config import get_config
+
+config = get_config()
+
+
+class LifecycleJournal:
+    """
+    Append-only journal of sandbox lifecycle events stored as rotating segment files.
+
+    Each record is one line: a zero-padded millisecond timestamp, a space and a compact
+    JSON object. The fixed-width timestamp prefix lets readers skip records outside a
+    time range without decoding them, and segment file names carry the timestamp of
+    their first record so whole segments can be skipped too. Segments are read through
+    mmap so exports never load a whole segment into memory.
+
+    The team and user of live projects are kept in a small SQLite index next to the
+    segments, so later events are attributed without replaying the journal; entries are
+    dropped when their project is deleted or expires.
+
+    The journal is local to the instance; point JOURNAL_DIR at a persistent volume to
+    keep it across deployments.
+    """
+
+    SEGMENT_SUFFIX = ".journal"
+    TIMESTAMP_WIDTH = 13
+    OWNER_INDEX_NAME = "project_owners.db"
+
+    def __init__(self, journal_dir, segment_max_bytes=16 * 1024 * 1024):
+        self.journal_dir = journal_dir
+        self.segment_max_bytes = segment_max_bytes
+        self._lock = threading.Lock()
+        self._segment_file = None
+        self._segment_size = 0
+        # Records are written in timestamp order, which `read` relies on to stop early
+        self._last_timestamp_ms = 0
+
+        os.makedirs(journal_dir, exist_ok=True)
+        index_path = os.path.join(journal_dir, self.OWNER_INDEX_NAME)
+        index_exists = os.path.exists(index_path)
+        self._owners_db = sqlite3.connect(index_path, check_same_thread=False)
+        self._owners_db.execute(
+            "CREATE TABLE IF NOT EXISTS project_owners (project_id TEXT PRIMARY KEY, team TEXT, user TEXT)"
+        )
+        if not index_exists:
+            # One-time build for journals written before the index existed
+            for record in self.read():
+                self._update_owners(record["event"], record["project_id"], record.get("team"), record.get("user"))
+        self._owners_db.commit()
+
+    def _update_owners(self, event, project_id, team, user):
+        # Caller must hold self._lock or be the constructor
+        if event == "create":
+            self._owners_db.execute(
+                "INSERT OR REPLACE INTO project_owners (project_id, team, user) VALUES (?, ?, ?)",
+                (project_id, team, user)
+            )
+        elif event in ("delete", "expire"):
+            self._owners_db.execute("DELETE FROM project_owners WHERE project_id = ?", (project_id,))
+
+    def _segment_paths(self):
+        names = sorted(name for name in os.listdir(self.journal_dir) if name.endswith(self.SEGMENT_SUFFIX))
+        return [os.path.join(self.journal_dir, name) for name in names]
+
+    def _open_segment(self, timestamp_ms):
+        # Caller must hold self._lock
+        if self._segment_file is not None:
+            self._segment_file.close()
+        path = os.path.join(self.journal_dir, f"{timestamp_ms:0{self.TIMESTAMP_WIDTH}d}{self.SEGMENT_SUFFIX}")
+        self._segment_file = open(path, "ab")
+        self._segment_size = self._segment_file.tell()
+
+    def append(self, event, project_id, team=None, user=None, **fields):
+        """
+        Appends a lifecycle event to the journal.
+
+        Args:
+            event (str): The event type, e.g. "create", "extend", "delete", "expire" or "create_failed".
+            project_id (str): The ID of the sandbox project the event is about.
+            team (str): The team owning the project. Looked up from the create event if omitted.
+            user (str): The user owning the project. Looked up from the create event if omitted.
+            **fields: Additional JSON-serializable event details.
+
+        Returns:
+            dict: The record as it will be read back, including its "timestamp".
+        """
+        with self._lock:
+            # Never go backwards, even if the wall clock does
+            timestamp_ms = max(int(datetime.now(UTC).timestamp() * 1000), self._last_timestamp_ms)
+            self._last_timestamp_ms = timestamp_ms
+            if event == "create":
+                known_team, known_user = team, user
+            else:
+                row = self._owners_db.execute(
+                    "SELECT team, user FROM project_owners WHERE project_id = ?", (project_id,)
+                ).fetchone()
+                known_team, known_user = row or (None, None)
+            self._update_owners(event, project_id, team or known_team, user or known_user)
+            self._owners_db.commit()
+
+            record = {"event": event, "project_id": project_id, "team": team or known_team, "user": user or known_user}
+            record.update(fields)
+            line = f"{timestamp_ms:0{self.TIMESTAMP_WIDTH}d} {json.dumps(record, separators=(',', ':'), default=str)}\n".encode()
+
+            if self._segment_file is None:
+                segment_paths = self._segment_paths()
+                if segment_paths:
+                    self._segment_file = open(segment_paths[-1], "ab")
+                    self._segment_size = self._segment_file.tell()
+                else:
+                    self._open_segment(timestamp_ms)
+            if self._segment_size + len(line) > self.segment_max_bytes and self._segment_size > 0:
+                self._open_segment(timestamp_ms)
+            self._segment_file.write(line)
+            self._segment_file.flush()
+            self._segment_size += len(line)
+
+        record["timestamp"] = datetime.fromtimestamp(timestamp_ms / 1000, UTC).isoformat()
+        return record
+
+    def read(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+             team: Optional[str] = None, user: Optional[str] = None):
+        """
+        Yields journal records matching the given filters, oldest first.
+
+        Args:
+            since (datetime): Only yield records at or after this time. Naive values are UTC.
+            until (datetime): Only yield records before this time. Naive values are UTC.
+            team (str): Only yield records for this team.
+            user (str): Only yield records for this user.
+
+        Yields:
+            dict: The record, with its time under "timestamp" as an ISO 8601 string.
+        """
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=UTC)
+        if until is not None and until.tzinfo is None:
+            until = until.replace(tzinfo=UTC)
+        since_ms = int(since.timestamp() * 1000) if since else None
+        until_ms = int(until.timestamp() * 1000) if until else None
+        # Cheap byte-level prefilters before decoding a record
+        team_bytes = json.dumps(team).encode() if team else None
+        user_bytes = json.dumps(user).encode() if user else None
+        width = self.TIMESTAMP_WIDTH
+
+        segment_paths = self._segment_paths()
+        for index, path in enumerate(segment_paths):
+            segment_start_ms = int(os.path.basename(path)[:width])
+            if until_ms is not None and segment_start_ms >= until_ms:
+                break
+            if since_ms is not None and index + 1 < len(segment_paths):
+                next_segment_start_ms = int(os.path.basename(segment_paths[index + 1])[:width])
+                if next_segment_start_ms <= since_ms:
+                    continue
+
+            with open(path, "rb") as segment_file:
+                if os.fstat(segment_file.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    position = 0
+                    size = mm.size()
+                    while position < size:
+                        end = mm.find(b"\n", position)
+                        if end == -1:
+                            # Partially written trailing record
+                            break
+                        timestamp_ms = int(mm[position:position + width])
+                        if until_ms is not None and timestamp_ms >= until_ms:
+                            break
+                        if since_ms is None or timestamp_ms >= since_ms:
+                            line = mm[position + width + 1:end]
+                            if (team_bytes is None or team_bytes in line) and (user_bytes is None or user_bytes in line):
+                                record = json.loads(line)
+                                if (team is None or record.get("team") == team) and (user is None or record.get("user") == user):
+                                    record["timestamp"] = datetime.fromtimestamp(timestamp_ms / 1000, UTC).isoformat()
+                                    yield record
+                        position = end + 1
+
+
+_journal_instance: Optional[LifecycleJournal] = None
+_journal_lock = threading.Lock()
+_lifecycle_listeners = []
+
+def get_lifecycle_journal() -> LifecycleJournal:
+    """Get the singleton lifecycle journal."""
+    global _journal_instance
+    with _journal_lock:
+        if _journal_instance is None:
+            _journal_instance = LifecycleJournal(config.JOURNAL_DIR, segment_max_bytes=config.JOURNAL_SEGMENT_MAX_BYTES)
+    return _journal_instance
+
+
+def add_lifecycle_listener(listener):
+    """
+    Registers a callback invoked with every lifecycle event record after it is journaled.
+
+    Args:
+        listener (callable): Called with the record dict returned by `LifecycleJournal.append`.
+    """
+    if listener not in _lifecycle_listeners:
+        _lifecycle_listeners.append(listener)
+
+
+def record_lifecycle_event(event, project_id, **fields):
+    """
+    Appends a lifecycle event to the journal and notifies listeners without ever failing the caller.
+
+    Args:
+        event (str): The event type.
+        project_id (str): The ID of the sandbox project the event is about.
+        **fields: Additional event details, see `LifecycleJournal.append`.
+    """
+    from app.utils.logger import logger
+
+    try:
+        record = get_lifecycle_journal().append(event, project_id, **fields)
+    except Exception as e:
+        logger.error(f"Failed to record {event} event for project {project_id} in lifecycle journal: {e}")
+        record = {"event": event, "project_id": project_id, **fields, "timestamp": datetime.now(UTC).isoformat()}
+
+    for listener in _lifecycle_listeners:
+        try:
+            listener(record)
+        except Exception as e:
+            logger.error(f"Lifecycle listener {listener} failed on {event} event for project {project_id}: {e}")
@@ -0,0 +1,297 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import NamedTuple, Optional
+
+from app.core.config import get_config
+from app.core.circuit_breaker import get_circuit_breaker
+
+config = get_config()
+
+
+class QuotaExceededError(Exception):
+    """Raised when a user has no free sandbox slot left."""
+
+    def __init__(self, user_key, limit):
+        self.user_key = user_key
+        self.limit = limit
+        super().__init__(f"{user_key} has reached the limit of {limit} active sandbox projects")
+
+
+class QuotaConflictError(Exception):
+    """Raised when a reservation keeps losing the race for the same user's record."""
+
+
+class QuotaStore(ABC):
+    """
+    Versioned key-value store that quota reservations, and the AWS account pool, are kept in.
+
+    Writes are conditional on the version that was read, so concurrent writers never
+    overwrite each other and no lock is held between the read and the write.
+    """
+
+    # Names of the circuit-broken APIs that the store depends on
+    required_apis = ()
+
+    @abstractmethod
+    def read(self, key):
+        """
+        Reads a record.
+
+        Args:
+            key (str): The record key.
+
+        Returns:
+            tuple: The decoded record and its version, or `(None, None)` if there is none.
+        """
+
+    @abstractmethod
+    def write(self, key, value, expected_version):
+        """
+        Writes a record if it is still at the version that was read.
+
+        Args:
+            key (str): The record key.
+            value (dict): The new record.
+            expected_version: The version returned by `read`, None if there was no record.
+
+        Returns:
+            bool: True if written, False if the record was changed by someone else.
+        """
+
+
+class SQLiteQuotaStore(QuotaStore):
+    """
+    Embedded quota store in a SQLite database.
+
+    Instances that share the database file, e.g. workers on one host or on a shared
+    volume, enforce the same limits.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS quota_records ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, version INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def read(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value, version FROM quota_records WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def write(self, key, value, expected_version):
+        encoded = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            if expected_version is None:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO quota_records (key, value, version) VALUES (?, ?, 1)",
+                    (key, encoded)
+                )
+            else:
+                cursor = self._db.execute(
+                    "UPDATE quota_records SET value = ?, version = version + 1 WHERE key = ? AND version = ?",
+                    (encoded, key, expected_version)
+                )
+            self._db.commit()
+            return cursor.rowcount == 1
+
+
+class GCSQuotaStore(QuotaStore):
+    """
+    Quota store in a Cloud Storage bucket, shared by every instance of the service.
+
+    Each record is one object; writes are conditional on the object generation.
+    """
+
+    required_apis = ("storage",)
+
+    def __init__(self, bucket_name, prefix="quota/"):
+        # Lazy import to avoid startup overhead
+        from google.cloud import storage
+
+        self._bucket = storage.Client().bucket(bucket_name)
+        self._prefix = prefix
+
+    def read(self, key):
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        blob = get_circuit_breaker("storage").call(self._bucket.get_blob, f"{self._prefix}{key}.json")
+        if blob is None:
+            return None, None
+        try:
+            data = get_circuit_breaker("storage").call(blob.download_as_bytes, if_generation_match=blob.generation)
+        except (NotFound, PreconditionFailed):
+            # Changed between the metadata read and the download
+            return self.read(key)
+        return json.loads(data), blob.generation
+
+    def write(self, key, value, expected_version):
+        from google.api_core.exceptions import PreconditionFailed
+
+        blob = self._bucket.blob(f"{self._prefix}{key}.json")
+        try:
+            get_circuit_breaker("storage").call(
+                blob.upload_from_string,
+                json.dumps(value, separators=(",", ":")),
+                content_type="application/json",
+                # Generation 0 means the object must not exist yet
+                if_generation_match=expected_version or 0
+            )
+        except PreconditionFailed:
+            return False
+        return True
+
+
+class Reservation(NamedTuple):
+    user_key: str
+    reservation_id: str
+    project_id: str
+
+
+class QuotaReservations:
+    """
+    Reserves sandbox slots against a per-user limit without a global lock.
+
+    A user's record holds their open reservations, each with a lease deadline. Reserving
+    reads the record, counts the user's active projects plus the projects of unexpired
+    reservations, and adds a reservation with a conditional write; a concurrent change
+    makes the write fail and the whole step is retried. Committing keeps the slot
+    counted until the lease ends, by which time the new project is listed as active.
+    Releasing frees it at once. A reservation that is neither committed nor released,
+    e.g. because the instance died, stops counting when its lease expires.
+    """
+
+    def __init__(self, store: QuotaStore, lease_seconds=300, max_attempts=10):
+        self.store = store
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def _update(self, user_key, change):
+        # Optimistic read-modify-write; `change` edits the live reservations in place
+        for attempt in range(self.max_attempts):
+            record, version = self.store.read(user_key)
+            now = time.time()
+            reservations = {
+                reservation_id: reservation
+                for reservation_id, reservation in (record or {}).get("reservations", {}).items()
+                if reservation["lease_expires_at"] > now
+            }
+            result = change(reservations, now)
+            if reservations == (record or {}).get("reservations", {}):
+                return result
+            if self.store.write(user_key, {"reservations": reservations}, version):
+                return result
+            # Lost the race: back off briefly with jitter so competing writers spread out
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+        raise QuotaConflictError(f"Too many concurrent quota updates for {user_key}, please retry")
+
+    def reserve(self, user_key, project_id, limit, active_project_ids):
+        """
+        Reserves a slot for a new project.
+
+        Args:
+            user_key (str): The key quotas are counted on, e.g. the user's email prefix.
+            project_id (str): The ID of the project about to be created.
+            limit (int): The maximum number of active projects for the user.
+            active_project_ids (set): The IDs of the user's currently active projects.
+
+        Returns:
+            Reservation: To be passed to `commit` or `release`.
+
+        Raises:
+            QuotaExceededError: If the user has no free slot.
+            QuotaConflictError: If the reservation kept conflicting with concurrent ones.
+        """
+        reservation_id = uuid.uuid4().hex
+
+        def add_reservation(reservations, now):
+            # Committed projects stay reserved until listed as active, so count each project once
+            used = set(active_project_ids) | {reservation["project_id"] for reservation in reservations.values()}
+            if len(used) >= limit:
+                raise QuotaExceededError(user_key, limit)
+            reservations[reservation_id] = {
+                "project_id": project_id,
+                "state": "pending",
+                "lease_expires_at": now + self.lease_seconds
+            }
+
+        self._update(user_key, add_reservation)
+        return Reservation(user_key, reservation_id, project_id)
+
+    def commit(self, reservation):
+        """
+        Marks a reservation as used by a created project, renewing its lease.
+
+        Args:
+            reservation (Reservation): The reservation returned by `reserve`.
+        """
+        def mark_committed(reservations, now):
+            reservations[reservation.reservation_id] = {
+                "project_id": reservation.project_id,
+                "state": "committed",
+                "lease_expires_at": now + self.lease_seconds
+            }
+
+        self._update(reservation.user_key, mark_committed)
+
+    def release(self, reservation):
+        """
+        Frees the slot of a reservation whose project was not created.
+
+        Args:
+            reservation (Reservation): The reservation returned by `reserve`.
+        """
+        self._update(reservation.user_key, lambda reservations, now: reservations.pop(reservation.reservation_id, None))
+
+    def release_project(self, user_key, project_id):
+        """
+        Frees any slot still held for a project that has been deleted.
+
+        Args:
+            user_key (str): The key quotas are counted on.
+            project_id (str): The ID of the deleted project.
+        """
+        def drop_project(reservations, now):
+            for reservation_id in [rid for rid, reservation in reservations.items() if reservation["project_id"] == project_id]:
+                del reservations[reservation_id]
+
+        self._update(user_key, drop_project)
+
+
+_quota_reservations_instance: Optional[QuotaReservations] = None
+_quota_reservations_lock = threading.Lock()
+
+def get_quota_reservations() -> QuotaReservations:
+    """Get the singleton quota reservations for the configured store backend."""
+    global _quota_reservations_instance
+    with _quota_reservations_lock:
+        if _quota_reservations_instance is None:
+            backend = config.QUOTA_STORE_BACKEND
+            if backend == "local":
+                # Cloud Run sets K_SERVICE; its instances don't share a filesystem, so each
+                # would count quotas on its own and let users past the limit
+                if os.environ.get("K_SERVICE"):
+                    raise ValueError(
+                        "QUOTA_STORE_BACKEND 'local' cannot be used on Cloud Run. Set QUOTA_STORE_BACKEND=gcs "
+                        "and QUOTA_STORE_BUCKET to a bucket the service account can write to, see "
+                        "'Upgrading' in README.md"
+                    )
+                store = SQLiteQuotaStore(config.QUOTA_STORE_DB_PATH)
+            elif backend == "gcs":
+                if not config.QUOTA_STORE_BUCKET:
+                    raise ValueError("QUOTA_STORE_BUCKET must be set when QUOTA_STORE_BACKEND is 'gcs'")
+                store = GCSQuotaStore(config.QUOTA_STORE_BUCKET)
+            else:
+                raise ValueError(f"Unknown QUOTA_STORE_BACKEND {backend}. Must be one of 'local', 'gcs'")
+            _quota_reservations_instance = QuotaReservations(store, lease_seconds=config.QUOTA_RESERVATION_LEASE_SECONDS)
+    return _quota_reservations_instance
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from datetime import datetime, UTC
+from typing import Optional
+
+from app.core.config import get_config
+from app.services.usage_rollups import get_usage_rollups
+
+config = get_config()
+
+# Lifecycle events that change the set of live sandboxes or their expiry
+FEED_EVENTS = ("create", "extend", "delete", "expire")
+
+
+def format_sse(event, data):
+    """Encodes one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, team, user):
+        self.team = team
+        self.user = user
+        self.messages = deque()
+        self.wakeup = asyncio.Event()
+        self.lagged = False
+
+    def matches(self, record):
+        return ((self.team is None or record.get("team") == self.team)
+                and (self.user is None or record.get("user") == self.user))
+
+
+class SandboxFeed:
+    """
+    Pushes the live sandboxes of a team or user, then every change to them, to subscribers.
+
+    The live sandboxes are loaded from the usage rollups store, which already tracks the
+    open projects, on the first subscription and kept current by `publish`, registered
+    as a lifecycle listener after the rollups. An event that lands in the store just
+    before loading is applied again by `publish`, which is harmless. Each event is
+    encoded once and appended to the buffers of the matching subscribers on the event
+    loop. A subscriber whose buffer already holds `max_buffered_events` unsent events is
+    cut off with a `resync` event instead of buffering without bound; the client is
+    expected to reconnect and start from a fresh snapshot.
+
+    Events carry the full expiry, so a client may safely apply an event that is already
+    reflected in its snapshot.
+    """
+
+    def __init__(self, max_buffered_events=256, keepalive_seconds=15):
+        self.max_buffered_events = max_buffered_events
+        self.keepalive_seconds = keepalive_seconds
+        self._lock = threading.Lock()
+        self._sandboxes = None
+        self._loop = None
+        # Only touched on the event loop
+        self._subscribers = set()
+
+    def _apply(self, record):
+        # Caller must hold self._lock
+        event = record["event"]
+        project_id = record["project_id"]
+        if event == "create":
+            self._sandboxes[project_id] = {
+                "project_id": project_id,
+                "team": record.get("team"),
+                "user": record.get("user"),
+                "created_at": record.get("timestamp"),
+                "expires_at": record.get("expires_at")
+            }
+        elif event == "extend" and project_id in self._sandboxes:
+            self._sandboxes[project_id]["expires_at"] = record.get("expires_at")
+        elif event in ("delete", "expire"):
+            self._sandboxes.pop(project_id, None)
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._sandboxes is None:
+                self._sandboxes = {
+                    project["project_id"]: {
+                        **project,
+                        "created_at": datetime.fromtimestamp(project["created_at"], UTC).isoformat()
+                    }
+                    for project in get_usage_rollups().list_open_projects()
+                }
+
+    def snapshot(self, team=None, user=None):
+        """
+        Returns the live sandboxes, optionally of one team or user.
+
+        Args:
+            team (str): Only include sandboxes of this team.
+            user (str): Only include sandboxes requested by this user.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return [
+                dict(sandbox) for sandbox in self._sandboxes.values()
+                if (team is None or sandbox["team"] == team) and (user is None or sandbox["user"] == user)
+            ]
+
+    def publish(self, record):
+        """
+        Lifecycle listener that updates the live sandboxes and forwards the event to subscribers.
+
+        Safe to call from any thread.
+
+        Args:
+            record (dict): A record as returned by `LifecycleJournal.append`.
+        """
+        if record["event"] not in FEED_EVENTS:
+            return
+        with self._lock:
+            if self._sandboxes is not None:
+                self._apply(record)
+        loop = self._loop
+        if loop is not None and self._subscribers:
+            loop.call_soon_threadsafe(self._fan_out, record)
+
+    def _fan_out(self, record):
+        message = None
+        for subscriber in list(self._subscribers):
+            if not subscriber.matches(record):
+                continue
+            if message is None:
+                message = format_sse(record["event"], record)
+            if len(subscriber.messages) >= self.max_buffered_events:
+                # Slow consumer: stop buffering for it and make it resync
+                subscriber.lagged = True
+                self._subscribers.discard(subscriber)
+            else:
+                subscriber.messages.append(message)
+            subscriber.wakeup.set()
+
+    async def subscribe(self, team=None, user=None):
+        """
+        Yields server-sent events: a snapshot of the live sandboxes, then every change to them.
+
+        Args:
+            team (str): Only include sandboxes of this team.
+            user (str): Only include sandboxes requested by this user.
+
+        Yields:
+            str: Encoded server-sent events, with comment lines as keepalives.
+        """
+        self._loop = asyncio.get_running_loop()
+        subscriber = _Subscriber(team, user)
+        # Subscribe before taking the snapshot so no event falls in between
+        self._subscribers.add(subscriber)
+        try:
+            sandboxes = await asyncio.to_thread(self.snapshot, team, user)
+            yield format_sse("snapshot", {"team": team, "user": user, "sandboxes": sandboxes})
+            while True:
+                if subscriber.lagged:
+                    yield format_sse("resync", {"reason": "Too many undelivered events, reconnect for a fresh snapshot"})
+                    return
+                if subscriber.messages:
+                    yield subscriber.messages.popleft()
+                    continue
+                subscriber.wakeup.clear()
+                try:
+                    await asyncio.wait_for(subscriber.wakeup.wait(), timeout=self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self._subscribers.discard(subscriber)
+
+    def metrics(self) -> dict:
+        """Returns the number of subscribers and of events waiting to be sent to them."""
+        subscribers = list(self._subscribers)
+        return {
+            "subscribers": len(subscribers),
+            "buffered_events": sum(len(subscriber.messages) for subscriber in subscribers)
+        }
+
+
+_feed_instance: Optional[SandboxFeed] = None
+_feed_lock = threading.Lock()
+
+def get_sandbox_feed() -> SandboxFeed:
+    """Get the singleton live sandbox feed."""
+    global _feed_instance
+    with _feed_lock:
+        if _feed_instance is None:
+            _feed_instance = SandboxFeed(
+                max_buffered_events=config.FEED_MAX_BUFFERED_EVENTS,
+                keepalive_seconds=config.FEED_KEEPALIVE_SECONDS
+            )
+    return _feed_instance
@@ -0,0 +1,81 @@
+import asyncio
+import re
+
+# Endless event streams: they never finish, so the profiler and traffic capture skip them
+STREAMING_PATHS = frozenset({"/api/v1/gcp/feed"})
+
+
+async def asgi_request(app, method, path, query_string, body, max_seconds=None, max_body_bytes=None):
+    """
+    Sends one request straight through the ASGI app and returns its status and body.
+
+    The client disconnects once the response is complete, after `max_seconds` or once the
+    body reaches `max_body_bytes`, which also ends streaming responses that never finish.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query_string.encode(),
+        "headers": [
+            (b"host", b"localhost"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode())
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80)
+    }
+    body_sent = False
+    disconnected = asyncio.Event()
+    response = {"status": 500, "body": bytearray()}
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"].extend(message.get("body", b""))
+            if not message.get("more_body", False) or (max_body_bytes is not None and len(response["body"]) >= max_body_bytes):
+                disconnected.set()
+
+    timer = asyncio.get_running_loop().call_later(max_seconds, disconnected.set) if max_seconds is not None else None
+    try:
+        await app(scope, receive, send)
+    finally:
+        if timer is not None:
+            timer.cancel()
+    return response["status"], bytes(response["body"])
+
+
+def route_template(scope):
+    """
+    Returns the template of the route a request matched, e.g. /api/v1/gcp/delete/{project_id}.
+
+    Args:
+        scope (dict): The ASGI scope, after routing.
+
+    Returns:
+        str: The route template, or "unmatched" if no route matched.
+    """
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    # Newer FastAPI releases keep only the included router's own path on its routes,
+    # put back the prefix the request was routed through
+    path_params = scope.get("path_params", {})
+    concrete = re.sub(r"{(\w+)(:\w+)?}", lambda match: str(path_params.get(match.group(1), match.group(0))), template)
+    if scope["path"].endswith(concrete):
+        template = scope["path"][:len(scope["path"]) - len(concrete)] + template
+    return template
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+In-process micro-benchmarks of the request hot path, with the GCP layer mocked.
+
+    python benchmark.py                                   # run and print results
+    python benchmark.py --save benchmark_baseline.json    # record a new baseline
+    python benchmark.py --compare benchmark_baseline.json # exit 1 on a regression
+
+Each benchmark is timed in repeats interleaved with a fixed pure-Python reference
+loop, after a warmup. The gate compares the median speed relative to that loop, so a
+slower or busier machine slows both alike and cancels out; raw ops/sec are printed
+for information. The spread of the repeats gives the benchmark's noise, and a drop
+only fails the gate once it exceeds both the allowed regression and NOISE_SIGMAS
+times the noise of baseline and run combined. Allocations are the median peak bytes of one
+operation, measured separately with tracemalloc. Refresh the baseline with --save on
+the CI runner whenever the hot path changes on purpose.
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import json
+import logging
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Dummy settings so the benchmarks need no environment; nothing talks to Google Cloud
+_BENCHMARK_ENV = {
+    "MAX_ALLOWED_PROJECTS_PER_USER": "5",
+    "AUTHORIZED_TEAM_FOLDERS": '{"Team-Benchmark": "folders/1"}',
+    "BILLING_ACCOUNT_ID": "000000-000000-000000",
+    "AUTHORIZED_DOMAIN_NAMES": "example.com",
+    "LOCATION": "asia-south1",
+    "SERVICE_ACCOUNT_EMAIL": "benchmark@example.iam.gserviceaccount.com",
+    "ORGANIZATION_ID": "1",
+    "CLOUD_TASKS_DELETION_QUEUE_ID": "projects/p/locations/l/queues/q",
+    "CLOUDRUN_SERVICE_ID": "projects/p/locations/l/services/s",
+    "ENABLE_GCP_PROVISIONER": "true",
+    "ENABLE_AWS_PROVISIONER": "false",
+    "ENABLE_AZURE_PROVISIONER": "false",
+}
+
+MIN_REPEAT_SECONDS = 0.1
+WARMUP_SECONDS = 0.2
+REPEATS = 9
+NOISE_SIGMAS = 3
+ALLOCATION_SAMPLES = 20
+
+
+def reference_workload():
+    """Fixed mix of dict, string and arithmetic work that speeds are measured against."""
+    totals = {}
+    for i in range(100):
+        key = f"key-{i % 10}"
+        totals[key] = totals.get(key, 0) + i * i
+    return sorted(totals.items())
+
+
+def _loops_for(func, seconds):
+    """Number of calls of `func` that take at least `seconds`."""
+    loops = 1
+    while True:
+        elapsed = _time_loops(func, loops)
+        if elapsed >= seconds:
+            return loops
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(seconds / elapsed) + 1))
+
+
+def _time_loops(func, loops):
+    start = time.perf_counter()
+    for _ in range(loops):
+        func()
+    return time.perf_counter() - start
+
+
+def measure_speed(func, reference_loops):
+    """
+    Times `func` in REPEATS runs of at least MIN_REPEAT_SECONDS each, alternating with
+    runs of the reference workload.
+
+    Returns:
+        tuple: Median ops/sec, median speed relative to the reference workload (calls of
+        `func` per reference call) and the standard error of that median in percent.
+    """
+    loops = _loops_for(func, MIN_REPEAT_SECONDS)
+    _time_loops(func, _loops_for(func, WARMUP_SECONDS))
+    reference_timings = []
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        reference_timings.append(_time_loops(reference_workload, reference_loops) / reference_loops)
+        for _ in range(REPEATS):
+            timings.append(_time_loops(func, loops) / loops)
+            reference_timings.append(_time_loops(reference_workload, reference_loops) / reference_loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # Each run is compared with the reference runs right before and after it
+    relative_speeds = [
+        (reference_timings[i] + reference_timings[i + 1]) / 2 / timing for i, timing in enumerate(timings)
+    ]
+    relative_speed = statistics.median(relative_speeds)
+    # Median absolute deviation scaled to a standard deviation, then to the error of the median
+    deviation = 1.4826 * statistics.median(abs(speed - relative_speed) for speed in relative_speeds)
+    noise = 1.2533 * deviation / math.sqrt(REPEATS) / relative_speed
+    return 1 / statistics.median(timings), relative_speed, noise * 100
+
+
+def measure_allocated_bytes(func):
+    """Median over ALLOCATION_SAMPLES calls of the peak bytes allocated by one call."""
+    func()  # warm caches so one-off allocations are not counted
+    samples = []
+    tracemalloc.start()
+    try:
+        for _ in range(ALLOCATION_SAMPLES):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            samples.append(peak - before)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(samples))
+
+
+def build_benchmarks(state_dir, stack):
+    """
+    Returns the benchmarks as (name, callable) pairs, with the app wired to a GCP stand-in.
+
+    The stand-in stays installed until `stack` is closed.
+    """
+    for name, value in _BENCHMARK_ENV.items():
+        os.environ.setdefault(name, value)
+    os.environ["EXPIRY_SCHEDULER_BACKEND"] = "local"
+    os.environ["TRAFFIC_CAPTURE_ENABLED"] = "false"
+    os.environ["PROFILER_ENABLED"] = "false"
+    os.environ["JOURNAL_DIR"] = os.path.join(state_dir, "journal")
+    os.environ["USAGE_ROLLUPS_DB_PATH"] = os.path.join(state_dir, "usage_rollups.db")
+    os.environ["LOCAL_SCHEDULER_DB_PATH"] = os.path.join(state_dir, "sandbox_expiry.db")
+    os.environ["QUOTA_STORE_BACKEND"] = "local"
+    os.environ["QUOTA_STORE_DB_PATH"] = os.path.join(state_dir, "quota_reservations.db")
+
+    from datetime import datetime, timedelta, UTC
+    from google.protobuf.timestamp_pb2 import Timestamp
+    from main import app, config
+    from app.models.gcp_base_models import SandboxCreate
+    from app.services.expiry_scheduler import get_expiry_scheduler
+    from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+    from app.utils.asgi import asgi_request
+    from app.utils.logger import JsonFormatter, logger
+    from app.utils.utils import generate_sandbox_id
+
+    # Keep the formatting cost of endpoint logging but not the terminal output
+    for handler in logger.handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.setStream(open(os.devnull, "w"))
+
+    team_name = next(iter(config.AUTHORIZED_TEAM_FOLDERS))
+    domain = config.AUTHORIZED_DOMAIN_NAMES.split(",")[0].strip()
+    create_payload = {
+        "user_email": f"jane.doe@{domain}",
+        "team_name": team_name,
+        "requested_duration_hours": 4,
+        "request_description": "POC On benchmarking",
+        "additional_users": [f"john.roe@{domain}", f"ops.team@{domain}"]
+    }
+    request_time = datetime.now(UTC)
+    expires_at = request_time + timedelta(hours=4)
+    formatter = JsonFormatter()
+    log_record = logging.LogRecord(
+        "app.utils.logger", logging.INFO, __file__, 0,
+        "Successfuly created project %s.", ("jane-doe-1700000000",), None
+    )
+
+    def build_create_response():
+        project_id = "jane-doe-1700000000"
+        return {
+            "detail": "Sandbox project provisioned succesfully",
+            "user_email": create_payload["user_email"],
+            "additional_users": create_payload["additional_users"],
+            "team_name": team_name,
+            "project_id": project_id,
+            "folder_id": config.AUTHORIZED_TEAM_FOLDERS[team_name],
+            "request_description": create_payload["request_description"],
+            "billing_enabled": True,
+            "project_url": f"https://console.cloud.google.com/welcome?project={project_id}",
+            "created_at": request_time.strftime("%Y-%d-%m %H:%M:%S UTC"),
+            "expires_at": expires_at.strftime("%Y-%d-%m %H:%M:%S UTC")
+        }
+
+    def build_timestamp():
+        expiry_timestamp = Timestamp()
+        expiry_timestamp.FromDatetime(expires_at)
+        return expiry_timestamp
+
+    # Requests run through the whole app on one event loop, as under uvicorn
+    loop = asyncio.new_event_loop()
+    fake_gcp = stack.enter_context(FakeGCPSandboxService().installed())
+    loop.run_until_complete(app.router.lifespan_context(app).__aenter__())
+    project_id = "jane-doe-1700000000"
+    fake_gcp.seed_project(project_id, config.AUTHORIZED_TEAM_FOLDERS[team_name])
+    get_expiry_scheduler().schedule(project_id, expires_at)
+    extend_body = json.dumps({"project_id": project_id, "extend_by_hours": 0}).encode()
+
+    def dispatch(method, path, body=b""):
+        status, _ = loop.run_until_complete(asgi_request(app, method, path, "", body))
+        if status != 200:
+            raise RuntimeError(f"{method} {path} returned {status}")
+
+    return [
+        ("sandbox_create_validation", lambda: SandboxCreate(**create_payload)),
+        ("generate_sandbox_id", lambda: generate_sandbox_id(create_payload["user_email"], request_time)),
+        ("timestamp_from_datetime", build_timestamp),
+        ("create_response_build", build_create_response),
+        ("json_formatter_format", lambda: formatter.format(log_record)),
+        ("router_dispatch_health", lambda: dispatch("GET", "/health")),
+        ("gcp_extend_request", lambda: dispatch("POST", "/api/v1/gcp/extend", extend_body)),
+    ]
+
+
+def run_benchmarks(only=None):
+    state_dir = tempfile.mkdtemp(prefix="benchmark-")
+    results = {}
+    reference_loops = _loops_for(reference_workload, MIN_REPEAT_SECONDS / 2)
+    with contextlib.ExitStack() as stack:
+        for name, func in build_benchmarks(state_dir, stack):
+            if only and name not in only:
+                continue
+            ops_per_second, relative_speed, noise_percent = measure_speed(func, reference_loops)
+            allocated_bytes = measure_allocated_bytes(func)
+            results[name] = {
+                "ops_per_sec": round(ops_per_second, 1),
+                "relative_speed": round(relative_speed, 4),
+                "noise_percent": round(noise_percent, 2),
+                "alloc_bytes_per_op": allocated_bytes
+            }
+            print(f"  {name:<28} {ops_per_second:>14,.0f} ops/sec  x{relative_speed:<9.3f} "
+                  f"\u00b1{noise_percent:>4.1f}% {allocated_bytes:>10,} B/op")
+    return results
+
+
+def compare(baseline, results, max_ops_regression, max_alloc_regression):
+    """
+    Prints the change of every benchmark from the baseline and returns the regressions.
+
+    Speed is compared relative to the reference workload. The allowed drop is the larger
+    of `max_ops_regression` and NOISE_SIGMAS times the combined noise of baseline and run.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<28} {'ops/sec':>14} {'change':>9} {'allowed':>9} {'B/op':>10} {'change':>9}")
+    for name, result in results.items():
+        before = baseline["benchmarks"].get(name)
+        if before is None or "relative_speed" not in before:
+            print(f"{name:<28} {'(no baseline)':>14}")
+            continue
+        speed_change = (result["relative_speed"] - before["relative_speed"]) / before["relative_speed"] * 100
+        allowed_drop = max(max_ops_regression, NOISE_SIGMAS * math.hypot(before["noise_percent"], result["noise_percent"]))
+        alloc_change = ((result["alloc_bytes_per_op"] - before["alloc_bytes_per_op"]) / before["alloc_bytes_per_op"] * 100
+                        if before["alloc_bytes_per_op"] else 0.0)
+        flags = []
+        if -speed_change > allowed_drop:
+            flags.append("SLOWER")
+        if alloc_change > max_alloc_regression:
+            flags.append("MORE ALLOCATIONS")
+        if flags:
+            regressions.append((name, flags))
+        print(f"{name:<28} {result['ops_per_sec']:>14,.0f} {speed_change:>8.1f}% {-allowed_drop:>8.1f}% "
+              f"{result['alloc_bytes_per_op']:>10,} {alloc_change:>8.1f}%  {' '.join(flags)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark the request hot path.")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as the new baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a baseline and fail on regressions")
+    parser.add_argument("--max-ops-regression", type=float, default=15.0,
+                        help="Allowed drop in speed relative to the reference workload, in percent, "
+                             "widened for noisy benchmarks (default 15)")
+    parser.add_argument("--max-alloc-regression", type=float, default=10.0,
+                        help="Allowed growth in bytes allocated per op, in percent (default 10)")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Run only these benchmarks")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("MICRO-BENCHMARKS - REQUEST HOT PATH")
+    print("=" * 50)
+    results = run_benchmarks(args.only)
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "benchmarks": results
+            }, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("python") != platform.python_version():
+            print(f"\nWarning: baseline recorded on Python {baseline.get('python')}, running {platform.python_version()}")
+        regressions = compare(baseline, results, args.max_ops_regression, args.max_alloc_regression)
+        if regressions:
+            print(f"\n{len(regressions)} benchmarks regressed: {', '.join(name for name, _ in regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,41 @@
-from fastapi import FastAPI, Response, status
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, Response, status
+from fastapi.responses import HTMLResponse, JSONResponse
 from app.core.config import get_config
+from app.core.circuit_breaker import CircuitOpenError
+from contextlib import asynccontextmanager
 import uvicorn
 import logging
 
 # Get the singleton config instance
 config = get_config()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers owned by the enabled providers."""
+    if config.ENABLE_GCP_PROVISIONER:
+        from app.services.expiry_scheduler import get_expiry_scheduler
+        from app.services.lifecycle_journal import add_lifecycle_listener
+        from app.services.quota_reservations import get_quota_reservations
+        from app.services.sandbox_feed import get_sandbox_feed
+        from app.services.usage_rollups import get_usage_rollups
+        # Fail at startup rather than on the first create if the quota store is misconfigured
+        get_quota_reservations()
+        add_lifecycle_listener(get_usage_rollups().apply_event)
+        add_lifecycle_listener(get_sandbox_feed().publish)
+        get_expiry_scheduler().start()
+    if config.ENABLE_AWS_PROVISIONER:
+        from app.services.aws_account_pool import get_aws_account_pool
+        get_aws_account_pool().start()
+    yield
+    if config.ENABLE_GCP_PROVISIONER:
+        get_expiry_scheduler().stop()
+    if config.ENABLE_AWS_PROVISIONER:
+        get_aws_account_pool().stop()
+
 app = FastAPI(
     title="Cloud Sandbox Management API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 def register_log_filter() -> None:
@@ -21,7 +47,7 @@ def register_log_filter() -> None:
             return (
                 record.args  # type: ignore
                 and len(record.args) >= 3
-                and record.args[2] not in ["/health", "/health-no-log"]  # type: ignore
+                and record.args[2] not in ["/health", "/health-no-log", "/ready"]  # type: ignore
             )
 
     logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
@@ -29,6 +55,22 @@ def register_log_filter() -> None:
 # Register the log filter to prevent health endpoint logging
 register_log_filter()
 
+# Opt-in capture of the request mix for replay with traffic_replay.py
+if config.TRAFFIC_CAPTURE_ENABLED:
+    from app.core.traffic_capture import TrafficCaptureMiddleware
+    app.add_middleware(TrafficCaptureMiddleware, trace_path=config.TRAFFIC_CAPTURE_PATH, secret=config.TRAFFIC_CAPTURE_SECRET)
+
+# Opt-in profiling of slow requests
+if config.PROFILER_ENABLED:
+    from app.core.profiler import SlowRequestProfilerMiddleware
+    app.add_middleware(
+        SlowRequestProfilerMiddleware,
+        threshold_ms=config.PROFILER_THRESHOLD_MS,
+        sample_interval_ms=config.PROFILER_SAMPLE_INTERVAL_MS,
+        output_dir=config.PROFILER_OUTPUT_DIR,
+        max_dir_bytes=config.PROFILER_MAX_DIR_BYTES
+    )
+
 # Function to dynamically include routers on first request
 def setup_routers():
     """Lazy load and setup routers based on configuration."""
@@ -45,9 +87,22 @@ def setup_routers():
         from app.api.v1.endpoints import azure
         app.include_router(azure.router, prefix="/api/v1/azure", tags=["Microsoft Azure"])
 
+    if config.ADMIN_API_ENABLED:
+        from app.api.v1.endpoints import admin
+        app.include_router(admin.router, prefix="/api/v1/admin", tags=["Administration"])
+
 # Setup routers immediately after app creation
 setup_routers()
 
+@app.exception_handler(CircuitOpenError)
+def circuit_open_handler(request: Request, exc: CircuitOpenError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"ERROR 503: Google Cloud {', '.join(exc.names)} API currently unavailable. Please retry in {exc.retry_after_seconds} seconds."},
+        headers={"Retry-After": str(exc.retry_after_seconds)}
+    )
+
+
 # Health check endpoint - not included in docs and no logging
 @app.get("/health", include_in_schema=False)
 def health_check(response: Response):
@@ -55,6 +110,35 @@ def health_check(response: Response):
     return {"status": "healthy"}
 
 
+# Readiness endpoint - reports degraded while any circuit breaker is open.
+# Stays 200 since an open breaker affects every instance alike and the other
+# routes keep working.
+@app.get("/ready", include_in_schema=False)
+def readiness_check(response: Response):
+    from app.core.circuit_breaker import get_circuit_breaker_metrics
+    circuit_breakers = {name: breaker["state"] for name, breaker in get_circuit_breaker_metrics().items()}
+    response.status_code = status.HTTP_200_OK
+    return {
+        "status": "degraded" if "open" in circuit_breakers.values() else "ready",
+        "circuit_breakers": circuit_breakers
+    }
+
+
+# Metrics endpoint - not included in docs
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    from app.core.bulkhead import get_bulkhead_metrics
+    from app.core.circuit_breaker import get_circuit_breaker_metrics
+    metrics = {"bulkheads": get_bulkhead_metrics(), "circuit_breakers": get_circuit_breaker_metrics()}
+    if config.ENABLE_GCP_PROVISIONER:
+        from app.services.sandbox_feed import get_sandbox_feed
+        metrics["sandbox_feed"] = get_sandbox_feed().metrics()
+    if config.ENABLE_AWS_PROVISIONER:
+        from app.services.aws_account_pool import get_aws_account_pool
+        metrics["aws_account_pool"] = get_aws_account_pool().status()
+    return metrics
+
+
 # Root endpoint
 @app.get("/", response_class=HTMLResponse)
 def root():
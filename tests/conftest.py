@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+# Dummy settings so the app imports without an environment; nothing talks to a real cloud
+_TEST_ENV = {
+    "MAX_ALLOWED_PROJECTS_PER_USER": "2",
+    "AUTHORIZED_TEAM_FOLDERS": '{"Team-Test": "folders/1"}',
+    "BILLING_ACCOUNT_ID": "000000-000000-000000",
+    "AUTHORIZED_DOMAIN_NAMES": "example.com",
+    "LOCATION": "asia-south1",
+    "SERVICE_ACCOUNT_EMAIL": "tests@example.iam.gserviceaccount.com",
+    "ORGANIZATION_ID": "1",
+    "CLOUD_TASKS_DELETION_QUEUE_ID": "projects/p/locations/l/queues/q",
+    "CLOUDRUN_SERVICE_ID": "projects/p/locations/l/services/s",
+    "ENABLE_GCP_PROVISIONER": "true",
+    "ENABLE_AWS_PROVISIONER": "false",
+    "ENABLE_AZURE_PROVISIONER": "false",
+    "ADMIN_API_TOKEN": "test-admin-token",
+}
+for _name, _value in _TEST_ENV.items():
+    os.environ.setdefault(_name, _value)
+
+# Keep state files of singletons created by the tests out of the working tree
+_state_dir = tempfile.mkdtemp(prefix="sandbox-tests-")
+os.environ["JOURNAL_DIR"] = os.path.join(_state_dir, "journal")
+os.environ["USAGE_ROLLUPS_DB_PATH"] = os.path.join(_state_dir, "usage_rollups.db")
+os.environ["LOCAL_SCHEDULER_DB_PATH"] = os.path.join(_state_dir, "sandbox_expiry.db")
+os.environ["QUOTA_STORE_BACKEND"] = "local"
+os.environ["QUOTA_STORE_DB_PATH"] = os.path.join(_state_dir, "quota_reservations.db")
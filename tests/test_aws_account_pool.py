@@ -0,0 +1,332 @@
+import time
+
+import boto3
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from moto import mock_aws
+
+from app.core.config import get_config
+from app.services import aws_sandbox
+from app.services.aws_account_pool import AccountPoolExhaustedError, AwsAccountPool
+from app.services.aws_sandbox import AwsSandboxService
+from app.services.quota_reservations import SQLiteQuotaStore
+
+config = get_config()
+
+IDENTITY_STORE_ID = "d-1234567890"
+POLICY = '{"Version":"2012-10-17","Statement":[{"Effect":"Allow","Action":"s3:*","Resource":"*"}]}'
+TRUST_POLICY = '{"Version":"2012-10-17","Statement":[{"Effect":"Allow","Principal":{"Service":"ec2.amazonaws.com"},"Action":"sts:AssumeRole"}]}'
+
+
+@pytest.fixture
+def organization(monkeypatch):
+    for name, value in {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+                        "AWS_SESSION_TOKEN": "testing", "AWS_DEFAULT_REGION": "us-east-1",
+                        # Moto lists the snapshots of its public AMIs as owned by every account
+                        "MOTO_EC2_LOAD_DEFAULT_AMIS": "false"}.items():
+        monkeypatch.setenv(name, value)
+    with mock_aws():
+        client = boto3.client("organizations", region_name="us-east-1")
+        client.create_organization(FeatureSet="ALL")
+        root_id = client.list_roots()["Roots"][0]["Id"]
+        ou_ids = {
+            name: client.create_organizational_unit(ParentId=root_id, Name=name)["OrganizationalUnit"]["Id"]
+            for name in ("sandbox", "parking")
+        }
+        sso_instance_arn = boto3.client("sso-admin", region_name="us-east-1").list_instances()["Instances"][0]["InstanceArn"]
+        permission_set_arn = boto3.client("sso-admin", region_name="us-east-1").create_permission_set(
+            Name="Sandbox", InstanceArn=sso_instance_arn
+        )["PermissionSet"]["PermissionSetArn"]
+        for name, value in {
+            "AWS_SANDBOX_OU_ID": ou_ids["sandbox"], "AWS_PARKING_OU_ID": ou_ids["parking"],
+            "AWS_ACCOUNT_EMAIL_TEMPLATE": "aws-sandbox+{index}@example.com",
+            "AWS_SSO_INSTANCE_ARN": sso_instance_arn, "AWS_SSO_PERMISSION_SET_ARN": permission_set_arn,
+            "AWS_IDENTITY_STORE_ID": IDENTITY_STORE_ID,
+        }.items():
+            monkeypatch.setattr(config, name, value)
+        monkeypatch.setattr(aws_sandbox, "WAIT_DELAY_SECONDS", 0)
+        identity_store = boto3.client("identitystore", region_name="us-east-1")
+        for user in ("jane", "john"):
+            identity_store.create_user(
+                IdentityStoreId=IDENTITY_STORE_ID, UserName=user, DisplayName=user,
+                Name={"GivenName": user, "FamilyName": "Doe"}, Emails=[{"Value": f"{user}@example.com", "Primary": True}]
+            )
+        yield client
+
+
+def new_pool(db_path):
+    return AwsAccountPool(SQLiteQuotaStore(str(db_path)), min_available=1, max_size=2,
+                          cleanup_regions=["us-east-1", "eu-west-1"])
+
+
+@pytest.fixture
+def pool(organization, tmp_path):
+    pool = new_pool(tmp_path / "aws_account_pool.db")
+    yield pool
+    pool._cleanup_executor.shutdown(wait=True)
+
+
+def available_pool(pool):
+    pool.maintain()
+    pool.maintain()
+    return pool
+
+
+def accounts(pool):
+    return list(pool._read()["accounts"].values())
+
+
+def parent_ou(organization, account_id):
+    return organization.list_parents(ChildId=account_id)["Parents"][0]["Id"]
+
+
+def wait_for_cleanups(pool):
+    deadline = time.monotonic() + 30
+    while pool.status()["cleanups_in_progress"]:
+        assert time.monotonic() < deadline, "cleanup did not finish"
+        time.sleep(0.05)
+
+
+def assignments(account_id):
+    return boto3.client("sso-admin", region_name="us-east-1").list_account_assignments(
+        InstanceArn=config.AWS_SSO_INSTANCE_ARN, AccountId=account_id, PermissionSetArn=config.AWS_SSO_PERMISSION_SET_ARN
+    )["AccountAssignments"]
+
+
+def create_sandbox_resources(account_id):
+    session = AwsSandboxService.get_account_session(account_id)
+    s3 = session.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket=f"sandbox-{account_id}")
+    s3.put_object(Bucket=f"sandbox-{account_id}", Key="data.txt", Body=b"data")
+
+    iam = session.client("iam", region_name="us-east-1")
+    iam.create_user(UserName="dev")
+    iam.create_access_key(UserName="dev")
+    iam.create_login_profile(UserName="dev", Password="Passw0rd!Passw0rd")
+    iam.put_user_policy(UserName="dev", PolicyName="inline", PolicyDocument=POLICY)
+    iam.create_role(RoleName="app", AssumeRolePolicyDocument=TRUST_POLICY)
+    iam.create_instance_profile(InstanceProfileName="app")
+    iam.add_role_to_instance_profile(InstanceProfileName="app", RoleName="app")
+    policy_arn = iam.create_policy(PolicyName="app", PolicyDocument=POLICY)["Policy"]["Arn"]
+    iam.attach_role_policy(RoleName="app", PolicyArn=policy_arn)
+    iam.create_open_id_connect_provider(Url="https://token.actions.githubusercontent.com", ThumbprintList=["a" * 40])
+
+    for region in ("us-east-1", "eu-west-1"):
+        ec2 = session.client("ec2", region_name=region)
+        vpc_id = ec2.create_vpc(CidrBlock="10.1.0.0/16")["Vpc"]["VpcId"]
+        subnet_id = ec2.create_subnet(VpcId=vpc_id, CidrBlock="10.1.1.0/24")["Subnet"]["SubnetId"]
+        gateway_id = ec2.create_internet_gateway()["InternetGateway"]["InternetGatewayId"]
+        ec2.attach_internet_gateway(InternetGatewayId=gateway_id, VpcId=vpc_id)
+        group_id = ec2.create_security_group(GroupName="web", Description="web", VpcId=vpc_id)["GroupId"]
+        ec2.authorize_security_group_ingress(GroupId=group_id, IpPermissions=[
+            {"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "UserIdGroupPairs": [{"GroupId": group_id}]}
+        ])
+        instance_id = ec2.run_instances(
+            ImageId="ami-12345678", MinCount=1, MaxCount=1, SubnetId=subnet_id, SecurityGroupIds=[group_id],
+            DisableApiTermination=True
+        )["Instances"][0]["InstanceId"]
+        ec2.create_image(InstanceId=instance_id, Name="app")
+        volume_id = ec2.create_volume(AvailabilityZone=f"{region}a", Size=10)["VolumeId"]
+        ec2.create_snapshot(VolumeId=volume_id)
+        ec2.allocate_address(Domain="vpc")
+
+        session.client("rds", region_name=region).create_db_instance(
+            DBInstanceIdentifier="db", DBInstanceClass="db.t3.micro", Engine="postgres",
+            MasterUsername="admin", MasterUserPassword="password", AllocatedStorage=20, DeletionProtection=True
+        )
+        session.client("dynamodb", region_name=region).create_table(
+            TableName="items", KeySchema=[{"AttributeName": "id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "id", "AttributeType": "S"}], BillingMode="PAY_PER_REQUEST",
+            DeletionProtectionEnabled=True
+        )
+        session.client("ecr", region_name=region).create_repository(repositoryName="app")
+        session.client("logs", region_name=region).create_log_group(logGroupName="/app")
+        kms = session.client("kms", region_name=region)
+        kms.create_alias(AliasName="alias/app", TargetKeyId=kms.create_key()["KeyMetadata"]["KeyId"])
+    return session
+
+
+def test_creations_are_polled_until_the_account_is_parked(pool, organization):
+    pool.maintain()
+    assert pool.status()["accounts"]["creating"] == 1
+
+    pool.maintain()
+
+    assert pool.status()["accounts"]["available"] == 1
+    account_id = accounts(pool)[0]["account_id"]
+    assert parent_ou(organization, account_id) == config.AWS_PARKING_OU_ID
+
+
+def test_release_cleans_the_account_and_parks_it_again(pool, organization):
+    available_pool(pool)
+
+    account = pool.acquire("jane@example.com", ["john@example.com"], 1)
+    account_id = account["account_id"]
+    assert parent_ou(organization, account_id) == config.AWS_SANDBOX_OU_ID
+    assert len(assignments(account_id)) == 2
+    session = create_sandbox_resources(account_id)
+
+    pool.release(account_id)
+    wait_for_cleanups(pool)
+
+    assert pool.status()["accounts"]["available"] == 1, accounts(pool)
+    assert parent_ou(organization, account_id) == config.AWS_PARKING_OU_ID
+    assert assignments(account_id) == []
+    assert session.client("s3", region_name="us-east-1").list_buckets()["Buckets"] == []
+    iam = session.client("iam", region_name="us-east-1")
+    assert iam.list_users()["Users"] == []
+    assert [role["RoleName"] for role in iam.list_roles()["Roles"]] == [config.AWS_ACCOUNT_ACCESS_ROLE_NAME]
+    assert iam.list_policies(Scope="Local")["Policies"] == []
+    assert iam.list_open_id_connect_providers()["OpenIDConnectProviderList"] == []
+    for region in ("us-east-1", "eu-west-1"):
+        ec2 = session.client("ec2", region_name=region)
+        states = [instance["State"]["Name"] for reservation in ec2.describe_instances()["Reservations"]
+                  for instance in reservation["Instances"]]
+        assert set(states) <= {"terminated"}
+        assert ec2.describe_volumes()["Volumes"] == []
+        assert ec2.describe_images(Owners=["self"])["Images"] == []
+        assert ec2.describe_snapshots(OwnerIds=["self"])["Snapshots"] == []
+        assert ec2.describe_addresses()["Addresses"] == []
+        assert all(vpc["IsDefault"] for vpc in ec2.describe_vpcs()["Vpcs"])
+        assert [group["GroupName"] for group in ec2.describe_security_groups()["SecurityGroups"]] in ([], ["default"])
+        assert session.client("rds", region_name=region).describe_db_instances()["DBInstances"] == []
+        assert session.client("dynamodb", region_name=region).list_tables()["TableNames"] == []
+        assert session.client("ecr", region_name=region).describe_repositories()["repositories"] == []
+        assert session.client("logs", region_name=region).describe_log_groups()["logGroups"] == []
+        kms = session.client("kms", region_name=region)
+        assert [alias for alias in kms.list_aliases()["Aliases"] if not alias["AliasName"].startswith("alias/aws/")] == []
+        assert {kms.describe_key(KeyId=key["KeyId"])["KeyMetadata"]["KeyState"] for key in kms.list_keys()["Keys"]} <= {"PendingDeletion"}
+
+
+def test_cleanup_deletes_look_alike_roles_and_resets_the_access_role(pool):
+    available_pool(pool)
+    account_id = accounts(pool)[0]["account_id"]
+    iam = AwsSandboxService.get_account_session(account_id).client("iam", region_name="us-east-1")
+    outside_trust = '{"Version":"2012-10-17","Statement":[{"Effect":"Allow","Principal":{"AWS":"arn:aws:iam::999999999999:root"},"Action":"sts:AssumeRole"}]}'
+    iam.create_role(RoleName="AWSReservedSSO_Admin_0123456789abcdef", AssumeRolePolicyDocument=outside_trust)
+    iam.create_role(RoleName="AWSReservedSSO_Sandbox_0123456789abcdef", Path="/aws-reserved/sso.amazonaws.com/",
+                    AssumeRolePolicyDocument=TRUST_POLICY)
+    access_role = config.AWS_ACCOUNT_ACCESS_ROLE_NAME
+    iam.update_assume_role_policy(RoleName=access_role, PolicyDocument=outside_trust)
+    iam.put_role_policy(RoleName=access_role, PolicyName="extra", PolicyDocument=POLICY)
+    policy_arn = iam.create_policy(PolicyName="extra", PolicyDocument=POLICY)["Policy"]["Arn"]
+    iam.attach_role_policy(RoleName=access_role, PolicyArn=policy_arn)
+
+    AwsSandboxService.cleanup_account(account_id, [])
+
+    roles = {role["RoleName"]: role for role in iam.list_roles()["Roles"]}
+    assert set(roles) == {access_role, "AWSReservedSSO_Sandbox_0123456789abcdef"}
+    trust = roles[access_role]["AssumeRolePolicyDocument"]
+    assert [statement["Principal"] for statement in trust["Statement"]] == [{"AWS": "arn:aws:iam::123456789012:root"}]
+    assert iam.list_role_policies(RoleName=access_role)["PolicyNames"] == ["AdministratorAccess"]
+    assert iam.list_attached_role_policies(RoleName=access_role)["AttachedPolicies"] == []
+    assert iam.list_policies(Scope="Local")["Policies"] == []
+
+
+def test_failed_cleanup_keeps_the_account_out_of_the_pool(pool, monkeypatch):
+    available_pool(pool)
+    account_id = pool.acquire("jane@example.com", [], 1)["account_id"]
+
+    def fail_cleanup(account_id, regions):
+        raise RuntimeError("instances still running")
+
+    monkeypatch.setattr(AwsSandboxService, "cleanup_account", fail_cleanup)
+    pool.release(account_id)
+    wait_for_cleanups(pool)
+
+    assert pool.status()["accounts"]["failed"] == 1
+    assert "instances still running" in accounts(pool)[0]["error"]
+    with pytest.raises(AccountPoolExhaustedError):
+        pool.acquire("john@example.com", [], 1)
+
+
+def test_failed_access_grant_frees_the_account(pool, monkeypatch):
+    available_pool(pool)
+
+    def slow_grant(account_id, user_emails):
+        raise TimeoutError("Timed out waiting for an IAM Identity Center account assignment")
+
+    monkeypatch.setattr(AwsSandboxService, "grant_user_access", slow_grant)
+    with pytest.raises(TimeoutError):
+        pool.acquire("jane@example.com", [], 1)
+    wait_for_cleanups(pool)
+
+    assert pool.status()["accounts"]["available"] == 1
+
+
+def test_instances_sharing_the_store_share_the_pool(organization, tmp_path):
+    first, second = new_pool(tmp_path / "pool.db"), new_pool(tmp_path / "pool.db")
+    for pool in (first, second, first, second):
+        pool.maintain()
+
+    assert first.status()["accounts"]["available"] == 1
+    account_id = second.acquire("jane@example.com", [], 1)["account_id"]
+    assert first.status()["accounts"]["assigned"] == 1
+    first.release(account_id)
+    wait_for_cleanups(first)
+    assert second.status()["accounts"]["available"] == 1
+
+
+def test_cleanups_of_a_stopped_instance_are_taken_over(pool, organization):
+    available_pool(pool)
+    account_id = pool.acquire("jane@example.com", [], 1)["account_id"]
+
+    def lease_to_other_instance(lease_expires_at):
+        def change(state, now):
+            state["accounts"]["1"].update(state="cleaning", lease_owner="stopped-instance", lease_expires_at=lease_expires_at)
+        pool._update(change)
+
+    def state():
+        return next(account["state"] for account in accounts(pool) if account["account_id"] == account_id)
+
+    lease_to_other_instance(time.time() + 600)
+    pool.maintain()
+    wait_for_cleanups(pool)
+    assert state() == "cleaning"
+
+    lease_to_other_instance(time.time() - 1)
+    pool.maintain()
+    wait_for_cleanups(pool)
+    assert state() == "available"
+    assert parent_ou(organization, account_id) == config.AWS_PARKING_OU_ID
+
+
+def test_delete_endpoint_releases_assigned_accounts(pool, monkeypatch):
+    from app.api.v1.endpoints import aws
+
+    available_pool(pool)
+    account_id = pool.acquire("jane@example.com", [], 1)["account_id"]
+    monkeypatch.setattr(aws, "get_aws_account_pool", lambda: pool)
+    app = FastAPI()
+    app.include_router(aws.router, prefix="/api/v1/aws")
+    client = TestClient(app)
+
+    response = client.delete(f"/api/v1/aws/delete/{account_id}")
+    wait_for_cleanups(pool)
+
+    assert response.status_code == 200
+    assert response.json()["account_id"] == account_id
+    assert pool.status()["accounts"]["available"] == 1
+    assert client.delete(f"/api/v1/aws/delete/{account_id}").status_code == 404
+
+
+def test_pool_requires_its_organizational_units_and_email_template(monkeypatch):
+    from app.services import aws_account_pool
+
+    monkeypatch.setattr(aws_account_pool, "_pool_instance", None)
+    monkeypatch.setattr(config, "AWS_SANDBOX_OU_ID", "ou-abcd-11111111")
+    monkeypatch.setattr(config, "AWS_PARKING_OU_ID", "")
+    with pytest.raises(ValueError, match="AWS_PARKING_OU_ID"):
+        aws_account_pool.get_aws_account_pool()
+
+    monkeypatch.setattr(config, "AWS_PARKING_OU_ID", "ou-abcd-22222222")
+    monkeypatch.setattr(config, "AWS_ACCOUNT_EMAIL_TEMPLATE", "aws-sandbox@example.com")
+    with pytest.raises(ValueError, match="AWS_ACCOUNT_EMAIL_TEMPLATE"):
+        aws_account_pool.get_aws_account_pool()
+
+    monkeypatch.setattr(config, "AWS_ACCOUNT_EMAIL_TEMPLATE", "aws-sandbox+{index}@example.com")
+    monkeypatch.setattr(config, "AWS_ACCOUNT_POOL_BACKEND", "local")
+    monkeypatch.setenv("K_SERVICE", "sandbox-provisioner")
+    with pytest.raises(ValueError, match="Cloud Run"):
+        aws_account_pool.get_aws_account_pool()
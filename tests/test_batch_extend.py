@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from fastapi.testclient import TestClient
+from google.protobuf.timestamp_pb2 import Timestamp
+
+from app.services import expiry_scheduler
+from app.services.expiry_scheduler import CloudTasksExpiryScheduler
+from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+
+
+@pytest.fixture
+def fake_gcp(monkeypatch):
+    monkeypatch.setattr(expiry_scheduler, "_scheduler_instance", CloudTasksExpiryScheduler())
+    fake = FakeGCPSandboxService()
+    expiry = Timestamp()
+    expiry.FromDatetime(datetime.now(UTC) + timedelta(hours=1))
+    for project_id in ("jane-doe-1750000000", "john-roe-1750000000"):
+        fake.create_deletion_task(project_id, project_id, expiry)
+    with fake.installed():
+        yield fake
+
+
+def test_requested_projects_excluded_by_other_selectors_are_skipped(fake_gcp):
+    from main import app
+
+    response = TestClient(app).post("/api/v1/gcp/extend/batch", json={
+        "project_ids": ["jane-doe-1750000000", "john-roe-1750000000", "gone-1750000000"],
+        "user_email": "jane.doe@example.com",
+        "extend_by_hours": 2
+    })
+
+    assert response.status_code == 200
+    statuses = {result["project_id"]: result["status"] for result in response.json()["results"]}
+    assert statuses == {
+        "jane-doe-1750000000": "extended",
+        "john-roe-1750000000": "skipped",
+        "gone-1750000000": "not_found"
+    }
+    task_ids = sorted(name.rsplit("/", 1)[1] for name in fake_gcp.tasks)
+    assert task_ids[0].startswith("jane-doe-1750000000-extended-")
+    assert task_ids[1] == "john-roe-1750000000"
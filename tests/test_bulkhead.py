@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app.core.bulkhead import Bulkhead, bulkhead_route_class, bulkhead_timeout, get_bulkhead
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_runs_blocking_calls_and_counts_them():
+    bulkhead = Bulkhead("test", max_concurrency=2, max_queue=0, timeout_seconds=5)
+
+    assert run(bulkhead.run(lambda a, b: a + b, 1, b=2)) == 3
+    assert bulkhead.metrics()["completed_total"] == 1
+    assert bulkhead.metrics()["active"] == 0
+
+
+def test_queues_beyond_concurrency_and_rejects_beyond_queue():
+    bulkhead = Bulkhead("test", max_concurrency=1, max_queue=1, timeout_seconds=5)
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(bulkhead.run(release.wait))
+        queued = asyncio.ensure_future(bulkhead.run(release.wait))
+        await asyncio.sleep(0.1)
+        metrics = bulkhead.metrics()
+        with pytest.raises(HTTPException) as rejected:
+            await bulkhead.run(release.wait)
+        release.set()
+        await asyncio.gather(running, queued)
+        return metrics, rejected.value
+
+    metrics, rejected = run(scenario())
+
+    assert (metrics["active"], metrics["queued"], metrics["saturation"]) == (1, 1, 1.0)
+    assert rejected.status_code == 503
+    assert bulkhead.metrics()["rejected_total"] == 1
+    assert bulkhead.metrics()["completed_total"] == 2
+
+
+def test_times_out_but_keeps_the_slot_until_the_call_returns():
+    bulkhead = Bulkhead("test", max_concurrency=1, max_queue=0, timeout_seconds=0.1)
+    release = threading.Event()
+
+    async def scenario():
+        with pytest.raises(HTTPException) as timed_out:
+            await bulkhead.run(release.wait)
+        still_active = bulkhead.metrics()["active"]
+        release.set()
+        await asyncio.sleep(0.1)
+        return timed_out.value, still_active
+
+    timed_out, still_active = run(scenario())
+
+    assert timed_out.status_code == 504
+    assert still_active == 1
+    assert bulkhead.metrics()["timed_out_total"] == 1
+    assert bulkhead.metrics()["active"] == 0
+
+
+def test_timeout_override_per_call():
+    bulkhead = Bulkhead("test", max_concurrency=1, max_queue=0, timeout_seconds=0.05)
+
+    assert run(bulkhead.run(lambda: threading.Event().wait(0.2) or "done", timeout_seconds=5)) == "done"
+
+
+def test_async_endpoints_are_bounded_too():
+    bulkhead = Bulkhead("test", max_concurrency=1, max_queue=0, timeout_seconds=0.1)
+
+    async def scenario():
+        blocked = asyncio.ensure_future(bulkhead.run_async(asyncio.sleep, 1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as rejected:
+            await bulkhead.run_async(asyncio.sleep, 0)
+        with pytest.raises(HTTPException) as timed_out:
+            await blocked
+        return rejected.value, timed_out.value
+
+    rejected, timed_out = run(scenario())
+
+    assert (rejected.status_code, timed_out.status_code) == (503, 504)
+
+
+def test_route_class_applies_endpoint_timeouts():
+    router = APIRouter(route_class=bulkhead_route_class("azure"))
+
+    @router.get("/slow")
+    @bulkhead_timeout(0.05)
+    def slow():
+        threading.Event().wait(0.3)
+        return {"done": True}
+
+    @router.get("/fast")
+    def fast():
+        return {"done": True}
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    assert client.get("/fast").json() == {"done": True}
+    response = client.get("/slow")
+    assert response.status_code == 504
+    assert "0.05 seconds" in response.json()["detail"]
+    assert get_bulkhead("azure").metrics()["timed_out_total"] >= 1
+
+
+def test_metrics_endpoint_reports_bulkheads():
+    from main import app
+
+    with TestClient(app) as client:
+        client.get("/api/v1/gcp/reports/usage")
+        metrics = client.get("/metrics").json()
+
+    gcp = metrics["bulkheads"]["gcp"]
+    assert set(gcp) == {
+        "max_concurrency", "max_queue", "timeout_seconds", "active", "queued",
+        "saturation", "completed_total", "rejected_total", "timed_out_total"
+    }
+    assert gcp["completed_total"] >= 1
+    assert gcp["timeout_seconds"] == 30
@@ -0,0 +1,168 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions
+
+from app.core import circuit_breaker
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError, ensure_available, get_circuit_breaker, is_breaker_failure
+from app.services import expiry_scheduler
+from app.services.expiry_scheduler import CloudTasksExpiryScheduler
+from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter))
+    return now
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+
+
+def fail():
+    raise exceptions.ServiceUnavailable("down")
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(exceptions.ServiceUnavailable):
+            breaker.call(fail)
+
+
+def test_breaker_opens_at_the_failure_threshold(clock):
+    breaker = CircuitBreaker("billing", failure_threshold=3, recovery_seconds=30)
+
+    for _ in range(2):
+        with pytest.raises(exceptions.ServiceUnavailable):
+            breaker.call(fail)
+    assert breaker.metrics()["state"] == "closed"
+    # A success resets the count of consecutive failures
+    assert breaker.call(lambda: "ok") == "ok"
+    for _ in range(2):
+        with pytest.raises(exceptions.ServiceUnavailable):
+            breaker.call(fail)
+    assert breaker.metrics()["state"] == "closed"
+
+    with pytest.raises(exceptions.ServiceUnavailable):
+        breaker.call(fail)
+    assert breaker.metrics() == {
+        "state": "open", "consecutive_failures": 3, "failures_total": 5, "rejected_total": 0, "opened_total": 1
+    }
+
+
+def test_open_breaker_rejects_calls_with_retry_after(clock):
+    breaker = CircuitBreaker("billing", failure_threshold=1, recovery_seconds=30)
+    open_breaker(breaker)
+    clock[0] += 10
+    calls = []
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.call(calls.append, "called")
+
+    assert calls == []
+    assert rejected.value.names == ["billing"]
+    assert rejected.value.retry_after_seconds == 21
+    assert breaker.retry_after_seconds() == 21
+    assert breaker.metrics()["rejected_total"] == 1
+
+
+def test_half_open_breaker_admits_limited_probes_and_closes_on_success(clock):
+    breaker = CircuitBreaker("billing", failure_threshold=1, recovery_seconds=30, half_open_max_calls=2)
+    open_breaker(breaker)
+    clock[0] += 30
+    assert breaker.is_available()
+    assert breaker.metrics()["state"] == "half_open"
+
+    breaker.before_call()
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.before_call()
+    assert rejected.value.retry_after_seconds == 1
+
+    breaker.record_success()
+    assert breaker.metrics()["state"] == "closed"
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("billing", failure_threshold=3, recovery_seconds=30)
+    open_breaker(breaker)
+    clock[0] += 30
+
+    # One failed probe is enough, the threshold only applies while closed
+    with pytest.raises(exceptions.ServiceUnavailable):
+        breaker.call(fail)
+
+    assert breaker.metrics()["state"] == "open"
+    assert breaker.metrics()["opened_total"] == 2
+    assert not breaker.is_available()
+    assert breaker.retry_after_seconds() == 31
+
+
+@pytest.mark.parametrize("error, counts", [
+    (exceptions.ServiceUnavailable("down"), True),
+    (exceptions.InternalServerError("boom"), True),
+    (exceptions.DeadlineExceeded("slow"), True),
+    (exceptions.TooManyRequests("throttled"), True),
+    (ConnectionError("reset"), True),
+    (exceptions.NotFound("missing"), False),
+    (exceptions.PermissionDenied("denied"), False),
+    (exceptions.AlreadyExists("taken"), False),
+])
+def test_only_api_degradation_counts_as_a_breaker_failure(error, counts):
+    assert is_breaker_failure(error) is counts
+
+
+def test_client_errors_do_not_open_the_breaker(clock):
+    breaker = CircuitBreaker("resource_manager", failure_threshold=1, recovery_seconds=30)
+
+    def not_found():
+        raise exceptions.NotFound("missing")
+
+    with pytest.raises(exceptions.NotFound):
+        breaker.call(not_found)
+
+    assert breaker.metrics()["state"] == "closed"
+    assert breaker.metrics()["failures_total"] == 0
+
+
+def test_ensure_available_lists_every_open_api(clock, breakers):
+    get_circuit_breaker("resource_manager")
+    billing = get_circuit_breaker("billing")
+    tasks = get_circuit_breaker("tasks")
+    open_breaker(billing)
+    clock[0] += 10
+    open_breaker(tasks)
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        ensure_available("resource_manager", "billing", "tasks")
+
+    assert rejected.value.names == ["billing", "tasks"]
+    assert rejected.value.retry_after_seconds == tasks.recovery_seconds + 1
+    ensure_available("resource_manager")
+
+
+def test_create_fails_fast_with_503_and_retry_after_when_an_api_is_open(clock, breakers, monkeypatch):
+    from main import app
+
+    monkeypatch.setattr(expiry_scheduler, "_scheduler_instance", CloudTasksExpiryScheduler())
+    fake = FakeGCPSandboxService()
+    open_breaker(get_circuit_breaker("billing"))
+    clock[0] += 5
+
+    with fake.installed():
+        response = TestClient(app).post("/api/v1/gcp/create", json={
+            "user_email": "jane.doe@example.com",
+            "team_name": "Team-Test"
+        })
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(int(get_circuit_breaker("billing").recovery_seconds) - 5 + 1)
+    assert "billing" in response.json()["detail"]
+    # Nothing was provisioned that the broken API would have left half done
+    assert fake.projects == {}
@@ -0,0 +1,176 @@
+import threading
+import time
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+from app.services.expiry_scheduler import LocalExpiryScheduler, ScheduledExpiry, delete_expired_projects
+from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return LocalExpiryScheduler(str(tmp_path / "expiry.db"), on_expire=lambda batch: [])
+
+
+def test_schedule_persists_across_restarts(tmp_path):
+    expires_at = datetime(2030, 1, 1, tzinfo=UTC)
+    LocalExpiryScheduler(str(tmp_path / "expiry.db")).schedule("jane-doe-1", expires_at)
+
+    assert LocalExpiryScheduler(str(tmp_path / "expiry.db")).get_expiry("jane-doe-1") == expires_at
+
+
+def test_extend_and_reschedule_move_the_expiry(scheduler):
+    expires_at = datetime(2030, 1, 1, tzinfo=UTC)
+    scheduler.schedule("jane-doe-1", expires_at)
+
+    assert scheduler.extend("jane-doe-1", 4) == expires_at + timedelta(hours=4)
+    scheduled = scheduler.list_scheduled()["jane-doe-1"]
+    assert scheduled == ScheduledExpiry("jane-doe-1", expires_at + timedelta(hours=4))
+
+    scheduler.reschedule(scheduled, expires_at + timedelta(hours=6))
+    assert scheduler.get_expiry("jane-doe-1") == expires_at + timedelta(hours=6)
+
+
+def test_extend_unknown_project_raises(scheduler):
+    with pytest.raises(KeyError):
+        scheduler.extend("unknown-1", 4)
+    with pytest.raises(KeyError):
+        scheduler.reschedule(ScheduledExpiry("unknown-1", datetime.now(UTC)), datetime.now(UTC))
+
+
+def test_forget_cancels_the_deletion(scheduler):
+    now = datetime.now(UTC)
+    scheduler.schedule("jane-doe-1", now - timedelta(seconds=1))
+    scheduler.forget("jane-doe-1")
+
+    assert scheduler.get_expiry("jane-doe-1") is None
+    assert scheduler.list_scheduled() == {}
+    assert scheduler._pop_due_batch(now) == []
+
+
+def test_due_batch_holds_only_projects_already_due(scheduler):
+    now = datetime.now(UTC)
+    scheduler.schedule("due-early-1", now - timedelta(minutes=5))
+    scheduler.schedule("due-now-1", now)
+    scheduler.schedule("due-soon-1", now + timedelta(seconds=1))
+
+    assert sorted(scheduler._pop_due_batch(now)) == ["due-early-1", "due-now-1"]
+    assert scheduler._pop_due_batch(now) == []
+    assert scheduler._pop_due_batch(now + timedelta(seconds=1)) == ["due-soon-1"]
+
+
+def test_due_batch_skips_superseded_entries(scheduler):
+    now = datetime.now(UTC)
+    scheduler.schedule("jane-doe-1", now - timedelta(seconds=1))
+    scheduler.extend("jane-doe-1", 1)
+
+    assert scheduler._pop_due_batch(now) == []
+
+
+def test_worker_deletes_due_projects_and_retries_failures(tmp_path):
+    deleted = []
+    done = threading.Event()
+
+    def on_expire(batch):
+        deleted.append(sorted(batch))
+        done.set()
+        return ["failing-1"]
+
+    scheduler = LocalExpiryScheduler(str(tmp_path / "expiry.db"), batch_window_seconds=0, retry_delay_seconds=3600,
+                                     on_expire=on_expire)
+    now = datetime.now(UTC)
+    scheduler.schedule("failing-1", now - timedelta(seconds=1))
+    scheduler.schedule("working-1", now - timedelta(seconds=1))
+    scheduler.schedule("later-1", now + timedelta(hours=1))
+    scheduler.start()
+    try:
+        assert done.wait(timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert deleted == [["failing-1", "working-1"]]
+    assert scheduler.get_expiry("working-1") is None
+    assert scheduler.get_expiry("failing-1") > now + timedelta(minutes=59)
+    assert scheduler.get_expiry("later-1") == now + timedelta(hours=1)
+
+
+def test_worker_waits_out_the_batch_window_but_never_deletes_early(tmp_path):
+    batches = []
+    done = threading.Event()
+
+    def on_expire(batch):
+        batches.append((sorted(batch), datetime.now(UTC)))
+        done.set()
+        return []
+
+    scheduler = LocalExpiryScheduler(str(tmp_path / "expiry.db"), batch_window_seconds=1, on_expire=on_expire)
+    now = datetime.now(UTC)
+    scheduler.schedule("first-1", now)
+    scheduler.schedule("second-1", now + timedelta(milliseconds=500))
+    scheduler.schedule("later-1", now + timedelta(hours=1))
+    assert scheduler._next_wait_seconds(now) == 1
+    scheduler.start()
+    try:
+        assert done.wait(timeout=5)
+    finally:
+        scheduler.stop()
+
+    [(batch, deleted_at)] = batches
+    assert batch == ["first-1", "second-1"]
+    assert now + timedelta(seconds=1) <= deleted_at < now + timedelta(seconds=3)
+    assert list(scheduler.list_scheduled()) == ["later-1"]
+
+
+def test_missing_projects_count_as_deleted():
+    fake = FakeGCPSandboxService()
+    fake.seed_project("jane-doe-1", "folders/1")
+
+    with fake.installed():
+        assert delete_expired_projects(["jane-doe-1", "already-gone-1"]) == []
+    assert fake.projects == {}
+
+
+def test_project_extended_while_being_deleted_is_unscheduled(tmp_path):
+    scheduler = None
+    done = threading.Event()
+
+    def on_expire(batch):
+        scheduler.extend("jane-doe-1", 1)
+        done.set()
+        return []
+
+    scheduler = LocalExpiryScheduler(str(tmp_path / "expiry.db"), batch_window_seconds=0, on_expire=on_expire)
+    scheduler.schedule("jane-doe-1", datetime.now(UTC))
+    scheduler.start()
+    try:
+        assert done.wait(timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert scheduler.get_expiry("jane-doe-1") is None
+
+
+def test_failed_deletions_are_retried_a_limited_number_of_times(tmp_path):
+    attempts = []
+    done = threading.Event()
+
+    def on_expire(batch):
+        attempts.append(batch)
+        if len(attempts) == 3:
+            done.set()
+        return batch
+
+    scheduler = LocalExpiryScheduler(str(tmp_path / "expiry.db"), batch_window_seconds=0, retry_delay_seconds=0,
+                                     max_attempts=3, on_expire=on_expire)
+    scheduler.schedule("failing-1", datetime.now(UTC))
+    scheduler.start()
+    try:
+        assert done.wait(timeout=5)
+        time.sleep(0.2)
+    finally:
+        scheduler.stop()
+
+    assert attempts == [["failing-1"]] * 3
+    assert scheduler.get_expiry("failing-1") is None
+    assert LocalExpiryScheduler(str(tmp_path / "expiry.db")).list_scheduled() == {}
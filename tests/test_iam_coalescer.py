@@ -0,0 +1,136 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.api_core.exceptions import Aborted
+from google.iam.v1 import policy_pb2
+
+from app.services.gcp_sandbox import GCPSandboxService
+from app.services.iam_coalescer import IamPolicyCoalescer, LastMemberError, apply_membership_changes
+
+
+class FakeIamPolicies:
+    """Etag-checked IAM policies of one project, counting reads and writes."""
+
+    def __init__(self, owners, fail_writes=0):
+        self.policy = policy_pb2.Policy(etag=b"1", bindings=[policy_pb2.Binding(role="roles/owner", members=owners)])
+        self.fail_writes = fail_writes
+        self.reads = 0
+        self.writes = 0
+        self.write_started = threading.Event()
+        self.release_writes = threading.Event()
+        self.release_writes.set()
+
+    def get(self, project_id):
+        self.reads += 1
+        policy = policy_pb2.Policy()
+        policy.CopyFrom(self.policy)
+        return policy
+
+    def set(self, project_id, policy):
+        self.write_started.set()
+        self.release_writes.wait()
+        if self.fail_writes:
+            self.fail_writes -= 1
+            # Someone else wrote the policy in between
+            self.policy.etag = str(int(self.policy.etag) + 1).encode()
+        if policy.etag != self.policy.etag:
+            raise Aborted("etag mismatch")
+        self.writes += 1
+        self.policy.CopyFrom(policy)
+        self.policy.etag = str(int(policy.etag) + 1).encode()
+        return self.policy
+
+
+@pytest.fixture
+def policies(monkeypatch):
+    fake = FakeIamPolicies(["user:jane@example.com"])
+    monkeypatch.setattr(GCPSandboxService, "get_sandbox_iam_policy", fake.get)
+    monkeypatch.setattr(GCPSandboxService, "set_sandbox_iam_policy", fake.set)
+    return fake
+
+
+def owners(policy):
+    return sorted(member for binding in policy.bindings if binding.role == "roles/owner" for member in binding.members)
+
+
+def test_apply_membership_changes_keeps_order_and_protected_roles():
+    policy = policy_pb2.Policy(bindings=[policy_pb2.Binding(role="roles/owner", members=["user:a"])])
+
+    errors = apply_membership_changes(policy, [
+        ("roles/owner", ["user:b"], []),
+        ("roles/owner", [], ["user:b"]),
+        ("roles/viewer", ["user:c"], []),
+        ("roles/owner", [], ["user:a"]),
+    ], protected_roles=("roles/owner",))
+
+    assert [type(error) for error in errors] == [type(None)] * 3 + [LastMemberError]
+    assert owners(policy) == ["user:a"]
+    assert [binding.role for binding in policy.bindings] == ["roles/owner", "roles/viewer"]
+
+
+def test_single_update_writes_at_once(policies):
+    policy = IamPolicyCoalescer().update_members("p-1", "roles/owner", add_members=["user:john@example.com"])
+
+    assert owners(policy) == ["user:jane@example.com", "user:john@example.com"]
+    assert (policies.reads, policies.writes) == (1, 1)
+
+
+def test_updates_during_a_write_are_coalesced_into_the_next_one(policies):
+    coalescer = IamPolicyCoalescer()
+    policies.release_writes.clear()
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        first = executor.submit(coalescer.update_members, "p-1", "roles/owner", ["user:u0@example.com"])
+        assert policies.write_started.wait(timeout=5)
+        later = [
+            executor.submit(coalescer.update_members, "p-1", "roles/owner", [f"user:u{i}@example.com"])
+            for i in range(1, 6)
+        ]
+        # Let the later callers join the pending batch before the first write finishes
+        threading.Event().wait(0.2)
+        policies.release_writes.set()
+        results = [first.result(timeout=5)] + [future.result(timeout=5) for future in later]
+
+    assert policies.writes == 2
+    assert owners(results[-1]) == sorted(["user:jane@example.com"] + [f"user:u{i}@example.com" for i in range(6)])
+    assert all(result is results[1] for result in results[1:])
+    assert coalescer._projects == {}
+
+
+def test_stale_etag_is_retried_with_a_fresh_read(policies, monkeypatch):
+    monkeypatch.setattr("app.services.iam_coalescer.time.sleep", lambda seconds: None)
+    policies.fail_writes = 2
+
+    policy = IamPolicyCoalescer(max_attempts=5).update_members("p-1", "roles/owner", ["user:john@example.com"])
+
+    assert owners(policy) == ["user:jane@example.com", "user:john@example.com"]
+    assert (policies.reads, policies.writes) == (3, 1)
+
+
+def test_gives_up_after_max_attempts(policies, monkeypatch):
+    monkeypatch.setattr("app.services.iam_coalescer.time.sleep", lambda seconds: None)
+    policies.fail_writes = 3
+
+    with pytest.raises(Aborted):
+        IamPolicyCoalescer(max_attempts=3).update_members("p-1", "roles/owner", ["user:john@example.com"])
+    assert policies.writes == 0
+
+
+def test_removing_the_last_owner_is_refused(policies):
+    with pytest.raises(LastMemberError):
+        IamPolicyCoalescer().update_members("p-1", "roles/owner", remove_members=["user:jane@example.com"])
+
+    assert owners(policies.policy) == ["user:jane@example.com"]
+    assert policies.writes == 0
+
+
+def test_users_endpoint_rejects_removing_every_owner(policies):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    response = TestClient(app).post("/api/v1/gcp/users", json={
+        "project_id": "p-1", "remove_users": ["jane@example.com"]
+    })
+
+    assert response.status_code == 400
+    assert "at least one owner" in response.json()["detail"]
@@ -0,0 +1,82 @@
+import threading
+from datetime import datetime, timedelta, UTC
+
+from app.services.lifecycle_journal import LifecycleJournal
+
+
+def test_records_are_attributed_from_the_create_event(tmp_path):
+    journal = LifecycleJournal(str(tmp_path))
+    journal.append("create", "jane-doe-1", team="Team-Test", user="jane@example.com", duration_hours=2)
+    journal.append("extend", "jane-doe-1", extend_by_hours=4)
+
+    records = list(journal.read())
+
+    assert [record["event"] for record in records] == ["create", "extend"]
+    assert records[1]["team"] == "Team-Test" and records[1]["user"] == "jane@example.com"
+    assert records[1]["extend_by_hours"] == 4
+
+
+def test_owner_index_survives_restarts_without_replaying_the_journal(tmp_path, monkeypatch):
+    LifecycleJournal(str(tmp_path)).append("create", "jane-doe-1", team="Team-Test", user="jane@example.com")
+
+    monkeypatch.setattr(LifecycleJournal, "read", lambda self, **filters: iter(()))
+    journal = LifecycleJournal(str(tmp_path))
+    record = journal.append("delete", "jane-doe-1")
+
+    assert (record["team"], record["user"]) == ("Team-Test", "jane@example.com")
+    assert journal._owners_db.execute("SELECT COUNT(*) FROM project_owners").fetchone()[0] == 0
+
+
+def test_owner_index_is_built_once_for_existing_journals(tmp_path):
+    journal = LifecycleJournal(str(tmp_path))
+    journal.append("create", "jane-doe-1", team="Team-Test", user="jane@example.com")
+    journal.append("create", "john-roe-1", team="Team-Test", user="john@example.com")
+    journal.append("expire", "john-roe-1")
+    (tmp_path / LifecycleJournal.OWNER_INDEX_NAME).unlink()
+
+    rebuilt = LifecycleJournal(str(tmp_path))
+
+    assert rebuilt._owners_db.execute("SELECT project_id FROM project_owners").fetchall() == [("jane-doe-1",)]
+
+
+def test_concurrent_appends_are_stored_in_timestamp_order(tmp_path):
+    journal = LifecycleJournal(str(tmp_path))
+
+    def append_many(worker):
+        for index in range(200):
+            journal.append("extend", f"project-{worker}-{index}")
+
+    threads = [threading.Thread(target=append_many, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    timestamps = [record["timestamp"] for record in journal.read()]
+    assert len(timestamps) == 800
+    assert timestamps == sorted(timestamps)
+
+
+def test_time_filters_treat_naive_values_as_utc(tmp_path):
+    journal = LifecycleJournal(str(tmp_path))
+    journal.append("create", "jane-doe-1", team="Team-Test", user="jane@example.com")
+    now = datetime.now(UTC)
+
+    naive_before = (now - timedelta(minutes=1)).replace(tzinfo=None)
+    naive_after = (now + timedelta(minutes=1)).replace(tzinfo=None)
+
+    assert len(list(journal.read(since=naive_before))) == 1
+    assert list(journal.read(since=naive_after)) == []
+    assert list(journal.read(until=naive_before)) == []
+    assert len(list(journal.read(until=naive_after))) == 1
+
+
+def test_filters_by_team_and_user_across_segments(tmp_path):
+    journal = LifecycleJournal(str(tmp_path), segment_max_bytes=200)
+    for index in range(10):
+        journal.append("create", f"jane-doe-{index}", team="Team-A" if index % 2 else "Team-B", user="jane@example.com")
+
+    assert len(list(tmp_path.glob("*.journal"))) > 1
+    assert [record["project_id"] for record in journal.read(team="Team-A")] == [f"jane-doe-{i}" for i in range(1, 10, 2)]
+    assert len(list(journal.read(user="jane@example.com"))) == 10
+    assert list(journal.read(user="john@example.com")) == []
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.core import profiler
+from app.core.profiler import ProfileSession, SlowRequestProfilerMiddleware, StackSampler, list_profiles
+
+
+def test_profiles_are_named_after_the_route_template(tmp_path):
+    router = APIRouter()
+
+    @router.get("/projects/{project_id}")
+    async def get_project(project_id: str):
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return {"project_id": project_id}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1/gcp")
+    app.add_middleware(SlowRequestProfilerMiddleware, threshold_ms=0, sample_interval_ms=1,
+                       output_dir=str(tmp_path), max_dir_bytes=1024 * 1024)
+
+    # A project ID that also appears in the prefix must not be templated there
+    assert TestClient(app).get("/api/v1/gcp/projects/gcp").status_code == 200
+
+    [profile] = list_profiles(str(tmp_path))
+    assert profile["route"] == "api-v1-gcp-projects-project-id"
+    assert profile["project_id"] == "gcp"
+
+
+def test_idle_event_loop_samples_are_dropped():
+    sampler = StackSampler(0.001)
+    session = ProfileSession(loop_thread_id=threading.get_ident())
+    idle = threading.Event()
+
+    async def busy():
+        deadline = asyncio.get_running_loop().time() + 0.05
+        while asyncio.get_running_loop().time() < deadline:
+            pass
+
+    async def scenario():
+        sampler.add(session)
+        await busy()
+        busy_samples = sum(session.samples.values())
+        # Blocks the loop outside of any coroutine, as the loop does while waiting for I/O
+        await asyncio.get_running_loop().run_in_executor(None, idle.wait, 0.05)
+        sampler.remove(session)
+        return busy_samples
+
+    busy_samples = asyncio.run(scenario())
+
+    assert busy_samples > 0
+    assert all("scenario" in stack for stack in session.samples)
+    assert not any("select" in stack for stack in session.samples)
+
+
+def test_remove_waits_for_the_sampling_pass_in_progress():
+    sampler = StackSampler(0.001)
+    session = ProfileSession()
+    worker_done = threading.Event()
+    worker = threading.Thread(target=worker_done.wait)
+    worker.start()
+    session.thread_ids.add(worker.ident)
+    in_pass = threading.Event()
+    finish_pass = threading.Event()
+    fold = sampler._fold
+
+    def slow_fold(frame):
+        in_pass.set()
+        finish_pass.wait(timeout=5)
+        return fold(frame)
+
+    sampler._fold = slow_fold
+    sampler.add(session)
+    try:
+        assert in_pass.wait(timeout=5)
+        remover = threading.Thread(target=sampler.remove, args=(session,))
+        remover.start()
+        remover.join(timeout=0.1)
+        assert remover.is_alive()
+
+        finish_pass.set()
+        remover.join(timeout=5)
+        assert not remover.is_alive()
+        samples = dict(session.samples)
+        time.sleep(0.05)
+        assert samples and dict(session.samples) == samples
+    finally:
+        finish_pass.set()
+        worker_done.set()
+        worker.join()
+
+
+def test_admin_endpoints_are_disabled_by_default():
+    from main import app
+
+    assert TestClient(app).get("/api/v1/admin/profiles").status_code == 404
+
+
+def test_admin_endpoints_require_the_bearer_token(tmp_path, monkeypatch):
+    from app.api.v1.endpoints import admin
+
+    monkeypatch.setattr(profiler.config, "PROFILER_OUTPUT_DIR", str(tmp_path))
+    app = FastAPI()
+    app.include_router(admin.router, prefix="/api/v1/admin")
+    client = TestClient(app)
+
+    assert client.get("/api/v1/admin/profiles").status_code == 401
+    assert client.get("/api/v1/admin/profiles", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/api/v1/admin/profiles", headers={"Authorization": "Bearer test-admin-token"})
+    assert response.status_code == 200
+    assert response.json() == {"profiles": []}
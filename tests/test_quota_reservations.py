@@ -0,0 +1,276 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services import expiry_scheduler, quota_reservations
+from app.services.expiry_scheduler import CloudTasksExpiryScheduler
+from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+from app.services.quota_reservations import (
+    GCSQuotaStore, QuotaConflictError, QuotaExceededError, QuotaReservations, Reservation, SQLiteQuotaStore,
+    get_quota_reservations
+)
+
+
+@pytest.fixture
+def no_singleton(monkeypatch):
+    monkeypatch.setattr(quota_reservations, "_quota_reservations_instance", None)
+
+
+def test_gcs_backend_requires_a_bucket(no_singleton, monkeypatch):
+    monkeypatch.setattr(quota_reservations.config, "QUOTA_STORE_BACKEND", "gcs")
+    monkeypatch.setattr(quota_reservations.config, "QUOTA_STORE_BUCKET", "")
+
+    with pytest.raises(ValueError, match="QUOTA_STORE_BUCKET"):
+        get_quota_reservations()
+
+
+def test_local_backend_is_refused_on_cloud_run(no_singleton, monkeypatch):
+    monkeypatch.setattr(quota_reservations.config, "QUOTA_STORE_BACKEND", "local")
+    monkeypatch.setenv("K_SERVICE", "gcp-sandbox-provisioner")
+
+    with pytest.raises(ValueError, match="QUOTA_STORE_BACKEND=gcs"):
+        get_quota_reservations()
+
+
+def test_reservations_count_against_the_limit(tmp_path):
+    reservations = QuotaReservations(SQLiteQuotaStore(str(tmp_path / "quota.db")), lease_seconds=60)
+
+    first = reservations.reserve("jane-doe", "jane-doe-1", 2, set())
+    reservations.reserve("jane-doe", "jane-doe-2", 2, set())
+    with pytest.raises(QuotaExceededError):
+        reservations.reserve("jane-doe", "jane-doe-3", 2, set())
+    reservations.release(first)
+    reservations.reserve("jane-doe", "jane-doe-3", 2, set())
+
+
+class RacingStore(SQLiteQuotaStore):
+    """Lets the first `racers` reads all see the same version before any of them writes."""
+
+    def __init__(self, db_path, racers):
+        super().__init__(db_path)
+        self._barrier = threading.Barrier(racers)
+        self.rejected_writes = 0
+
+    def read(self, key):
+        result = super().read(key)
+        if self._barrier is not None:
+            try:
+                self._barrier.wait(timeout=5)
+            except threading.BrokenBarrierError:
+                pass
+            self._barrier = None
+        return result
+
+    def write(self, key, value, expected_version):
+        written = super().write(key, value, expected_version)
+        if not written:
+            self.rejected_writes += 1
+        return written
+
+
+def race(reservations, limit):
+    outcomes = []
+
+    def reserve(project_id):
+        try:
+            outcomes.append(reservations.reserve("jane-doe", project_id, limit, set()))
+        except QuotaExceededError as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=reserve, args=(f"jane-doe-{i}",)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def test_reservation_that_loses_the_race_retries(tmp_path):
+    store = RacingStore(str(tmp_path / "quota.db"), racers=2)
+    reservations = QuotaReservations(store, lease_seconds=60)
+
+    outcomes = race(reservations, limit=2)
+
+    assert store.rejected_writes == 1
+    assert all(isinstance(outcome, Reservation) for outcome in outcomes)
+    record, _ = store.read("jane-doe")
+    assert sorted(r["project_id"] for r in record["reservations"].values()) == ["jane-doe-0", "jane-doe-1"]
+
+
+def test_reservation_that_loses_the_race_for_the_last_slot_is_refused(tmp_path):
+    store = RacingStore(str(tmp_path / "quota.db"), racers=2)
+    reservations = QuotaReservations(store, lease_seconds=60)
+
+    outcomes = race(reservations, limit=1)
+
+    assert store.rejected_writes == 1
+    assert sorted(type(outcome).__name__ for outcome in outcomes) == ["QuotaExceededError", "Reservation"]
+    record, _ = store.read("jane-doe")
+    assert len(record["reservations"]) == 1
+
+
+def test_reservation_gives_up_when_every_write_conflicts(tmp_path):
+    class ConflictingStore(SQLiteQuotaStore):
+        def write(self, key, value, expected_version):
+            return False
+
+    reservations = QuotaReservations(ConflictingStore(str(tmp_path / "quota.db")), max_attempts=3)
+
+    with pytest.raises(QuotaConflictError):
+        reservations.reserve("jane-doe", "jane-doe-1", 2, set())
+
+
+def test_commit_renews_the_lease_and_expired_leases_stop_counting(tmp_path, monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(quota_reservations.time, "time", lambda: now[0])
+    reservations = QuotaReservations(SQLiteQuotaStore(str(tmp_path / "quota.db")), lease_seconds=60)
+
+    committed = reservations.reserve("jane-doe", "jane-doe-1", 2, set())
+    reservations.reserve("jane-doe", "jane-doe-2", 2, set())
+    now[0] += 50
+    reservations.commit(committed)
+    record, _ = reservations.store.read("jane-doe")
+    assert record["reservations"][committed.reservation_id] == {
+        "project_id": "jane-doe-1", "state": "committed", "lease_expires_at": now[0] + 60
+    }
+
+    # The pending reservation's lease ran out, the committed one was renewed
+    now[0] += 20
+    reservations.reserve("jane-doe", "jane-doe-3", 2, set())
+    with pytest.raises(QuotaExceededError):
+        reservations.reserve("jane-doe", "jane-doe-4", 2, set())
+
+    # Once the committed lease ends the project only counts while it is listed as active
+    now[0] += 60
+    with pytest.raises(QuotaExceededError):
+        reservations.reserve("jane-doe", "jane-doe-4", 2, {"jane-doe-1", "jane-doe-3"})
+    reservations.reserve("jane-doe", "jane-doe-4", 2, {"jane-doe-1"})
+
+
+def test_release_project_frees_its_slot(tmp_path):
+    reservations = QuotaReservations(SQLiteQuotaStore(str(tmp_path / "quota.db")), lease_seconds=60)
+    reservations.commit(reservations.reserve("jane-doe", "jane-doe-1", 2, set()))
+    reservations.reserve("jane-doe", "jane-doe-2", 2, set())
+
+    reservations.release_project("jane-doe", "jane-doe-1")
+    reservations.release_project("jane-doe", "jane-doe-unknown")
+
+    record, _ = reservations.store.read("jane-doe")
+    assert [r["project_id"] for r in record["reservations"].values()] == ["jane-doe-2"]
+    reservations.reserve("jane-doe", "jane-doe-3", 2, set())
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.generation = bucket.objects.get(name, (None, None))[1]
+
+    def download_as_bytes(self, if_generation_match=None):
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+
+        if self.name not in self.bucket.objects:
+            raise NotFound(self.name)
+        data, generation = self.bucket.objects[self.name]
+        if if_generation_match is not None and if_generation_match != generation:
+            raise PreconditionFailed(self.name)
+        return data
+
+    def upload_from_string(self, data, content_type=None, if_generation_match=None):
+        from google.api_core.exceptions import PreconditionFailed
+
+        generation = self.bucket.objects.get(self.name, (None, 0))[1]
+        if if_generation_match is not None and if_generation_match != generation:
+            raise PreconditionFailed(self.name)
+        self.bucket.next_generation += 1
+        self.bucket.objects[self.name] = (data.encode(), self.bucket.next_generation)
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.next_generation = 1000
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if name in self.objects else None
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+@pytest.fixture
+def fake_bucket(monkeypatch):
+    from google.cloud import storage
+
+    bucket = FakeBucket()
+    monkeypatch.setattr(storage, "Client", lambda: SimpleNamespace(bucket=lambda name: bucket))
+    return bucket
+
+
+def test_gcs_store_writes_are_conditional_on_the_generation(fake_bucket):
+    store = GCSQuotaStore("quota-bucket")
+
+    assert store.read("jane-doe") == (None, None)
+    assert store.write("jane-doe", {"reservations": {}}, None)
+    # Creating it again must fail, the object exists now
+    assert not store.write("jane-doe", {"reservations": {"a": {}}}, None)
+
+    record, generation = store.read("jane-doe")
+    assert record == {"reservations": {}}
+    assert "quota/jane-doe.json" in fake_bucket.objects
+    assert store.write("jane-doe", {"reservations": {"b": {}}}, generation)
+    # A writer still holding the old generation lost the race
+    assert not store.write("jane-doe", {"reservations": {"c": {}}}, generation)
+    assert store.read("jane-doe")[0] == {"reservations": {"b": {}}}
+
+
+def test_gcs_store_rereads_a_record_changed_during_the_read(fake_bucket):
+    store = GCSQuotaStore("quota-bucket")
+    store.write("jane-doe", {"reservations": {}}, None)
+    get_blob = fake_bucket.get_blob
+
+    def get_then_overwrite(name):
+        blob = get_blob(name)
+        fake_bucket.get_blob = get_blob
+        FakeBlob(fake_bucket, name).upload_from_string('{"reservations": {"x": {}}}')
+        return blob
+
+    fake_bucket.get_blob = get_then_overwrite
+    record, generation = store.read("jane-doe")
+
+    assert record == {"reservations": {"x": {}}}
+    assert generation == fake_bucket.objects["quota/jane-doe.json"][1]
+
+
+def test_gcs_backed_reservations_count_against_the_limit(fake_bucket):
+    reservations = QuotaReservations(GCSQuotaStore("quota-bucket"), lease_seconds=60)
+
+    reservations.reserve("jane-doe", "jane-doe-1", 1, set())
+    with pytest.raises(QuotaExceededError):
+        reservations.reserve("jane-doe", "jane-doe-2", 1, set())
+
+
+def test_create_releases_its_reservation_when_provisioning_fails(no_singleton, tmp_path, monkeypatch):
+    from google.api_core.exceptions import InternalServerError
+    from main import app
+
+    reservations = QuotaReservations(SQLiteQuotaStore(str(tmp_path / "quota.db")), lease_seconds=60)
+    monkeypatch.setattr(quota_reservations, "_quota_reservations_instance", reservations)
+    monkeypatch.setattr(expiry_scheduler, "_scheduler_instance", CloudTasksExpiryScheduler())
+    fake = FakeGCPSandboxService()
+
+    def fail_billing(project_id):
+        raise InternalServerError("billing is down")
+
+    fake.update_project_billing_info = fail_billing
+    with fake.installed():
+        response = TestClient(app, raise_server_exceptions=False).post("/api/v1/gcp/create", json={
+            "user_email": "jane.doe@example.com",
+            "team_name": "Team-Test"
+        })
+
+    assert response.status_code == 500
+    record, _ = reservations.store.read("jane-doe")
+    assert record == {"reservations": {}}
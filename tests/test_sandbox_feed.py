@@ -0,0 +1,70 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+from app.services import sandbox_feed
+from app.services.lifecycle_journal import LifecycleJournal
+from app.services.sandbox_feed import SandboxFeed
+from app.services.usage_rollups import UsageRollups
+
+T0 = datetime(2025, 6, 1, 10, tzinfo=UTC)
+
+
+def event(name, project_id, minutes, **fields):
+    return {"event": name, "project_id": project_id, "timestamp": (T0 + timedelta(minutes=minutes)).isoformat(), **fields}
+
+
+@pytest.fixture
+def rollups(tmp_path, monkeypatch):
+    rollups = UsageRollups(str(tmp_path / "usage.db"))
+    monkeypatch.setattr(sandbox_feed, "get_usage_rollups", lambda: rollups)
+    return rollups
+
+
+def test_snapshot_is_seeded_from_the_rollups_without_reading_the_journal(rollups, monkeypatch):
+    def no_replay(self, **filters):
+        raise AssertionError("the journal must not be replayed")
+
+    monkeypatch.setattr(LifecycleJournal, "read", no_replay)
+    for record in [
+        event("create", "jane-doe-1", 0, team="Team-Test", user="jane@example.com", expires_at="2025-06-01T12:00:00+00:00"),
+        event("create", "john-roe-1", 1, team="Team-Test", user="john@example.com", expires_at="2025-06-01T12:01:00+00:00"),
+        event("extend", "jane-doe-1", 2, expires_at="2025-06-01T16:00:00+00:00"),
+        event("delete", "john-roe-1", 3),
+    ]:
+        rollups.apply_event(record)
+
+    assert SandboxFeed().snapshot(team="Team-Test") == [{
+        "project_id": "jane-doe-1",
+        "team": "Team-Test",
+        "user": "jane@example.com",
+        "created_at": T0.isoformat(),
+        "expires_at": "2025-06-01T16:00:00+00:00"
+    }]
+
+
+def test_subscribers_get_a_snapshot_then_matching_changes(rollups):
+    feed = SandboxFeed(keepalive_seconds=5)
+    rollups.apply_event(event("create", "jane-doe-1", 0, team="Team-Test", user="jane@example.com"))
+
+    async def scenario():
+        stream = feed.subscribe(user="jane@example.com")
+        snapshot = await anext(stream)
+        for record in [
+            event("create", "john-roe-1", 1, team="Team-Test", user="john@example.com"),
+            event("delete", "jane-doe-1", 2, team="Team-Test", user="jane@example.com"),
+        ]:
+            rollups.apply_event(record)
+            feed.publish(record)
+        change = await asyncio.wait_for(anext(stream), timeout=5)
+        await stream.aclose()
+        return snapshot, change
+
+    snapshot, change = asyncio.run(scenario())
+
+    assert snapshot.startswith("event: snapshot\n")
+    assert [sandbox["project_id"] for sandbox in json.loads(snapshot.split("data: ")[1])["sandboxes"]] == ["jane-doe-1"]
+    assert change.startswith("event: delete\n")
+    assert [sandbox["project_id"] for sandbox in feed.snapshot()] == ["john-roe-1"]
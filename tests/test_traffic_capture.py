@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from google.api_core.exceptions import ServiceUnavailable
+
+from app.core import circuit_breaker
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.traffic_capture import TrafficCaptureMiddleware, anonymize, anonymize_email, anonymize_project_id
+from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+from app.services.gcp_sandbox import GCPSandboxService
+
+
+def test_pseudonyms_are_keyed_and_line_up_with_project_ids():
+    email = anonymize_email("jane.doe@example.com", "secret-1")
+    project_id = anonymize_project_id("jane-doe-1750000000", "secret-1")
+
+    assert email.endswith("@example.com") and "jane" not in email
+    assert project_id == email.split("@")[0] + "-1750000000"
+    assert anonymize_email("jane.doe@example.com", "secret-2") != email
+    assert anonymize({"user_email": "jane.doe@example.com", "team_name": "Team-Test", "note": "poc"}, "secret-1") == {
+        "user_email": email, "team_name": "Team-Test", "note": "xxx"
+    }
+
+
+def test_capture_requires_a_secret(tmp_path):
+    with pytest.raises(ValueError):
+        TrafficCaptureMiddleware(FastAPI(), str(tmp_path / "trace.ndjson"), secret="")
+
+
+def test_requests_are_recorded_with_their_route_template(tmp_path):
+    router = APIRouter()
+
+    @router.delete("/delete/{project_id}")
+    def delete(project_id: str):
+        return {"project_id": project_id}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1/gcp")
+    trace_path = tmp_path / "trace.ndjson"
+    app.add_middleware(TrafficCaptureMiddleware, trace_path=str(trace_path), secret="secret-1")
+
+    # The project ID also appears in the prefix and must not be templated there
+    TestClient(app).delete("/api/v1/gcp/delete/gcp")
+
+    header, record = [json.loads(line) for line in trace_path.read_text().splitlines()]
+    assert header["v"] == 1
+    assert record["r"] == "/api/v1/gcp/delete/{project_id}"
+    assert record["s"] == 200 and "pid" not in record
+
+
+def test_stand_in_calls_go_through_the_circuit_breakers(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    monkeypatch.setattr(circuit_breaker.config, "CIRCUIT_BREAKER_FAILURE_THRESHOLD", 2)
+    fake = FakeGCPSandboxService()
+    calls = []
+
+    def unavailable(project_id):
+        calls.append(project_id)
+        raise ServiceUnavailable("billing is down")
+
+    monkeypatch.setattr(fake, "unlink_project_billing_info", unavailable)
+    with fake.installed():
+        for _ in range(2):
+            with pytest.raises(ServiceUnavailable):
+                GCPSandboxService.unlink_project_billing_info("p-1")
+        with pytest.raises(CircuitOpenError):
+            GCPSandboxService.unlink_project_billing_info("p-1")
+
+    assert len(calls) == 2
+    assert circuit_breaker.get_circuit_breaker("billing").metrics()["state"] == "open"
+
+
+def test_streams_are_not_captured_and_replayed_streams_are_cut_off(tmp_path):
+    from fastapi.responses import StreamingResponse
+    from app.utils.asgi import asgi_request
+
+    router = APIRouter()
+
+    @router.get("/feed")
+    async def feed():
+        async def events():
+            while True:
+                yield b": keepalive\n\n"
+                await asyncio.sleep(0.01)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api/v1/gcp")
+    trace_path = tmp_path / "trace.ndjson"
+    app.add_middleware(TrafficCaptureMiddleware, trace_path=str(trace_path), secret="secret-1")
+
+    def request(**limits):
+        return asyncio.run(asyncio.wait_for(asgi_request(app, "GET", "/api/v1/gcp/feed", "", b"", **limits), timeout=5))
+
+    status, body = request(max_seconds=0.1)
+    assert status == 200 and body.startswith(b": keepalive")
+    status, body = request(max_body_bytes=100)
+    assert 100 <= len(body) < 200
+    assert len(trace_path.read_text().splitlines()) == 1
+
+
+def test_replay_of_a_trace_with_a_stream_finishes(tmp_path, monkeypatch):
+    import traffic_replay
+
+    # Replay points the service state at its own directory; restore the test settings after
+    for name in ("TRAFFIC_CAPTURE_ENABLED", "PROFILER_ENABLED", "JOURNAL_DIR", "USAGE_ROLLUPS_DB_PATH",
+                 "LOCAL_SCHEDULER_DB_PATH", "QUOTA_STORE_BACKEND", "QUOTA_STORE_DB_PATH"):
+        monkeypatch.setenv(name, os.environ.get(name, ""))
+    trace_path = tmp_path / "trace.ndjson"
+    trace_path.write_text(
+        json.dumps({"v": 1, "started_at": "2026-01-01T00:00:00+00:00"}) + "\n"
+        + json.dumps({"t": 0, "m": "GET", "r": "/api/v1/gcp/feed", "g": [], "s": 200, "d": 60000.0}) + "\n"
+        + json.dumps({"t": 10, "m": "GET", "r": "/health", "g": [], "s": 200, "d": 1.0}) + "\n"
+    )
+
+    results = asyncio.run(asyncio.wait_for(traffic_replay.replay(str(trace_path), 1, max_response_seconds=0.5), timeout=20))
+
+    assert results["overall"]["requests"] == 2
+    assert results["errors"] == 0
@@ -0,0 +1,117 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+from app.services.usage_rollups import UsageRollups
+
+T0 = datetime(2025, 6, 1, 10, tzinfo=UTC).timestamp()
+HOUR = 3600
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    return UsageRollups(str(tmp_path / "usage.db"))
+
+
+def test_running_sandboxes_count_towards_hour_and_day_buckets(rollups):
+    rollups.record_create("jane-doe-1", "Team-Test", "jane@example.com", T0 - HOUR / 2)
+    now = T0 + HOUR / 4
+
+    current = rollups.get_usage("team", "Team-Test", "hour", "2025-06-01T10", now=now)
+    previous = rollups.get_usage("team", "Team-Test", "hour", "2025-06-01T09", now=now)
+    day = rollups.get_usage("user", "jane@example.com", "day", "2025-06-01", now=now)
+
+    assert current["sandbox_hours"] == 0.25
+    assert previous["sandbox_hours"] == 0.5
+    assert day["sandbox_hours"] == 0.75
+    assert rollups.get_usage("team", "Team-Other", "day", "2025-06-01", now=now)["sandbox_hours"] == 0
+
+
+def test_active_count_is_taken_at_the_end_of_past_buckets(rollups):
+    rollups.record_create("jane-doe-1", "Team-Test", "jane@example.com", T0 + 60)
+    rollups.record_create("john-roe-1", "Team-Test", "john@example.com", T0 + HOUR + 60)
+    rollups.record_delete("jane-doe-1", T0 + 2 * HOUR + 60)
+    now = T0 + 2 * HOUR + 120
+
+    counts = [
+        rollups.get_usage("all", "", "hour", bucket, now=now)["active_count"]
+        for bucket in ("2025-06-01T09", "2025-06-01T10", "2025-06-01T11", "2025-06-01T12")
+    ]
+
+    assert counts == [0, 1, 2, 1]
+    assert rollups.get_usage("user", "john@example.com", "hour", "2025-06-01T10", now=now)["active_count"] == 0
+
+
+def test_bucket_reads_only_search_covering_or_open_project_indexes(rollups):
+    rollups.record_create("jane-doe-1", "Team-Test", "jane@example.com", T0)
+    queries = []
+    rollups._db.set_trace_callback(queries.append)
+    for scope, key in (("all", ""), ("team", "Team-Test"), ("user", "jane@example.com")):
+        rollups.get_usage(scope, key, "hour", "2025-06-01T09", now=T0 + HOUR)
+    rollups._db.set_trace_callback(None)
+
+    plans = [
+        detail
+        for query in queries if "FROM usage_projects" in query
+        for *_, detail in rollups._db.execute(f"EXPLAIN QUERY PLAN {query}")
+    ]
+    assert len(plans) == 6
+    assert all(detail.startswith("SEARCH") for detail in plans)
+    assert all("COVERING INDEX" in detail or "_open" in detail for detail in plans)
+    assert sum("_open" in detail for detail in plans) == 3
+
+
+def test_databases_without_expiries_are_migrated(tmp_path):
+    db_path = str(tmp_path / "usage.db")
+    db = sqlite3.connect(db_path)
+    db.execute("CREATE TABLE usage_projects (project_id TEXT PRIMARY KEY, team TEXT, user TEXT, "
+               "created_at REAL NOT NULL, deleted_at REAL, extensions INTEGER NOT NULL DEFAULT 0)")
+    db.execute("INSERT INTO usage_projects (project_id, team, user, created_at) VALUES ('jane-doe-1', 'Team-Test', 'jane@example.com', 0)")
+    db.commit()
+    db.close()
+
+    rollups = UsageRollups(db_path)
+    rollups.record_extend("jane-doe-1", HOUR, "2025-06-01T16:00:00+00:00")
+
+    assert [project["expires_at"] for project in rollups.list_open_projects()] == ["2025-06-01T16:00:00+00:00"]
+
+
+def test_malformed_bucket_is_rejected(rollups):
+    with pytest.raises(ValueError):
+        rollups.get_usage("all", "", "hour", "2025-06-01")
+
+
+def test_rebuild_matches_incremental_updates(tmp_path):
+    rng = random.Random(7)
+    records, open_projects = [], []
+    timestamp = datetime.fromtimestamp(T0, UTC)
+    for i in range(300):
+        timestamp += timedelta(minutes=rng.randint(1, 90))
+        if open_projects and rng.random() < 0.45:
+            project_id, team, user = open_projects.pop(rng.randrange(len(open_projects)))
+            event = rng.choice(["delete", "expire"])
+        elif open_projects and rng.random() < 0.2:
+            project_id, team, user = rng.choice(open_projects)
+            event = "extend"
+        else:
+            project_id, team, user = f"p-{i}", rng.choice(["Team-A", "Team-B"]), f"u{rng.randint(0, 4)}@example.com"
+            open_projects.append((project_id, team, user))
+            event = "create"
+        records.append({"event": event, "project_id": project_id, "team": team, "user": user,
+                        "timestamp": timestamp.isoformat(), "expires_at": (timestamp + timedelta(hours=4)).isoformat()})
+
+    incremental = UsageRollups(str(tmp_path / "incremental.db"))
+    for record in records:
+        incremental.apply_event(record)
+    rebuilt = UsageRollups(str(tmp_path / "rebuilt.db"))
+    rebuilt.rebuild(records)
+
+    now = timestamp.timestamp() + HOUR
+    for scope, key in [("all", ""), ("team", "Team-A"), ("user", "u3@example.com")]:
+        for granularity, bucket in [("total", None), ("day", "2025-06-02"), ("hour", "2025-06-03T05")]:
+            assert incremental.get_usage(scope, key, granularity, bucket, now=now) == \
+                rebuilt.get_usage(scope, key, granularity, bucket, now=now)
+    assert incremental.list_open_projects() == rebuilt.list_open_projects()
+    assert len(incremental.list_open_projects()) == len(open_projects)
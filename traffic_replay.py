@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Replays a captured traffic trace against the app with a local GCP stand-in,
+and compares the results of two replays (e.g. two builds).
+
+    python traffic_replay.py replay traffic_capture.ndjson --speed 2 --output candidate.json
+    python traffic_replay.py replay traffic_capture.ndjson --max-response-seconds 5
+    python traffic_replay.py compare baseline.json candidate.json --max-regression 10
+
+Traces are recorded by setting TRAFFIC_CAPTURE_ENABLED=true on the service. Responses
+still streaming after --max-response-seconds or beyond --max-response-bytes are cut off,
+so streams in traces recorded before they were left out of capture can't stall a replay.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta, UTC
+from urllib.parse import urlencode
+
+from app.core.traffic_capture import referenced_project_ids
+from app.utils.asgi import asgi_request
+
+_recorded_latencies = contextvars.ContextVar("recorded_latencies", default=None)
+
+
+def load_trace(trace_path):
+    """Reads a trace file, returning its header and its request records in arrival order."""
+    with open(trace_path) as trace_file:
+        header = json.loads(trace_file.readline())
+        records = [json.loads(line) for line in trace_file if line.strip()]
+    if header.get("v") != 1:
+        raise ValueError(f"Unsupported trace format version {header.get('v')}")
+    return header, sorted(records, key=lambda record: record["t"])
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms, duration_seconds):
+    latencies_ms = sorted(latencies_ms)
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / duration_seconds, 3) if duration_seconds else None,
+        "p50_ms": percentile(latencies_ms, 0.50),
+        "p90_ms": percentile(latencies_ms, 0.90),
+        "p99_ms": percentile(latencies_ms, 0.99),
+        "max_ms": latencies_ms[-1] if latencies_ms else None
+    }
+
+
+def map_project_ids(value, project_id_map):
+    """Replaces captured project IDs anywhere in a payload with their replayed counterparts."""
+    if isinstance(value, dict):
+        return {k: map_project_ids(v, project_id_map) for k, v in value.items()}
+    if isinstance(value, list):
+        return [map_project_ids(item, project_id_map) for item in value]
+    if isinstance(value, str):
+        return project_id_map.get(value, value)
+    return value
+
+
+async def replay(trace_path, speed, max_response_seconds=30, max_response_bytes=1024 * 1024):
+    # Keep replay state out of the working directory and never capture the replay itself
+    state_dir = tempfile.mkdtemp(prefix="traffic-replay-")
+    os.environ["TRAFFIC_CAPTURE_ENABLED"] = "false"
+    os.environ["PROFILER_ENABLED"] = "false"
+    os.environ["JOURNAL_DIR"] = os.path.join(state_dir, "journal")
+    os.environ["USAGE_ROLLUPS_DB_PATH"] = os.path.join(state_dir, "usage_rollups.db")
+    os.environ["LOCAL_SCHEDULER_DB_PATH"] = os.path.join(state_dir, "sandbox_expiry.db")
+    os.environ["QUOTA_STORE_BACKEND"] = "local"
+    os.environ["QUOTA_STORE_DB_PATH"] = os.path.join(state_dir, "quota_reservations.db")
+
+    from main import app, config
+    from app.services.expiry_scheduler import get_expiry_scheduler
+    from app.services.fake_gcp_sandbox import FakeGCPSandboxService
+
+    header, records = load_trace(trace_path)
+
+    # Recorded latencies of the request being served, falling back to the per-API median
+    medians = defaultdict(list)
+    for record in records:
+        for api, latency_ms in record.get("g", []):
+            medians[api].append(latency_ms)
+    medians = {api: statistics.median(values) for api, values in medians.items()}
+
+    def latency_for(api):
+        recorded = _recorded_latencies.get()
+        if recorded is not None and recorded[api]:
+            return recorded[api].popleft()
+        return medians.get(api, 0)
+
+    fake_gcp = FakeGCPSandboxService(latency_for=latency_for)
+
+    # Projects the trace touches without creating them existed before capture started
+    created = set()
+    preexisting = set()
+    for record in records:
+        preexisting |= referenced_project_ids(record) - created
+        if record.get("pid"):
+            created.add(record["pid"])
+    default_folder = next(iter(config.AUTHORIZED_TEAM_FOLDERS.values()))
+
+    project_id_map = {}
+    pending_creates = {record["pid"]: asyncio.Event() for record in records if record.get("pid")}
+    results = []
+
+    async def send_record(record, scheduled_at):
+        await asyncio.sleep(max(0.0, scheduled_at - time.monotonic()))
+        # Wait for the replayed create of any project this request refers to
+        for project_id in referenced_project_ids(record):
+            if project_id in pending_creates and project_id not in preexisting:
+                await pending_creates[project_id].wait()
+
+        path = record["r"]
+        for param_name, param_value in map_project_ids(record.get("p", {}), project_id_map).items():
+            path = path.replace(f"{{{param_name}}}", str(param_value))
+        query_string = urlencode(map_project_ids(record.get("q", {}), project_id_map))
+        body = json.dumps(map_project_ids(record["b"], project_id_map)).encode() if "b" in record else b""
+
+        recorded = defaultdict(deque)
+        for api, latency_ms in record.get("g", []):
+            recorded[api].append(latency_ms)
+        _recorded_latencies.set(recorded)
+
+        start = time.monotonic()
+        status, response_body = await asgi_request(
+            app, record["m"], path, query_string, body,
+            max_seconds=max_response_seconds, max_body_bytes=max_response_bytes
+        )
+        latency_ms = (time.monotonic() - start) * 1000
+
+        if record.get("pid"):
+            try:
+                project_id_map[record["pid"]] = json.loads(response_body)["project_id"]
+            except (ValueError, KeyError, TypeError):
+                pass
+            pending_creates[record["pid"]].set()
+        results.append({
+            "route": f"{record['m']} {record['r']}",
+            "status": status,
+            "recorded_status": record.get("s"),
+            "latency_ms": latency_ms
+        })
+
+    with fake_gcp.installed():
+        async with app.router.lifespan_context(app):
+            for project_id in preexisting:
+                fake_gcp.seed_project(project_id, default_folder)
+                get_expiry_scheduler().schedule(project_id, datetime.now(UTC) + timedelta(days=1))
+
+            started = time.monotonic()
+            await asyncio.gather(*(
+                send_record(record, started + record["t"] / 1000 / speed) for record in records
+            ))
+            duration_seconds = time.monotonic() - started
+
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result["route"]].append(result["latency_ms"])
+    return {
+        "trace": os.path.abspath(trace_path),
+        "captured_at": header.get("started_at"),
+        "speed": speed,
+        "duration_seconds": round(duration_seconds, 3),
+        "errors": sum(1 for result in results if result["status"] >= 500),
+        "status_mismatches": sum(1 for result in results if result["status"] != result["recorded_status"]),
+        "overall": summarize([result["latency_ms"] for result in results], duration_seconds),
+        "routes": {route: summarize(latencies, duration_seconds) for route, latencies in sorted(by_route.items())}
+    }
+
+
+def compare(baseline, candidate, max_regression_percent=None):
+    """Prints the change of every metric from baseline to candidate and returns the regressions."""
+    regressions = []
+    print(f"{'scope':<45} {'metric':<15} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    scopes = [("overall", baseline["overall"], candidate["overall"])]
+    scopes += [(route, baseline["routes"][route], candidate["routes"][route])
+               for route in baseline["routes"] if route in candidate["routes"]]
+    for scope, before, after in scopes:
+        for metric in ("throughput_rps", "p50_ms", "p90_ms", "p99_ms"):
+            if not before.get(metric) or after.get(metric) is None:
+                continue
+            change = (after[metric] - before[metric]) / before[metric] * 100
+            # Throughput regresses when it drops, latency when it grows
+            regression = -change if metric == "throughput_rps" else change
+            flag = ""
+            if max_regression_percent is not None and regression > max_regression_percent:
+                regressions.append((scope, metric, change))
+                flag = "  REGRESSION"
+            print(f"{scope:<45} {metric:<15} {before[metric]:>12.2f} {after[metric]:>12.2f} {change:>8.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare replays.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = subcommands.add_parser("replay", help="Replay a trace against this build")
+    replay_parser.add_argument("trace", help="Trace file recorded with TRAFFIC_CAPTURE_ENABLED")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="Arrival rate multiplier, e.g. 2 for 2x")
+    replay_parser.add_argument("--output", help="Write the results as JSON to this file")
+    replay_parser.add_argument("--max-response-seconds", type=float, default=30,
+                               help="Disconnect from a response still streaming after this many seconds")
+    replay_parser.add_argument("--max-response-bytes", type=int, default=1024 * 1024,
+                               help="Disconnect from a response once its body reaches this size")
+
+    compare_parser = subcommands.add_parser("compare", help="Compare two replay results")
+    compare_parser.add_argument("baseline", help="Results of the baseline build")
+    compare_parser.add_argument("candidate", help="Results of the candidate build")
+    compare_parser.add_argument("--max-regression", type=float, help="Fail if any metric regresses by more than this percentage")
+
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        if args.speed <= 0:
+            parser.error("--speed must be positive")
+        if args.max_response_seconds <= 0 or args.max_response_bytes <= 0:
+            parser.error("--max-response-seconds and --max-response-bytes must be positive")
+        results = asyncio.run(replay(args.trace, args.speed, args.max_response_seconds, args.max_response_bytes))
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as output_file:
+                output_file.write(output + "\n")
+        print(output)
+    else:
+        with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+            regressions = compare(json.load(baseline_file), json.load(candidate_file), args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.max_regression}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()